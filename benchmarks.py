@@ -0,0 +1,535 @@
+# =================================================================
+# أدوات قياس الأداء والتحقق للمطورين
+# =================================================================
+# الاستخدام:
+#   python benchmarks.py            (تشغيل جميع القياسات)
+#   python benchmarks.py query-plans
+# تعمل جميع القياسات على قاعدة بيانات مؤقتة ولا تلمس بيانات المستخدم.
+# =================================================================
+
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter
+from datetime import date, timedelta
+
+import pandas as pd
+
+from main import App, AttachmentStore, BatchReceiptWriter, ChartPanel, DatabaseManager, ExcelReportWriter, ForecastEngine, PdfReceiptRenderer, ReportsFrame, WordReceiptGenerator, backup_sheet_to_rows, donor_key
+from main import TAFQEET_HUNDREDS, TAFQEET_SCALES, TAFQEET_TENS, TAFQEET_UNITS, tafqeet, tafqeet_amount, tafqeet_integer, tafqeet_many
+from main import format_arabic_many, format_arabic_stats
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def temp_database(**kwargs):
+    path = os.path.join(tempfile.mkdtemp(prefix="masjid_pro_bench_"), "bench.db")
+    return DatabaseManager(path, **kwargs)
+
+
+def random_transactions(count, with_payer=True, seed=0):
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    categories = ["تبرعات أفراد", "تبرعات مؤسسات", "تبرعات عينية", "منح", "أخرى"]
+    payers = ["محمد بن أحمد", "فاطمة الزهراء", "عبد الله", "مؤسسة الخير", "أسامة"]
+    rows = []
+    for _ in range(count):
+        row = {
+            'amount': round(rng.uniform(100, 50000), 2),
+            'date': (start + timedelta(days=rng.randrange(365 * 10))).isoformat(),
+            'category': rng.choice(categories),
+            'description': "تبرع",
+            'notes': '',
+            'attachment_path': None,
+        }
+        if with_payer:
+            row['payer'] = rng.choice(payers)
+        rows.append(row)
+    return rows
+
+
+@benchmark("query-plans")
+def check_query_plans():
+    """Fails if any hot query falls back to a full table scan or a temporary sort."""
+    db = temp_database()
+    offenders = db.check_query_plans()
+    for name, plan in offenders.items():
+        print(f"  FULL SCAN  {name}: {plan}")
+    print(f"  {len(db.HOT_QUERIES) - len(offenders)}/{len(db.HOT_QUERIES)} hot queries use an index")
+    return not offenders
+
+
+@benchmark("commits")
+def benchmark_commits(ops=300):
+    """UI-style actions (add + audit entry): default journal vs WAL profile with one commit per action."""
+    rows = random_transactions(ops)
+
+    def run(db, batched):
+        started = time.perf_counter()
+        for row in rows:
+            if batched:
+                with db.transaction():
+                    db.add_transaction('incomes', row)
+                    db.log_action("bench", "إضافة مدخول")
+            else:
+                db.add_transaction('incomes', row)
+                db.log_action("bench", "إضافة مدخول")
+        return ops / (time.perf_counter() - started)
+
+    before = run(temp_database(), batched=False)
+    after = run(temp_database(performance_profile=True), batched=True)
+    print(f"  default journal, 2 commits/action: {before:,.0f} ops/s")
+    print(f"  WAL profile, 1 commit/action:      {after:,.0f} ops/s  (x{after / before:.1f})")
+
+
+@benchmark("restore")
+def benchmark_restore(count=100_000):
+    """Bulk restore of a backup sheet: vectorized clean-up plus one executemany transaction."""
+    incomes = random_transactions(count // 2)
+    expenses = random_transactions(count // 2, with_payer=False, seed=1)
+    df_incomes = pd.DataFrame({"التاريخ": [r['date'] for r in incomes], "الدافع/المصدر": [r['payer'] for r in incomes], "الوصف": [r['description'] for r in incomes], "الفئة": [r['category'] for r in incomes], "المبلغ": [f"{r['amount']:,.2f} د.ج" for r in incomes]})
+    df_expenses = pd.DataFrame({"التاريخ": [r['date'] for r in expenses], "الوصف": [r['description'] for r in expenses], "الفئة": [r['category'] for r in expenses], "المبلغ": [r['amount'] for r in expenses]})
+    db = temp_database(performance_profile=True)
+
+    started = time.perf_counter()
+    income_rows = backup_sheet_to_rows(df_incomes, 'incomes')
+    expense_rows = backup_sheet_to_rows(df_expenses, 'expenses')
+    prepared = time.perf_counter()
+    db.restore_transactions(income_rows, expense_rows)
+    finished = time.perf_counter()
+    print(f"  {count:,} rows: clean-up {prepared - started:.2f}s, insert {finished - prepared:.2f}s")
+
+    # Blank amount, date or category cells are reported by sheet row before anything is written
+    df_incomes.loc[[1, 7], "المبلغ"], df_incomes.loc[9, "التاريخ"], df_incomes.loc[12, "الفئة"] = None, None, " "
+    try:
+        backup_sheet_to_rows(df_incomes, 'incomes')
+        rejected = ""
+    except ValueError as e:
+        rejected = str(e)
+    print(f"  incomplete rows: {rejected}")
+    return abs(db.get_total('incomes') - sum(r['amount'] for r in incomes)) < 0.01 * count and rejected.endswith("5، 11، 13، 16")
+
+
+def export_frames(count):
+    incomes = random_transactions(count // 2)
+    expenses = random_transactions(count - count // 2, with_payer=False, seed=1)
+    df_incomes = pd.DataFrame({"التاريخ": [r['date'] for r in incomes], "الدافع/المصدر": [r['payer'] for r in incomes], "الوصف": [r['description'] for r in incomes], "الفئة": [r['category'] for r in incomes], "المبلغ": [r['amount'] for r in incomes]})
+    df_expenses = pd.DataFrame({"التاريخ": [r['date'] for r in expenses], "الوصف": [r['description'] for r in expenses], "الفئة": [r['category'] for r in expenses], "المبلغ": [r['amount'] for r in expenses]})
+    return df_incomes, df_expenses
+
+
+@benchmark("excel-export")
+def benchmark_excel_export(sizes=(10_000, 100_000, 500_000)):
+    """Streaming Excel report at several sizes; the smallest file is read back through the restore path."""
+    out_dir = tempfile.mkdtemp(prefix="masjid_pro_bench_")
+    for count in sizes:
+        df_incomes, df_expenses = export_frames(count)
+        filepath = os.path.join(out_dir, f"report_{count}.xlsx")
+        started = time.perf_counter()
+        ExcelReportWriter("لكامل الفترة").save(filepath, df_incomes["المبلغ"].sum(), df_expenses["المبلغ"].sum(), [
+            ('المداخيل', 'قائمة المداخيل', df_incomes),
+            ('المصاريف', 'قائمة المصاريف', df_expenses),
+        ])
+        elapsed = time.perf_counter() - started
+        print(f"  {count:>7,} rows: {elapsed:6.2f}s ({count / elapsed:,.0f} rows/s, {os.path.getsize(filepath) / 1e6:.1f} MB)")
+
+    filepath = os.path.join(out_dir, f"report_{sizes[0]}.xlsx")
+    restored = backup_sheet_to_rows(pd.read_excel(filepath, sheet_name='المداخيل', skiprows=2), 'incomes')
+    return len(restored) == sizes[0] // 2
+
+
+@benchmark("monthly-summary")
+def benchmark_monthly_summary(count=200_000):
+    """Monthly/annual trend data: resample() over every row vs the trigger-maintained monthly_summary table."""
+    db = temp_database(performance_profile=True)
+    columns = DatabaseManager.TRANSACTION_COLUMNS
+    db.restore_transactions([tuple(row[c] for c in columns['incomes']) for row in random_transactions(count // 2)],
+                            [tuple(row[c] for c in columns['expenses']) for row in random_transactions(count // 2, with_payer=False, seed=1)])
+
+    started = time.perf_counter()
+    frames = {name: db.get_transactions_frame(name).assign(date=lambda df: pd.to_datetime(df['date'])).set_index('date') for name in ('incomes', 'expenses')}
+    for rule in ('ME', 'YE'):
+        pd.DataFrame({name: df.resample(rule)['amount'].sum() for name, df in frames.items()}).fillna(0)
+    full_scan = time.perf_counter() - started
+    started = time.perf_counter()
+    ReportsFrame.build_trend_summaries(db)
+    summary = time.perf_counter() - started
+    print(f"  {count:,} rows: resample {full_scan * 1000:.0f} ms, monthly_summary {summary * 1000:.1f} ms (x{full_scan / summary:.0f})")
+
+    with db.transaction():
+        for row in random_transactions(200, seed=2):
+            db.add_transaction('incomes', row)
+        db.cursor.execute("UPDATE incomes SET amount = amount * 2, category = 'أخرى' WHERE id % 97 = 0")
+        db.cursor.execute("DELETE FROM expenses WHERE id % 89 = 0")
+    mismatches = db.check_monthly_summary()
+    for key, expected, stored in mismatches[:10]:
+        print(f"  MISMATCH {key}: expected {expected}, stored {stored}")
+    return not mismatches
+
+
+@benchmark("balance")
+def benchmark_balance(count=200_000):
+    """Running balance: concat + cumsum over every row vs the daily_balance snapshot, and the cost of keeping it current."""
+    db = temp_database(performance_profile=True)
+    columns = DatabaseManager.TRANSACTION_COLUMNS
+    db.restore_transactions([tuple(row[c] for c in columns['incomes']) for row in random_transactions(count // 2)],
+                            [tuple(row[c] for c in columns['expenses']) for row in random_transactions(count // 2, with_payer=False, seed=1)])
+
+    started = time.perf_counter()
+    df_incomes, df_expenses = db.get_transactions_frame('incomes'), db.get_transactions_frame('expenses')
+    all_trans = pd.concat([df_incomes.assign(signed=df_incomes['amount']), df_expenses.assign(signed=-df_expenses['amount'])]).sort_values('date')
+    expected = all_trans.groupby('date')['signed'].sum().cumsum()
+    full_scan = time.perf_counter() - started
+    started = time.perf_counter()
+    db.get_daily_balance()
+    snapshot = time.perf_counter() - started
+    started = time.perf_counter()
+    for day in expected.index[::len(expected) // 100]:
+        db.balance_as_of(day)
+    lookup = (time.perf_counter() - started) / 100
+    print(f"  {count:,} rows: cumsum {full_scan * 1000:.0f} ms, daily_balance {snapshot * 1000:.1f} ms, balance_as_of {lookup * 1e6:.0f} us")
+
+    row = random_transactions(1, seed=3)[0]
+    for label, day in (("recent", "2024-12-30"), ("back-dated", "2015-01-02")):
+        started = time.perf_counter()
+        db.add_transaction('incomes', {**row, 'date': day})
+        print(f"  {label} insert incl. balance refresh: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    df_incomes = db.get_transactions_frame('incomes')
+    all_trans = pd.concat([df_incomes.assign(signed=df_incomes['amount']), df_expenses.assign(signed=-df_expenses['amount'])])
+    expected = all_trans.groupby('date')['signed'].sum().sort_index().cumsum()
+    series = db.get_daily_balance()
+    return len(series) == len(expected) and all(abs(r['balance'] - value) < 0.01 for r, value in zip(series, expected))
+
+
+@benchmark("forecast-backtest")
+def benchmark_forecast_backtest(count=20_000):
+    """Rolling-origin backtest of every forecast model: mean absolute error, 80% interval coverage and time per fit."""
+    db = temp_database(performance_profile=True)
+    columns = DatabaseManager.TRANSACTION_COLUMNS
+    db.restore_transactions([tuple(row[c] for c in columns['incomes']) for row in random_transactions(count // 2)],
+                            [tuple(row[c] for c in columns['expenses']) for row in random_transactions(count // 2, with_payer=False, seed=1)])
+    engine = ForecastEngine()
+    results = engine.backtest(db.get_daily_balance(), horizons=(30, 90), history_lengths=(90, 365, 1095))
+    print(f"  {'model':<20} {'history':>7} {'horizon':>7} {'origins':>7} {'MAE':>12} {'coverage':>8} {'ms/fit':>7}")
+    for r in results:
+        print(f"  {r['model']:<20} {r['history']:>7} {r['horizon']:>7} {r['origins']:>7} {r['mae']:>12,.0f} {r['coverage']:>8.0%} {r['ms_per_fit']:>7.2f}")
+    # The chart labels the band 80%; every model must stay near that on the backtest
+    miscalibrated = [r for r in results if not 0.70 <= r['coverage'] <= 0.90]
+    for r in miscalibrated:
+        print(f"  {r['model']} (history {r['history']}, horizon {r['horizon']}): 80% interval covers {r['coverage']:.0%}")
+    return bool(results) and all(r['mae'] == r['mae'] for r in results) and not miscalibrated  # NaN check
+
+
+@benchmark("donors")
+def benchmark_donors(count=100_000, donors=3000):
+    """Top-donor queries over the donors table and idx_incomes_donor_date; spelling variants must merge into one donor."""
+    rng = random.Random(4)
+    names = [f"{rng.choice(['أحمد', 'فاطمة', 'إبراهيم', 'عائشة', 'مؤسسة'])} {n}" for n in range(donors)]
+    variants = [name.replace('أ', 'ا').replace('إ', 'ا').replace('ة', 'ه') for name in names]
+    rows = [(row['amount'], row['date'], row['category'], row['description'], row['notes'], rng.choice((names, variants))[rng.randrange(donors)], None) for row in random_transactions(count)]
+    db = temp_database(performance_profile=True)
+    db.restore_transactions(rows, [])
+
+    timings = {}
+    for label, call in (
+        ("top 25 lifetime", lambda: db.get_top_donors(25)),
+        ("top 25 in 2020", lambda: db.get_top_donors(25, "2020-01-01", "2020-12-31")),
+        ("name search", lambda: db.get_top_donors(25, name="فاطمه 12")),
+        ("one donor in 2020", lambda: db.get_donor_summary(1, "2020-01-01", "2020-12-31")),
+    ):
+        started = time.perf_counter()
+        call()
+        timings[label] = (time.perf_counter() - started) * 1000
+        print(f"  {label:<20} {timings[label]:7.2f} ms")
+
+    expected = pd.DataFrame({'key': [donor_key(r[5]) for r in rows], 'amount': [r[0] for r in rows]}).groupby('key')['amount'].sum().nlargest(25)
+    top = db.get_top_donors(25)
+    return all(donor_key(row['name']) == key and abs(row['total'] - total) < 0.01 for row, (key, total) in zip(top, expected.items()))
+
+
+@benchmark("batch-receipts")
+def benchmark_batch_receipts(count=300, baseline=30):
+    """Receipts/s: one WordReceiptGenerator per receipt vs the cloned template, inline, in worker processes and merged."""
+    import docx
+    db = temp_database()
+    with db.transaction():
+        for row in random_transactions(count, seed=5):
+            db.add_transaction('incomes', row)
+    rows = db.get_receipt_rows(start_date="2015-01-01", end_date="2024-12-31")
+    settings = db.get_all_settings()
+    out_dir = tempfile.mkdtemp(prefix="masjid_pro_bench_")
+
+    started = time.perf_counter()
+    for row in rows[:baseline]:
+        generator = WordReceiptGenerator(row, settings)
+        generator.create_document()
+        generator.document.save(os.path.join(out_dir, "single.docx"))
+    print(f"  {'per-receipt document':<24} {baseline / (time.perf_counter() - started):7.1f} receipts/s")
+
+    results = {}
+    for label, writer, call in (
+        ("template, inline", BatchReceiptWriter(settings, workers=1), lambda w: w.write_folder(rows, os.path.join(out_dir, "inline"))),
+        ("template, processes", BatchReceiptWriter(settings), lambda w: w.write_folder(rows, os.path.join(out_dir, "pool"))),
+        ("merged document", BatchReceiptWriter(settings), lambda w: w.write_merged(rows, os.path.join(out_dir, "merged.docx"))),
+    ):
+        started = time.perf_counter()
+        results[label] = call(writer)
+        print(f"  {label:<24} {len(rows) / (time.perf_counter() - started):7.1f} receipts/s ({writer.workers} workers)")
+
+    merged = [p.text for p in docx.Document(results["merged document"]).paragraphs]
+    single = [p.text for p in docx.Document(results["template, inline"][0]).paragraphs]
+    return (len(results["template, processes"]) == len(rows) and not any("\u27e6" in text for text in merged)
+            and single == [p.text for p in docx.Document(results["template, processes"][0]).paragraphs]
+            and sum(text.startswith("استلمنا من") for text in merged) == 2 * len(rows))
+
+
+@benchmark("pdf-receipts")
+def benchmark_pdf_receipts(count=50):
+    """Direct PDF receipts: page build once, then per-receipt save and a merged multi-page file."""
+    import re
+    settings = {"association_name": "جمعية المسجد", "address": "حي النصر", "phone": "0555 00 00 00"}
+    fields = [WordReceiptGenerator.receipt_fields({**row, 'id': i + 1}) for i, row in enumerate(random_transactions(count, seed=6))]
+    out_dir = tempfile.mkdtemp(prefix="masjid_pro_bench_")
+
+    started = time.perf_counter()
+    renderer = PdfReceiptRenderer(settings)
+    print(f"  {'page build':<20} {(time.perf_counter() - started) * 1000:8.1f} ms")
+    renderer.save(fields[0], os.path.join(out_dir, "warmup.pdf"))
+    started = time.perf_counter()
+    for i, receipt in enumerate(fields[:10]):
+        renderer.save(receipt, os.path.join(out_dir, f"receipt_{i}.pdf"))
+    print(f"  {'one receipt':<20} {(time.perf_counter() - started) * 100:8.1f} ms")
+
+    filepath = os.path.join(out_dir, "merged.pdf")
+    started = time.perf_counter()
+    renderer.save_many(fields, filepath)
+    print(f"  {'merged':<20} {count / (time.perf_counter() - started):8.1f} receipts/s")
+    with open(filepath, "rb") as f:
+        content = f.read()
+    return content.startswith(b"%PDF") and len(re.findall(rb"/Type /Page\b", content)) == count
+
+
+WORD_VALUES = {word: n for n, word in enumerate(TAFQEET_UNITS) if word and " " not in word}
+WORD_VALUES.update({"أحد": 1, "اثنا": 2, "عشر": 10, "صفر": 0})
+WORD_VALUES.update({word: n * 10 for n, word in enumerate(TAFQEET_TENS) if word})
+WORD_VALUES.update({word: n * 100 for n, word in enumerate(TAFQEET_HUNDREDS) if word})
+SCALE_WORDS = {word: (scale, 2 if i in (1, 4) else None) for scale, forms in TAFQEET_SCALES for i, word in enumerate(forms)}
+
+
+def words_to_number(text):
+    """Reads tafqeet() output back into an int, using only the word tables: an independent check of the assembly."""
+    values, scales = WORD_VALUES, SCALE_WORDS
+    total = current = 0
+    for word in text.split():
+        if word not in values and word not in scales and word.startswith("و"):
+            word = word[1:]
+        if word in scales:
+            scale, count = scales[word]
+            total += (count or current or 1) * scale
+            current = 0
+        else:
+            current += values[word]
+    return total + current
+
+
+@benchmark("tafqeet")
+def benchmark_tafqeet(exhaustive=1_000_000):
+    """Every number below exhaustive (plus samples up to 10^15) read back to itself; cold vs cached conversion speed."""
+    rng = random.Random(7)
+    samples = list(range(exhaustive)) + [rng.randrange(10 ** k) for k in range(7, 16) for _ in range(20_000)]
+    samples += [scale * k for scale, _ in TAFQEET_SCALES for k in (1, 2, 3, 10, 11, 13, 100, 101, 999)]
+    started = time.perf_counter()
+    wrong = [n for n in samples if words_to_number(tafqeet(n)) != n]
+    print(f"  {len(samples):,} numbers read back in {time.perf_counter() - started:.1f}s, {len(wrong)} wrong {wrong[:5]}")
+
+    expected = {
+        0: "صفر دينار جزائري", 1: "دينار جزائري واحد", 2: "ديناران جزائريان", 5: "خمسة دنانير جزائرية",
+        15: "خمسة عشر دينارًا جزائريًا", 103: "مئة وثلاثة دنانير جزائرية", 2000: "ألفا دينار جزائري",
+        13000: "ثلاثة عشر ألف دينار جزائري", 1500.5: "ألف وخمسمئة دينار جزائري وخمسون سنتيمًا",
+        0.01: "سنتيم واحد", 2.02: "ديناران جزائريان وسنتيمان", 3.03: "ثلاثة دنانير جزائرية وثلاثة سنتيمات",
+        1_000_000_000: "مليار دينار جزائري", 0.29: "تسعة وعشرون سنتيمًا",
+    }
+    mismatches = {amount: tafqeet_amount(amount) for amount, words in expected.items() if tafqeet_amount(amount) != words}
+    for amount, words in mismatches.items():
+        print(f"  tafqeet_amount({amount}) = {words!r}, expected {expected[amount]!r}")
+
+    amounts = [round(rng.uniform(100, 50_000), 2) for _ in range(2000)]  # fewer distinct values than the cache holds
+    tafqeet_amount.cache_clear(); tafqeet_integer.cache_clear()
+    for label in ("cold", "cached"):
+        started = time.perf_counter()
+        for amount in amounts:
+            tafqeet_amount(amount)
+        print(f"  tafqeet_amount {label:<7} {len(amounts) / (time.perf_counter() - started):12,.0f} /s")
+    column = pd.Series([rng.choice((500, 1000, 2000, 5000, 10_000)) for _ in range(500_000)])
+    started = time.perf_counter()
+    words = tafqeet_many(column)
+    print(f"  tafqeet_many, 500,000-row column of donation amounts: {(time.perf_counter() - started) * 1000:.0f} ms")
+    return not wrong and not mismatches and words.iloc[0] == tafqeet_amount(column.iloc[0])
+
+
+CHART_LABELS = [
+    'الأداء المالي الشهري', 'الأداء المالي السنوي', 'المقارنة الشهرية بين المداخيل والمصاريف', 'تطور الرصيد المالي',
+    'الشهر', 'السنة', 'التاريخ', 'المبلغ (د.ج)', 'الرصيد (د.ج)', 'المداخيل', 'المصاريف', 'الرصيد الفعلي', 'الرصيد المتوقع',
+    'جانفي', 'فيفري', 'مارس', 'أفريل', 'ماي', 'جوان', 'جويلية', 'أوت', 'سبتمبر', 'أكتوبر', 'نوفمبر', 'ديسمبر',
+]
+
+
+@benchmark("arabic-shaping")
+def benchmark_arabic_shaping(renders=500):
+    """Shaping a chart's labels on every render vs the format_arabic cache; ChartPanel.render_stats when a display is available."""
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+    started = time.perf_counter()
+    for _ in range(renders):
+        uncached = [get_display(arabic_reshaper.reshape(text)) for text in CHART_LABELS]
+    uncached_ms = (time.perf_counter() - started) * 1000
+    before = format_arabic_stats()
+    started = time.perf_counter()
+    for _ in range(renders):
+        cached = format_arabic_many(CHART_LABELS)
+    cached_ms = (time.perf_counter() - started) * 1000
+    stats = format_arabic_stats(since=before)
+    print(f"  {len(CHART_LABELS)} labels x {renders} renders: reshape+bidi {uncached_ms:.0f} ms, cached {cached_ms:.1f} ms "
+          f"({stats['hits']} hits, {stats['misses']} misses, ~{stats['saved_ms']:.0f} ms saved)")
+
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError as e:
+        print(f"  chart render skipped, no display: {e}")
+        return cached == uncached
+    try:
+        panel = ChartPanel(root)
+        summary = pd.DataFrame({'المداخيل': range(12), 'المصاريف': range(12)}, index=CHART_LABELS[-12:])
+        for version in range(3):
+            panel.update(version, ("white", "black"), lambda p: ReportsFrame.draw_summary_chart(p, summary, 'الأداء المالي الشهري', 'الشهر', ['#009688', '#E53935']))
+            stats = panel.render_stats
+            print(f"  render {version}: {stats['build_ms']:.1f} ms, shaping {stats['hits']} hits / {stats['misses']} misses, ~{stats['saved_ms']:.2f} ms saved")
+    finally:
+        root.destroy()
+    return cached == uncached
+
+
+@benchmark("attachments")
+def benchmark_attachments(views=5):
+    """Content-addressed attachments: dedup of a re-attached photo, derivatives vs decoding the original, and the migration backfill."""
+    from PIL import Image
+    out_dir = tempfile.mkdtemp(prefix="masjid_pro_bench_")
+    photo = os.path.join(out_dir, "photo.jpg")
+    Image.radial_gradient("L").resize((4000, 3000)).convert("RGB").save(photo, quality=92)
+    store = AttachmentStore(os.path.join(out_dir, "attachments"))
+    started = time.perf_counter()
+    first = store.add(photo)
+    print(f"  {'attach (4000x3000)':<24} {(time.perf_counter() - started) * 1000:8.1f} ms")
+    second = store.add(photo)
+    stored = [name for _, _, files in os.walk(store.root_dir) for name in files if not name.endswith((".png", "_view.jpg"))]
+
+    timings = {}
+    for label, open_image in (("thumbnail, original", lambda: Image.open(photo)), ("thumbnail, stored", lambda: Image.open(store.derivative(first['attachment_path'], "thumb", first['attachment_hash'])))):
+        started = time.perf_counter()
+        for _ in range(views):
+            image = open_image()
+            image.thumbnail(AttachmentStore.THUMBNAIL_SIZE)
+        timings[label] = (time.perf_counter() - started) * 1000 / views
+    for label, path in (("viewer, original", photo), ("viewer, stored", store.derivative(first['attachment_path'], "view", first['attachment_hash']))):
+        started = time.perf_counter()
+        for _ in range(views):
+            image = Image.open(path)
+            image.thumbnail(AttachmentStore.VIEWER_SIZE)
+            image.load()  # thumbnail() skips the decode when the image already fits
+        timings[label] = (time.perf_counter() - started) * 1000 / views
+    for label, ms in timings.items():
+        print(f"  {label:<24} {ms:8.1f} ms")
+
+    backfill = AttachmentStore.describe(photo)
+    print(f"  stored copies after attaching twice: {len(stored)}")
+    return first == second and len(stored) == 1 and backfill == {key: first[key] for key in DatabaseManager.ATTACHMENT_COLUMNS}
+
+
+DEFERRED_MODULES = ("pandas", "numpy", "matplotlib", "openpyxl", "docx")
+
+
+@benchmark("import-time")
+def benchmark_import_time():
+    """`python -X importtime -c "import main"`; fails if a deferred heavy library is imported at startup."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        return False
+    imports, children, total = {}, {}, 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, field = line[len("import time:"):].split("|")
+        depth, name = (len(field) - len(field.lstrip()) - 1) // 2, field.strip()
+        if depth == 0:  # children are printed before their parent
+            if name == "main":
+                imports, total = children, int(cumulative_us)
+            children = {}
+        elif depth == 1:
+            children[name] = int(cumulative_us)
+    for name, cumulative_us in sorted(imports.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {name:<28} {cumulative_us / 1000:8.1f} ms")
+    print(f"  import main: {total / 1000:.1f} ms")
+    loaded = [line.split("|")[2].strip() for line in result.stderr.splitlines() if "|" in line]
+    eager = sorted({name.split(".")[0] for name in loaded} & set(DEFERRED_MODULES))
+    if eager:
+        print(f"  imported at startup but should be deferred: {', '.join(eager)}")
+    return not eager
+
+
+@benchmark("startup")
+def benchmark_startup():
+    """Login-to-first-paint and the construction cost of every page; needs a display."""
+    try:
+        app = App(data_dir=tempfile.mkdtemp(prefix="masjid_pro_bench_"))
+    except tkinter.TclError as e:
+        print(f"  skipped, no display: {e}")
+        return
+    try:
+        app.current_user, app.current_role = "bench", "مدير"
+        started = time.perf_counter()
+        app.setup_main_ui()
+        app.update_idletasks()
+        first_paint = time.perf_counter() - started
+        for name in app.frame_classes:
+            app.get_frame(name)
+        app.update_idletasks()
+        for name, seconds in sorted(app.frame_build_times.items(), key=lambda item: -item[1]):
+            print(f"  {name:<24} {seconds * 1000:8.1f} ms")
+        print(f"  login to first paint: {first_paint * 1000:.1f} ms (all pages eagerly: {sum(app.frame_build_times.values()) * 1000:.1f} ms)")
+    finally:
+        app.tasks.shutdown()
+        app.destroy()
+
+
+def main(argv):
+    names = argv or list(BENCHMARKS)
+    failed = []
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Available: {', '.join(BENCHMARKS)}")
+            return 2
+        print(f"[{name}]")
+        started = time.perf_counter()
+        if BENCHMARKS[name]() is False:
+            failed.append(name)
+        print(f"  done in {time.perf_counter() - started:.2f}s")
+    if failed:
+        print(f"FAILED: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
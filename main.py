@@ -20,33 +20,82 @@
 import customtkinter as ctk
 import sqlite3
 from tkinter import ttk, messagebox, filedialog
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+import calendar
+import copy
+import dataclasses
+import functools
 import hashlib
+import importlib
+import importlib.util
+import io
+import json
+import multiprocessing
 import os
+import re
 import sys
 import traceback
 import shutil
 import subprocess
-from openpyxl.styles import PatternFill, Font as OpenpyxlFont, Border, Side, Alignment
-from openpyxl.utils import get_column_letter
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
 from PIL import Image, ImageDraw, ImageTk, ImageFont
-import matplotlib
-matplotlib.use("TkAgg")
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.font_manager as fm
 import arabic_reshaper
 from bidi.algorithm import get_display
+
+
+# =================================================================
+# الاستيراد المؤجل للمكتبات الثقيلة
+# =================================================================
+class LazyModule:
+    """
+    يحل محل مكتبة ثقيلة ولا يستوردها إلا عند أول وصول إلى إحدى خصائصها،
+    حتى لا يدفع البرنامج كلفة استيراد pandas و matplotlib عند الإقلاع.
+    """
+    def __init__(self, name, on_import=None):
+        self._name, self._on_import, self._module = name, on_import, None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            if self._on_import:
+                self._on_import()
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+_matplotlib_configured = False
+
+def configure_matplotlib(font_cache_dir=None):
+    """Runs once, before the first chart: selects the Tk backend and registers the bundled fonts, caching them in font_cache_dir."""
+    global _matplotlib_configured
+    if _matplotlib_configured:
+        return
+    _matplotlib_configured = True
+    import matplotlib
+    import matplotlib.style
+    matplotlib.use("TkAgg")
+    matplotlib.style.use('seaborn-v0_8-darkgrid')  # once, instead of before every chart
+    FontManager.register_matplotlib_fonts(font_cache_dir)
+    matplotlib.rcParams['font.family'] = FontManager.CHART_FONT_FAMILY
+    matplotlib.rcParams['axes.unicode_minus'] = False
+
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+fm = LazyModule("matplotlib.font_manager")
+backend_tkagg = LazyModule("matplotlib.backends.backend_tkagg", on_import=configure_matplotlib)
+mpl_figure = LazyModule("matplotlib.figure", on_import=configure_matplotlib)
+
+def set_font_cache_dir(cache_dir):
+    """Makes the first chart configure matplotlib with this font cache folder; until then nothing is imported."""
+    for module in (backend_tkagg, mpl_figure):
+        module._on_import = functools.partial(configure_matplotlib, cache_dir)
+# openpyxl and python-docx are imported inside ExcelReportWriter and WordReceiptGenerator
+
 # --- إضافة المكتبات المطلوبة لملفات الوورد ---
-try:
-    import docx
-    from docx.shared import Pt, Cm
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
-    from docx.oxml.ns import qn
-    from docx.oxml import OxmlElement
-except ImportError:
+if importlib.util.find_spec("docx") is None:
     messagebox.showerror(
         "مكتبة ناقصة",
         "مكتبة 'python-docx' غير مثبتة.\n"
@@ -147,8 +196,8 @@ class FontManager:
         return prop
 
     @staticmethod
-    def check_and_register_fonts():
-        """Checks for all required font files and registers them."""
+    def check_fonts():
+        """Checks that the required font files exist; returns an error message or None."""
         missing_fonts = []
         required_font_keys = [
             "Cairo-Regular", "Cairo-Bold",
@@ -164,152 +213,552 @@ class FontManager:
             return (f"ملفات الخطوط التالية مفقودة من مجلد 'fonts':\n\n"
                     f"{', '.join(missing_fonts)}\n\n"
                     "الرجاء التأكد من تحميل ووضع جميع ملفات خطوط 'Cairo' و 'Amiri' المطلوبة في مجلد 'fonts'.")
+        return None
+
+    @staticmethod
+    def register_matplotlib_fonts(cache_dir=None):
+        """
+        Adds the bundled fonts to matplotlib's font list. Parsing each TTF is the costly part, so the
+        parsed entries are kept in cache_dir/font_cache.json, keyed on the file's path, size and mtime.
+        Without a cache_dir the fonts are parsed every time and nothing is written.
+        """
+        cache_file = os.path.join(cache_dir, "font_cache.json") if cache_dir else None
+        try:
+            with open(cache_file, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, TypeError, ValueError):
+            cache = {}
 
-        for font_key, filename in FontManager.FONT_FILES.items():
+        entries = {}
+        for font_key in FontManager.FONT_FILES:
             font_family, weight = font_key.split('-')
             path = FontManager.get_font_path(font_family, weight)
-            if os.path.exists(path):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            cache_key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+            entry = cache.get(cache_key)
+            if entry is None:
                 try:
-                    fm.fontManager.addfont(path)
+                    entry = dataclasses.asdict(fm.ttfFontProperty(fm.get_font(path)))
                 except Exception as e:
                     print(f"فشل تسجيل الخط {path} مع matplotlib: {e}")
+                    continue
+            entries[cache_key] = entry
+            fm.fontManager.ttflist.append(fm.FontEntry(**entry))
+        if hasattr(fm.fontManager, "_findfont_cached"):
+            fm.fontManager._findfont_cached.cache_clear()
 
-        try:
-             fm._load_fontmanager(try_read_cache=False)
-        except Exception as e:
-            print(f"فشل إعادة بناء ذاكرة خطوط matplotlib: {e}")
+        if cache_file and entries != cache:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(cache_file, "w", encoding="utf-8") as f:
+                    json.dump(entries, f, ensure_ascii=False)
+            except OSError as e:
+                print(f"تعذر حفظ ذاكرة الخطوط: {e}")
 
-        plt.rcParams['font.family'] = FontManager.CHART_FONT_FAMILY
-        plt.rcParams['axes.unicode_minus'] = False
-        return None
+# =================================================================
+# تحويل أوراق النسخة الاحتياطية إلى صفوف قاعدة البيانات
+# =================================================================
+def clean_amount_column(series):
+    """Vectorized parse of amounts exported as text such as '1,234.50 د.ج'; blank or unreadable cells become NaN."""
+    if not pd.api.types.is_numeric_dtype(series):
+        series = series.astype(str).str.replace('د.ج', '', regex=False).str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(series, errors='coerce').astype(float)
+
+BACKUP_SHEETS = {'incomes': 'المداخيل', 'expenses': 'المصاريف'}
+
+def backup_sheet_to_rows(df, table_name, first_row=4):
+    """
+    Returns tuples in DatabaseManager.TRANSACTION_COLUMNS order for a sheet read from a backup file.
+    Raises ValueError naming the sheet rows (first_row is the Excel row of the first record) that have no
+    amount, date or category, since those columns are NOT NULL; nothing is written in that case.
+    """
+    amounts = clean_amount_column(df['المبلغ'])
+    dates = pd.to_datetime(df['التاريخ'], errors='coerce', format='ISO8601').dt.strftime('%Y-%m-%d')
+    df = df.astype(object).where(df.notna(), None)
+    categories = df['الفئة'].where(df['الفئة'].astype(str).str.strip() != '')  # blank text counts as missing
+    incomplete = amounts.isna() | dates.isna() | categories.isna()
+    if incomplete.any():
+        rows = (np.flatnonzero(incomplete.to_numpy()) + first_row).tolist()
+        listed = "، ".join(map(str, rows[:20])) + (f" و{len(rows) - 20} صفًا آخر" if len(rows) > 20 else "")
+        raise ValueError(f"صفوف بلا مبلغ أو تاريخ أو فئة في ورقة '{BACKUP_SHEETS[table_name]}' (أرقام الصفوف في الملف): {listed}")
+    count = len(df)
+    columns = [amounts.tolist(), dates.tolist(), categories.tolist(), df['الوصف'].tolist(), [''] * count]
+    if table_name == 'incomes':
+        columns.append(df['الدافع/المصدر'].tolist())
+    columns.append([None] * count)
+    return list(zip(*columns))
+
+# =================================================================
+# تطبيع النص العربي للبحث (توحيد الألف والهمزات والتاء المربوطة وحذف التشكيل)
+# =================================================================
+ARABIC_NORMALIZATION = {
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ة": "ه", "ى": "ي", "ؤ": "و", "ئ": "ي",
+    "ـ": "",  # tatweel
+    **{chr(code): "" for code in range(0x064B, 0x0653)},  # tashkeel
+}
+_ARABIC_NORMALIZATION_TABLE = str.maketrans(ARABIC_NORMALIZATION)
+
+def normalize_arabic(text):
+    if text is None:
+        return ""
+    return " ".join(str(text).translate(_ARABIC_NORMALIZATION_TABLE).split())
+
+def donor_key(name):
+    """Key under which spelling variants of one donor's name are merged; None for an empty name."""
+    return normalize_arabic(name).casefold() or None
+
+def normalize_arabic_sql(expression):
+    """The same normalization as normalize_arabic() written as nested SQL replace() calls, for triggers."""
+    sql = f"COALESCE({expression}, '')"
+    for source, target in ARABIC_NORMALIZATION.items():
+        sql = f"replace({sql}, '{source}', '{target}')"
+    return sql
 
 # =================================================================
 # دالة تنسيق النص العربي (للرسوم البيانية)
 # =================================================================
+ARABIC_SHAPING_TIME = [0.0]  # seconds spent actually shaping, i.e. on cache misses
+
+
+@functools.lru_cache(maxsize=4096)
+def shape_arabic(text):
+    started = time.perf_counter()
+    shaped = get_display(arabic_reshaper.reshape(text))
+    ARABIC_SHAPING_TIME[0] += time.perf_counter() - started
+    return shaped
+
+
 def format_arabic(text):
-    return get_display(arabic_reshaper.reshape(str(text)))
+    # Chart titles, axis labels and legends repeat on every redraw: shape each distinct string once
+    return shape_arabic(str(text))
+
+
+def format_arabic_many(texts):
+    return [shape_arabic(str(text)) for text in texts]
+
+
+def format_arabic_stats(since=None):
+    """
+    Shaping cache counters; with since (an earlier result) only the calls in between.
+    saved_ms estimates the shaping time avoided by cache hits from the average cost of a miss.
+    """
+    info = shape_arabic.cache_info()
+    stats = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "shaping_ms": ARABIC_SHAPING_TIME[0] * 1000}
+    if since:
+        stats = {key: stats[key] - since[key] if key != "size" else stats[key] for key in stats}
+    per_miss = ARABIC_SHAPING_TIME[0] * 1000 / info.misses if info.misses else 0.0
+    stats["saved_ms"] = stats["hits"] * per_miss
+    return stats
 
 # =================================================================
 # دالة التفقيط (تحويل الأرقام إلى نصوص عربية)
 # =================================================================
+TAFQEET_UNITS = ("", "واحد", "اثنان", "ثلاثة", "أربعة", "خمسة", "ستة", "سبعة", "ثمانية", "تسعة",
+                 "عشرة", "أحد عشر", "اثنا عشر", "ثلاثة عشر", "أربعة عشر", "خمسة عشر",
+                 "ستة عشر", "سبعة عشر", "ثمانية عشر", "تسعة عشر")
+TAFQEET_TENS = ("", "", "عشرون", "ثلاثون", "أربعون", "خمسون", "ستون", "سبعون", "ثمانون", "تسعون")
+TAFQEET_HUNDREDS = ("", "مئة", "مئتان", "ثلاثمئة", "أربعمئة", "خمسمئة", "ستمئة", "سبعمئة", "ثمانمئة", "تسعمئة")
+# Counted-noun forms: (singular, dual, plural for 3-10, accusative singular for 11-99, dual before another noun)
+TAFQEET_SCALES = (
+    (10 ** 12, ("تريليون", "تريليونان", "تريليونات", "تريليونًا", "تريليونا")),
+    (10 ** 9, ("مليار", "ملياران", "مليارات", "مليارًا", "مليارا")),
+    (10 ** 6, ("مليون", "مليونان", "ملايين", "مليونًا", "مليونا")),
+    (10 ** 3, ("ألف", "ألفان", "آلاف", "ألفًا", "ألفا")),
+)
+DINAR_FORMS = ("دينار جزائري", "ديناران جزائريان", "دنانير جزائرية", "دينارًا جزائريًا")
+CENTIME_FORMS = ("سنتيم", "سنتيمان", "سنتيمات", "سنتيمًا")
+
+
+@functools.lru_cache(maxsize=1000)
+def tafqeet_below_thousand(n):
+    if n < 20:
+        return TAFQEET_UNITS[n]
+    if n < 100:
+        ten, unit = divmod(n, 10)
+        return f"{TAFQEET_UNITS[unit]} و{TAFQEET_TENS[ten]}" if unit else TAFQEET_TENS[ten]
+    hundred, rest = divmod(n, 100)
+    return f"{TAFQEET_HUNDREDS[hundred]} و{tafqeet_below_thousand(rest)}" if rest else TAFQEET_HUNDREDS[hundred]
+
+
+def tafqeet_counted(count, forms, construct=False):
+    """
+    count followed by the noun in the form Arabic grammar requires (1 and 2 are the noun alone).
+    construct: another noun follows (ألف دينار, مليونا دينار), so the noun loses its tanween and dual nun.
+    """
+    if count == 1:
+        return forms[0]
+    if count == 2:
+        return forms[4] if construct else forms[1]
+    rest = count % 100
+    form = forms[2] if 3 <= rest <= 10 else forms[0] if rest < 11 or construct else forms[3]
+    return f"{tafqeet_integer(count, construct=True)} {form}"
+
+
+@functools.lru_cache(maxsize=4096)
+def tafqeet_integer(number, construct=False):
+    if number == 0:
+        return "صفر"
+    if number < 0:
+        return f"سالب {tafqeet_integer(-number, construct)}"
+    parts = []
+    for scale, forms in TAFQEET_SCALES:
+        if number >= scale:
+            count, number = divmod(number, scale)
+            parts.append(tafqeet_counted(count, forms, construct and number == 0))
+    if number:
+        parts.append(tafqeet_below_thousand(number))
+    return " و".join(parts)
+
+
 def tafqeet(number):
+    """The integer part of number in Arabic words."""
     if number is None:
         return "غير محدد"
     try:
         number = int(number)
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, OverflowError):
         return "قيمة غير صالحة"
-    if number == 0:
-        return "صفر"
+    if abs(number) >= 10 ** 15:
+        return "قيمة غير صالحة"
+    return tafqeet_integer(number)
 
-    to_19 = ["", "واحد", "اثنان", "ثلاثة", "أربعة", "خمسة", "ستة", "سبعة", "ثمانية", "تسعة",
-             "عشرة", "أحد عشر", "اثنا عشر", "ثلاثة عشر", "أربعة عشر", "خمسة عشر",
-             "ستة عشر", "سبعة عشر", "ثمانية عشر", "تسعة عشر"]
-
-    tens = ["", "", "عشرون", "ثلاثون", "أربعون", "خمسون", "ستون", "سبعون", "ثمانون", "تسعون"]
-    hundreds = ["", "مئة", "مئتان", "ثلاثمئة", "أربعمئة", "خمسمئة", "ستمئة", "سبعمئة", "ثمانمئة", "تسعمئة"]
-    thousands = ["ألف", "ألفان", "آلاف"]
-    millions = ["مليون", "مليونان", "ملايين"]
-
-    def convert_less_than_thousand(n):
-        if n == 0:
-            return ""
-        if n < 20:
-            return to_19[n]
-        elif n < 100:
-            ten, unit = divmod(n, 10)
-            if unit == 0:
-                return tens[ten]
-            return f"{to_19[unit]} و{tens[ten]}"
-        else:
-            hundred, rest = divmod(n, 100)
-            base = hundreds[hundred]
-            if rest == 0:
-                return base
-            return f"{base} و{convert_less_than_thousand(rest)}"
-
-    result_parts = []
-
-    if number >= 1_000_000:
-        millions_part = number // 1_000_000
-        number %= 1_000_000
-        if millions_part == 1:
-            result_parts.append(millions[0])
-        elif millions_part == 2:
-            result_parts.append(millions[1])
-        elif 3 <= millions_part <= 10:
-            result_parts.append(f"{convert_less_than_thousand(millions_part)} {millions[2]}")
-        else:
-            result_parts.append(f"{convert_less_than_thousand(millions_part)} {millions[0]}")
-
-    if number >= 1000:
-        thousands_part = number // 1000
-        number %= 1000
-        if thousands_part == 1:
-            result_parts.append(thousands[0])
-        elif thousands_part == 2:
-            result_parts.append(thousands[1])
-        elif 3 <= thousands_part <= 10:
-            result_parts.append(f"{convert_less_than_thousand(thousands_part)} {thousands[2]}")
-        else:
-            result_parts.append(f"{convert_less_than_thousand(thousands_part)} {thousands[0]}")
 
-    if number > 0:
-        result_parts.append(convert_less_than_thousand(number))
+def tafqeet_money(count, forms):
+    if count == 1:
+        return f"{forms[0]} واحد"
+    return tafqeet_counted(count, forms)
+
 
-    return " و".join(result_parts)
+@functools.lru_cache(maxsize=4096)
+def tafqeet_amount(amount):
+    """An amount of dinars in words, with its centimes and the currency in the right grammatical form."""
+    if amount is None or amount != amount:  # None or NaN
+        return "غير محدد"
+    try:
+        centimes = round(abs(float(amount)) * 100)
+    except (ValueError, TypeError, OverflowError):
+        return "قيمة غير صالحة"
+    dinars, centimes = divmod(centimes, 100)
+    if dinars >= 10 ** 15:
+        return "قيمة غير صالحة"
+    if dinars == 0 and centimes:
+        words = tafqeet_money(centimes, CENTIME_FORMS)
+    else:
+        words = f"{tafqeet_integer(dinars)} {DINAR_FORMS[0]}" if dinars == 0 else tafqeet_money(dinars, DINAR_FORMS)
+        if centimes:
+            words += f" و{tafqeet_money(centimes, CENTIME_FORMS)}"
+    return f"سالب {words}" if float(amount) < 0 else words
+
+
+def tafqeet_many(amounts):
+    """tafqeet_amount over a whole column, converting each distinct value once; a pandas Series keeps its index."""
+    words = {}
+    def convert(amount):
+        if amount not in words:
+            words[amount] = tafqeet_amount(amount)
+        return words[amount]
+    if hasattr(amounts, "map"):
+        return amounts.map(convert)
+    return [convert(amount) for amount in amounts]
 
 
 # =================================================================
-# مدير الأيقونات (IconManager)
+# الأيقونات (IconSet)
 # =================================================================
-class IconManager:
-    @staticmethod
-    def create_icon(draw_function, size=(24, 24)):
-        light_image = Image.new("RGBA", size, (0, 0, 0, 0))
-        draw_light = ImageDraw.Draw(light_image)
-        draw_function(draw_light, "#1C1C1C")
+# كل أيقونة قائمة من أوامر رسم ImageDraw: (الأمر, الإحداثيات, الخيارات).
+# القيمة ICON_COLOR تُستبدل بلون الوضع الفاتح أو الداكن، و font_size يعني خط Pillow الافتراضي بهذا الحجم.
+ICON_COLOR = "<color>"
+ICON_SPECS = {
+    "dashboard": [("rectangle", (3, 3, 10, 10), {"fill": ICON_COLOR}), ("rectangle", (14, 3, 21, 10), {"fill": ICON_COLOR}), ("rectangle", (3, 14, 10, 21), {"fill": ICON_COLOR}), ("rectangle", (14, 14, 21, 21), {"fill": ICON_COLOR})],
+    "income": [("line", (12, 4, 12, 20), {"fill": ICON_COLOR, "width": 2}), ("line", (8, 16, 12, 20), {"fill": ICON_COLOR, "width": 2}), ("line", (16, 16, 12, 20), {"fill": ICON_COLOR, "width": 2}), ("text", (7, 2), {"text": "+", "fill": ICON_COLOR, "font_size": 20})],
+    "expense": [("line", (12, 4, 12, 20), {"fill": ICON_COLOR, "width": 2}), ("line", (8, 8, 12, 4), {"fill": ICON_COLOR, "width": 2}), ("line", (16, 8, 12, 4), {"fill": ICON_COLOR, "width": 2}), ("text", (8, 12), {"text": "-", "fill": ICON_COLOR, "font_size": 20})],
+    "reports": [("rectangle", (4, 4, 20, 20), {"outline": ICON_COLOR, "width": 2}), ("line", (8, 9, 16, 9), {"fill": ICON_COLOR, "width": 1}), ("line", (8, 13, 16, 13), {"fill": ICON_COLOR, "width": 1}), ("line", (8, 17, 12, 17), {"fill": ICON_COLOR, "width": 1})],
+    "data": [("ellipse", (4, 4, 20, 12), {"outline": ICON_COLOR, "width": 2}), ("line", (4, 8, 20, 8), {"fill": ICON_COLOR, "width": 2}), ("line", (10, 12, 10, 20), {"fill": ICON_COLOR, "width": 2}), ("line", (14, 12, 14, 20), {"fill": ICON_COLOR, "width": 2})],
+    "users": [("ellipse", (8, 4, 16, 12), {"outline": ICON_COLOR, "width": 2}), ("arc", (4, 12, 20, 24), {"start": 20, "end": 160, "fill": ICON_COLOR, "width": 2})],
+    "audit": [("polygon", [(6, 4), (18, 4), (18, 20), (14, 20), (14, 8), (6, 8), (6, 20), (10, 20), (10, 14), (6, 14)], {"outline": ICON_COLOR, "width": 2})],
+    "logout": [("rectangle", (4, 4, 14, 20), {"outline": ICON_COLOR, "width": 2}), ("line", (14, 12, 20, 12), {"fill": ICON_COLOR, "width": 2}), ("line", (17, 9, 20, 12), {"fill": ICON_COLOR, "width": 2}), ("line", (17, 15, 20, 12), {"fill": ICON_COLOR, "width": 2})],
+    "add": [("line", (12, 5, 12, 19), {"fill": ICON_COLOR, "width": 2}), ("line", (5, 12, 19, 12), {"fill": ICON_COLOR, "width": 2})],
+    "edit": [("polygon", [(5, 19), (5, 15), (16, 4), (20, 8), (9, 19), (5, 19)], {"outline": ICON_COLOR, "width": 2})],
+    "delete": [("rectangle", (6, 6, 18, 20), {"outline": ICON_COLOR, "width": 2}), ("line", (4, 4, 20, 4), {"fill": ICON_COLOR, "width": 2}), ("line", (10, 10, 10, 16), {"fill": ICON_COLOR, "width": 2}), ("line", (14, 10, 14, 16), {"fill": ICON_COLOR, "width": 2})],
+    "export": [("rectangle", (4, 8, 20, 20), {"outline": ICON_COLOR, "width": 2}), ("line", (12, 2, 12, 14), {"fill": ICON_COLOR, "width": 2}), ("line", (8, 10, 12, 14), {"fill": ICON_COLOR, "width": 2}), ("line", (16, 10, 12, 14), {"fill": ICON_COLOR, "width": 2})],
+    "import": [("rectangle", (4, 14, 20, 20), {"outline": ICON_COLOR, "width": 2}), ("line", (12, 2, 12, 16), {"fill": ICON_COLOR, "width": 2}), ("line", (8, 8, 12, 2), {"fill": ICON_COLOR, "width": 2}), ("line", (16, 8, 12, 2), {"fill": ICON_COLOR, "width": 2})],
+    "search": [("ellipse", (4, 4, 16, 16), {"outline": ICON_COLOR, "width": 2}), ("line", (14, 14, 20, 20), {"fill": ICON_COLOR, "width": 2})],
+    "about": [("ellipse", (4, 4, 20, 20), {"outline": ICON_COLOR, "width": 2}), ("text", (11, 4), {"text": "i", "fill": ICON_COLOR, "font_size": 18})],
+    "attachment": [("polygon", [(6, 2), (18, 2), (18, 22), (6, 22)], {"outline": ICON_COLOR, "width": 2}), ("ellipse", (7, 4, 11, 8), {"fill": ICON_COLOR})],
+    "category": [("rectangle", (3, 8, 21, 16), {"outline": ICON_COLOR, "width": 2}), ("line", (7, 8, 7, 4), {"fill": ICON_COLOR, "width": 2}), ("line", (12, 8, 12, 4), {"fill": ICON_COLOR, "width": 2}), ("line", (17, 8, 17, 4), {"fill": ICON_COLOR, "width": 2})],
+    "print": [("rectangle", (4, 16, 20, 20), {"outline": ICON_COLOR, "width": 2}), ("rectangle", (7, 8, 17, 16), {"outline": ICON_COLOR, "width": 2}), ("line", (4, 12, 7, 12), {"fill": ICON_COLOR, "width": 2}), ("rectangle", (7, 4, 17, 8), {"fill": ICON_COLOR})],
+    "activity": [("rectangle", (4, 6, 20, 20), {"outline": ICON_COLOR, "width": 2}), ("line", (8, 4, 8, 8), {"fill": ICON_COLOR, "width": 2}), ("line", (16, 4, 16, 8), {"fill": ICON_COLOR, "width": 2}), ("line", (4, 10, 20, 10), {"fill": ICON_COLOR, "width": 2})],
+}
+
+class IconSet:
+    """
+    يرسم جميع الأيقونات مرة واحدة في صورة أطلس (PNG) مع فهرس JSON داخل مجلد الذاكرة المؤقتة،
+    ثم يقص كل أيقونة منها عند أول طلب لها. يُعاد رسم الأطلس فقط عند تغير تعريفات الرسم.
+    الصف الأول من الأطلس للوضع الفاتح والثاني للوضع الداكن.
+    """
+    SIZE = (24, 24)
+    COLORS = ("#1C1C1C", "#DCE4EE")  # light, dark
 
-        dark_image = Image.new("RGBA", size, (0, 0, 0, 0))
-        draw_dark = ImageDraw.Draw(dark_image)
-        draw_function(draw_dark, "#DCE4EE")
+    def __init__(self, cache_dir, specs=ICON_SPECS):
+        self.specs = specs
+        self.atlas_path = os.path.join(cache_dir, "icon_atlas.png")
+        self.index_path = os.path.join(cache_dir, "icon_atlas.json")
+        self._atlas, self._index, self._icons = None, None, {}
 
-        return ctk.CTkImage(light_image=light_image, dark_image=dark_image, size=size)
+    def specs_hash(self):
+        payload = json.dumps([self.specs, self.SIZE, self.COLORS, Image.__version__], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
 
     @staticmethod
-    def load_all_icons():
-        icons = {}
-        icons["dashboard"] = IconManager.create_icon(lambda d, c: (d.rectangle((3, 3, 10, 10), fill=c), d.rectangle((14, 3, 21, 10), fill=c), d.rectangle((3, 14, 10, 21), fill=c), d.rectangle((14, 14, 21, 21), fill=c)))
-        icons["income"] = IconManager.create_icon(lambda d, c: (d.line((12, 4, 12, 20), fill=c, width=2), d.line((8, 16, 12, 20), fill=c, width=2), d.line((16, 16, 12, 20), fill=c, width=2), d.text((7, 2), "+", fill=c, font=ImageFont.load_default().font_variant(size=20))))
-        icons["expense"] = IconManager.create_icon(lambda d, c: (d.line((12, 4, 12, 20), fill=c, width=2), d.line((8, 8, 12, 4), fill=c, width=2), d.line((16, 8, 12, 4), fill=c, width=2), d.text((8, 12), "-", fill=c, font=ImageFont.load_default().font_variant(size=20))))
-        icons["reports"] = IconManager.create_icon(lambda d, c: (d.rectangle((4, 4, 20, 20), outline=c, width=2), d.line((8, 9, 16, 9), fill=c, width=1), d.line((8, 13, 16, 13), fill=c, width=1), d.line((8, 17, 12, 17), fill=c, width=1)))
-        icons["data"] = IconManager.create_icon(lambda d, c: (d.ellipse((4, 4, 20, 12), outline=c, width=2), d.line((4, 8, 20, 8), fill=c, width=2), d.line((10, 12, 10, 20), fill=c, width=2), d.line((14, 12, 14, 20), fill=c, width=2)))
-        icons["users"] = IconManager.create_icon(lambda d, c: (d.ellipse((8, 4, 16, 12), outline=c, width=2), d.arc((4, 12, 20, 24), 20, 160, fill=c, width=2)))
-        icons["audit"] = IconManager.create_icon(lambda d, c: (d.polygon([(6, 4), (18, 4), (18, 20), (14, 20), (14, 8), (6, 8), (6, 20), (10,20), (10,14), (6,14)], outline=c, width=2)))
-        icons["logout"] = IconManager.create_icon(lambda d, c: (d.rectangle((4, 4, 14, 20), outline=c, width=2), d.line((14, 12, 20, 12), fill=c, width=2), d.line((17, 9, 20, 12), fill=c, width=2), d.line((17, 15, 20, 12), fill=c, width=2)))
-        icons["add"] = IconManager.create_icon(lambda d, c: (d.line((12, 5, 12, 19), fill=c, width=2), d.line((5, 12, 19, 12), fill=c, width=2)))
-        icons["edit"] = IconManager.create_icon(lambda d, c: d.polygon([(5, 19), (5, 15), (16, 4), (20, 8), (9, 19), (5, 19)], outline=c, width=2))
-        icons["delete"] = IconManager.create_icon(lambda d, c: (d.rectangle((6, 6, 18, 20), outline=c, width=2), d.line((4, 4, 20, 4), fill=c, width=2), d.line((10, 10, 10, 16), fill=c, width=2), d.line((14, 10, 14, 16), fill=c, width=2)))
-        icons["export"] = IconManager.create_icon(lambda d, c: (d.rectangle((4,8,20,20),outline=c, width=2), d.line((12,2,12,14),fill=c, width=2), d.line((8,10,12,14),fill=c, width=2), d.line((16,10,12,14),fill=c, width=2)))
-        icons["import"] = IconManager.create_icon(lambda d, c: (d.rectangle((4,14,20,20),outline=c, width=2), d.line((12,2,12,16),fill=c, width=2), d.line((8,8,12,2),fill=c, width=2), d.line((16,8,12,2),fill=c, width=2)))
-        icons["search"] = IconManager.create_icon(lambda d, c: (d.ellipse((4, 4, 16, 16), outline=c, width=2), d.line((14, 14, 20, 20), fill=c, width=2)))
-        icons["about"] = IconManager.create_icon(lambda d, c: (d.ellipse((4,4,20,20), outline=c, width=2), d.text((11, 4), "i", fill=c, font=ImageFont.load_default().font_variant(size=18))))
-        icons["attachment"] = IconManager.create_icon(lambda d, c: (d.polygon([(6,2), (18,2), (18,22), (6,22)], outline=c, width=2), d.ellipse((7,4,11,8), fill=c)))
-        icons["category"] = IconManager.create_icon(lambda d, c: (d.rectangle((3, 8, 21, 16), outline=c, width=2), d.line((7,8,7,4),fill=c,width=2), d.line((12,8,12,4),fill=c,width=2), d.line((17,8,17,4),fill=c,width=2)))
-        icons["print"] = IconManager.create_icon(lambda d, c: (d.rectangle((4, 16, 20, 20), outline=c, width=2), d.rectangle((7, 8, 17, 16), outline=c, width=2), d.line((4,12,7,12), fill=c, width=2), d.rectangle((7,4,17,8),fill=c)))
-        icons["activity"] = IconManager.create_icon(lambda d, c: (d.rectangle((4, 6, 20, 20), outline=c, width=2), d.line((8, 4, 8, 8), fill=c, width=2), d.line((16, 4, 16, 8), fill=c, width=2), d.line((4, 10, 20, 10), fill=c, width=2)))
-        return icons
+    def draw_icon(draw, ops, color):
+        for method, xy, options in ops:
+            options = {key: color if value == ICON_COLOR else value for key, value in options.items()}
+            if "font_size" in options:
+                options["font"] = ImageFont.load_default().font_variant(size=options.pop("font_size"))
+            if method == "text":
+                draw.text(xy, options.pop("text"), **options)
+            else:
+                getattr(draw, method)(xy, **options)
+
+    def render_atlas(self):
+        width, height = self.SIZE
+        names = list(self.specs)
+        atlas = Image.new("RGBA", (width * len(names), height * len(self.COLORS)), (0, 0, 0, 0))
+        for col, name in enumerate(names):
+            for row, color in enumerate(self.COLORS):
+                icon = Image.new("RGBA", self.SIZE, (0, 0, 0, 0))
+                self.draw_icon(ImageDraw.Draw(icon), self.specs[name], color)
+                atlas.paste(icon, (col * width, row * height))
+        return atlas, {"hash": self.specs_hash(), "size": list(self.SIZE), "icons": {name: col for col, name in enumerate(names)}}
+
+    def load_atlas(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("hash") == self.specs_hash():
+                atlas = Image.open(self.atlas_path)
+                atlas.load()
+                return atlas, index
+        except (OSError, ValueError):
+            pass
+
+        atlas, index = self.render_atlas()
+        try:
+            os.makedirs(os.path.dirname(self.atlas_path), exist_ok=True)
+            atlas.save(self.atlas_path + ".tmp", format="PNG")
+            os.replace(self.atlas_path + ".tmp", self.atlas_path)
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+        except OSError as e:
+            print(f"تعذر حفظ أطلس الأيقونات: {e}")
+        return atlas, index
+
+    def get(self, name, default=None):
+        if name in self._icons:
+            return self._icons[name]
+        if name not in self.specs:
+            return default
+        if self._atlas is None:
+            try:
+                self._atlas, self._index = self.load_atlas()
+            except Exception:
+                traceback.print_exc()
+                self.specs = {}  # fall back to text-only buttons
+                return default
+        width, height = self.SIZE
+        left = self._index["icons"][name] * width
+        light_image = self._atlas.crop((left, 0, left + width, height))
+        dark_image = self._atlas.crop((left, height, left + width, 2 * height))
+        self._icons[name] = ctk.CTkImage(light_image=light_image, dark_image=dark_image, size=self.SIZE)
+        return self._icons[name]
+
+# =================================================================
+# منشئ استعلامات العمليات (TransactionQuery)
+# =================================================================
+@dataclasses.dataclass(frozen=True)
+class TransactionQuery:
+    """
+    استعلام قابل للتركيب على جدول المداخيل أو المصاريف: فترة زمنية، فئات، دافع، حدود المبلغ، بحث نصي وترقيم.
+    كل دالة تعيد نسخة جديدة، و build() يبني نص SQL ومعاملاته بترتيب القوائم (الأحدث أولاً).
+    """
+    table_name: str
+    start_date: str = None
+    end_date: str = None
+    categories: tuple = ()
+    excluded_categories: tuple = ()
+    payer: str = None
+    min_amount: float = None
+    max_amount: float = None
+    search: str = None
+    ids: tuple = ()
+    after: tuple = None  # (date, id) of the last row already loaded, for keyset paging
+    limit: int = None
+    offset: int = 0
+
+    def between(self, start_date=None, end_date=None):
+        return dataclasses.replace(self, start_date=start_date, end_date=end_date)
+
+    def in_categories(self, *categories):
+        return dataclasses.replace(self, categories=tuple(categories))
+
+    def not_in_categories(self, *categories):
+        return dataclasses.replace(self, excluded_categories=tuple(categories))
+
+    def paid_by(self, payer):
+        if self.table_name != "incomes":
+            raise ValueError("Only incomes have a payer")
+        return dataclasses.replace(self, payer=payer)
+
+    def amount_between(self, min_amount=None, max_amount=None):
+        return dataclasses.replace(self, min_amount=min_amount, max_amount=max_amount)
+
+    def matching(self, search):
+        return dataclasses.replace(self, search=search)
+
+    def with_ids(self, *ids):
+        return dataclasses.replace(self, ids=tuple(ids))
+
+    def page(self, limit, after=None, offset=0):
+        return dataclasses.replace(self, limit=limit, after=tuple(after) if after else None, offset=offset)
+
+    def where(self):
+        conditions, params = [], []
+        if self.start_date:
+            conditions.append("date >= ?"); params.append(str(self.start_date))
+        if self.end_date:
+            conditions.append("date <= ?"); params.append(str(self.end_date))
+        if self.categories:
+            conditions.append(f"category IN ({', '.join('?' * len(self.categories))})"); params.extend(self.categories)
+        if self.excluded_categories:
+            conditions.append(f"category NOT IN ({', '.join('?' * len(self.excluded_categories))})"); params.extend(self.excluded_categories)
+        if self.payer:
+            conditions.append("payer = ?"); params.append(self.payer)
+        if self.min_amount is not None:
+            conditions.append("amount >= ?"); params.append(self.min_amount)
+        if self.max_amount is not None:
+            conditions.append("amount <= ?"); params.append(self.max_amount)
+        if self.search and normalize_arabic(self.search):
+            condition, search_params = DatabaseManager.search_condition(self.table_name, normalize_arabic(self.search))
+            conditions.append(condition); params.extend(search_params)
+        if self.ids:
+            conditions.append(f"id IN ({', '.join('?' * len(self.ids))})"); params.extend(self.ids)
+        if self.after:
+            conditions.append("(date, id) < (?, ?)"); params.extend(self.after)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def build(self, columns="*"):
+        where, params = self.where()
+        query = f"SELECT {columns} FROM {self.table_name}{where} ORDER BY date DESC, id DESC"
+        if self.limit is not None:
+            query += " LIMIT ? OFFSET ?"; params.extend([self.limit, self.offset])
+        return query, params
+
+    def build_total(self):
+        where, params = self.where()
+        return f"SELECT COALESCE(SUM(amount), 0) FROM {self.table_name}{where}", params
+
+def month_span(start_date, end_date):
+    """((year, month), (year, month)) when [start_date, end_date] covers whole calendar months, otherwise None."""
+    try:
+        start, end = datetime.strptime(str(start_date), "%Y-%m-%d"), datetime.strptime(str(end_date), "%Y-%m-%d")
+    except ValueError:
+        return None
+    if start.day != 1 or end.day != calendar.monthrange(end.year, end.month)[1]:
+        return None
+    return (start.year, start.month), (end.year, end.month)
 
 # =================================================================
 # الفئة الخاصة بإدارة قاعدة البيانات (DatabaseManager)
 # =================================================================
 class DatabaseManager:
-    def __init__(self, db_name="masjid_pro_database_v6.db"):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(self, db_name="masjid_pro_database_v6.db", performance_profile=False, read_only=False):
+        if read_only:
+            # Worker threads only read; SQLite rejects writes and the schema is left to the main connection
+            self.conn = sqlite3.connect(f"{Path(os.path.abspath(db_name)).as_uri()}?mode=ro", uri=True)
+        else:
+            self.conn = sqlite3.connect(db_name)
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
+        self._transaction_depth = 0
+        self.table_versions = {}
+        self._changed_tables = set()
+        self._subscribers = []
+        if read_only:
+            return
+        if performance_profile:
+            self.apply_performance_profile()
         self.setup_tables()
 
+    def apply_performance_profile(self):
+        """WAL journal with relaxed syncing: one fsync per checkpoint instead of two per commit."""
+        self.cursor.execute("PRAGMA journal_mode=WAL")
+        self.cursor.execute("PRAGMA synchronous=NORMAL")
+        self.cursor.execute("PRAGMA cache_size=-16000")  # ~16 MB page cache
+        self.cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        self.cursor.execute("PRAGMA temp_store=MEMORY")
+
+    @contextmanager
+    def transaction(self):
+        """Groups several mutating calls into a single commit; nested blocks join the outer one."""
+        if self._transaction_depth == 0 and not self.conn.in_transaction:
+            self.cursor.execute("BEGIN")  # explicit, so schema changes inside the block roll back too
+        self._transaction_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.conn.rollback()
+                self._changed_tables.clear()
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._refresh_derived()
+                self.conn.commit()
+                self._publish_changes()
+
+    def _commit(self, *tables):
+        """Commits unless inside transaction(); the tables are reported as changed once the data is committed."""
+        self._changed_tables.update(tables)
+        if self._transaction_depth == 0:
+            self._refresh_derived()
+            self.conn.commit()
+            self._publish_changes()
+
+    def _refresh_derived(self):
+        # Part of the same commit, so readers never see transactions without their running balance
+        if self._changed_tables.intersection(self.BALANCE_TABLES):
+            self.refresh_daily_balance()
+
+    # --- Change tracking: a per-table version counter, bumped on every committed write ---
+    def versions(self, *tables):
+        return tuple(self.table_versions.get(table, 0) for table in tables)
+
+    def subscribe(self, tables, callback):
+        """callback(changed_tables) runs after each commit that touched any of tables."""
+        self._subscribers.append((frozenset(tables), callback))
+
+    def unsubscribe(self, callback):
+        self._subscribers = [(tables, cb) for tables, cb in self._subscribers if cb != callback]
+
+    def _publish_changes(self):
+        if not self._changed_tables:
+            return
+        changed, self._changed_tables = frozenset(self._changed_tables), set()
+        for table in changed:
+            self.table_versions[table] = self.table_versions.get(table, 0) + 1
+        for tables, callback in list(self._subscribers):
+            if tables & changed:
+                try:
+                    callback(changed)
+                except Exception:
+                    traceback.print_exc()
+
     def hash_password(self, password):
         return hashlib.sha256(password.encode()).hexdigest()
 
@@ -355,12 +804,407 @@ class DatabaseManager:
         """)
         
         self.setup_settings_table()
+        self.run_migrations()
 
         self.cursor.execute("SELECT COUNT(*) FROM users")
         if self.cursor.fetchone()[0] == 0:
             self.add_user("admin", "admin", "مدير", must_change_password=1)
         self.init_default_categories()
-        self.conn.commit()
+        self._commit()
+
+    # --- Schema migrations ---
+    # MIGRATIONS[n] upgrades the schema from version n to n+1; PRAGMA user_version stores the
+    # last applied version, so existing database files are upgraded in place on startup.
+    # Each step is a list of SQL statements or callables taking the DatabaseManager.
+    MIGRATIONS = [
+        [
+            "CREATE INDEX IF NOT EXISTS idx_incomes_date_id ON incomes(date, id)",
+            "CREATE INDEX IF NOT EXISTS idx_expenses_date_id ON expenses(date, id)",
+            "CREATE INDEX IF NOT EXISTS idx_incomes_category_date ON incomes(category, date)",
+            "CREATE INDEX IF NOT EXISTS idx_expenses_category_date ON expenses(category, date)",
+            "CREATE INDEX IF NOT EXISTS idx_audit_log_timestamp ON audit_log(timestamp)",
+            # activity_attendance(activity_id) is already covered by the UNIQUE(activity_id, member_id) index
+        ],
+        [
+            "ALTER TABLE incomes ADD COLUMN has_attachment INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE expenses ADD COLUMN has_attachment INTEGER NOT NULL DEFAULT 0",
+            lambda db: db._backfill_has_attachment(),
+        ],
+        [
+            lambda db: db._create_search_index(),
+        ],
+        [
+            lambda db: db._create_monthly_summary(),
+        ],
+        [
+            lambda db: db._create_balance_snapshot(),
+        ],
+        [
+            # Bumped by update_transaction() so views can tell which loaded rows changed
+            "ALTER TABLE incomes ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1",
+            "ALTER TABLE expenses ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1",
+        ],
+        [
+            lambda db: db._create_donors(),
+        ],
+        [
+            lambda db: db._add_attachment_metadata(),
+        ],
+    ]
+
+    # Text columns indexed by the <table>_fts full-text tables
+    FTS_COLUMNS = {
+        "incomes": ("description", "payer", "category", "notes"),
+        "expenses": ("description", "category", "notes"),
+    }
+
+    def _create_search_index(self):
+        """FTS5 tables over normalized text, kept in sync with incomes/expenses by triggers."""
+        for table_name, columns in self.FTS_COLUMNS.items():
+            self.cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table_name}_fts USING fts5({', '.join(columns)}, tokenize='unicode61')")
+        self._create_search_triggers()
+        self.rebuild_search_index()
+
+    def _create_search_triggers(self):
+        for table_name, columns in self.FTS_COLUMNS.items():
+            fts = f"{table_name}_fts"
+            column_list = ", ".join(columns)
+            new_values = ", ".join(normalize_arabic_sql(f"new.{col}") for col in columns)
+            self.cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table_name}_fts_insert AFTER INSERT ON {table_name} BEGIN
+                    INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+                END""")
+            self.cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table_name}_fts_delete AFTER DELETE ON {table_name} BEGIN
+                    DELETE FROM {fts} WHERE rowid = old.id;
+                END""")
+            self.cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table_name}_fts_update AFTER UPDATE ON {table_name} BEGIN
+                    DELETE FROM {fts} WHERE rowid = old.id;
+                    INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+                END""")
+
+    def _drop_search_triggers(self):
+        for table_name in self.FTS_COLUMNS:
+            for event in ("insert", "delete", "update"):
+                self.cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_fts_{event}")
+
+    def rebuild_search_index(self):
+        for table_name, columns in self.FTS_COLUMNS.items():
+            select_values = ", ".join(normalize_arabic_sql(col) for col in columns)
+            self.cursor.execute(f"DELETE FROM {table_name}_fts")
+            self.cursor.execute(f"INSERT INTO {table_name}_fts (rowid, {', '.join(columns)}) SELECT id, {select_values} FROM {table_name}")
+
+    # --- Monthly summary ---
+    # monthly_summary holds SUM(amount) and COUNT(*) per (table_name, year, month, category) and is
+    # maintained by triggers, so charts read a few rows per month instead of the whole history.
+    SUMMARY_KEY_SQL = "CAST(substr({0}date, 1, 4) AS INTEGER), CAST(substr({0}date, 6, 2) AS INTEGER), '{1}', {0}category"
+    SUMMARY_MATCH_SQL = "year = CAST(substr({0}date, 1, 4) AS INTEGER) AND month = CAST(substr({0}date, 6, 2) AS INTEGER) AND table_name = '{1}' AND category = {0}category"
+
+    def _create_monthly_summary(self):
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_summary (
+                table_name TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (table_name, year, month, category)
+            ) WITHOUT ROWID""")
+        self._create_summary_triggers()
+        self.rebuild_monthly_summary()
+
+    def _create_summary_triggers(self):
+        for table_name in self.FTS_COLUMNS:
+            add_new = f"""
+                INSERT INTO monthly_summary (year, month, table_name, category, total, count)
+                VALUES ({self.SUMMARY_KEY_SQL.format('new.', table_name)}, new.amount, 1)
+                ON CONFLICT (table_name, year, month, category) DO UPDATE SET total = total + excluded.total, count = count + 1;"""
+            remove_old = f"""
+                UPDATE monthly_summary SET total = total - old.amount, count = count - 1 WHERE {self.SUMMARY_MATCH_SQL.format('old.', table_name)};
+                DELETE FROM monthly_summary WHERE count <= 0 AND {self.SUMMARY_MATCH_SQL.format('old.', table_name)};"""
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_summary_insert AFTER INSERT ON {table_name} BEGIN {add_new} END")
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_summary_delete AFTER DELETE ON {table_name} BEGIN {remove_old} END")
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_summary_update AFTER UPDATE OF amount, date, category ON {table_name} BEGIN {remove_old} {add_new} END")
+
+    def _drop_summary_triggers(self):
+        for table_name in self.FTS_COLUMNS:
+            for event in ("insert", "delete", "update"):
+                self.cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_summary_{event}")
+
+    def _summary_source_query(self, table_name):
+        return f"SELECT {self.SUMMARY_KEY_SQL.format('', table_name)}, SUM(amount), COUNT(*) FROM {table_name} GROUP BY 1, 2, 4"
+
+    def rebuild_monthly_summary(self):
+        self.cursor.execute("DELETE FROM monthly_summary")
+        for table_name in self.FTS_COLUMNS:
+            self.cursor.execute(f"INSERT INTO monthly_summary (year, month, table_name, category, total, count) {self._summary_source_query(table_name)}")
+
+    def check_monthly_summary(self, tolerance=0.005):
+        """Compares monthly_summary with the raw tables; returns a list of (key, expected, stored) mismatches."""
+        expected, stored = {}, {}
+        for table_name in self.FTS_COLUMNS:
+            self.cursor.execute(self._summary_source_query(table_name))
+            for year, month, name, category, total, count in self.cursor.fetchall():
+                expected[(name, year, month, category)] = (total, count)
+        self.cursor.execute("SELECT table_name, year, month, category, total, count FROM monthly_summary")
+        for name, year, month, category, total, count in self.cursor.fetchall():
+            stored[(name, year, month, category)] = (total, count)
+        mismatches = []
+        for key in sorted(expected.keys() | stored.keys()):
+            want, have = expected.get(key), stored.get(key)
+            if want is None or have is None or want[1] != have[1] or abs(want[0] - have[0]) > tolerance:
+                mismatches.append((key, want, have))
+        return mismatches
+
+    # --- Running balance ---
+    # daily_balance stores the net amount, transaction count and closing balance of every day that has
+    # transactions. Triggers keep net/count current and record the earliest changed day in balance_dirty;
+    # each commit that touches incomes/expenses then re-accumulates the balance from that day onwards,
+    # which reads one row per day rather than the transactions themselves.
+    BALANCE_TABLES = {"incomes": "", "expenses": "-"}  # sign applied to amount
+
+    def _create_balance_snapshot(self):
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS daily_balance (day TEXT PRIMARY KEY, net REAL NOT NULL, count INTEGER NOT NULL, balance REAL NOT NULL) WITHOUT ROWID")
+        self.cursor.execute("CREATE TABLE IF NOT EXISTS balance_dirty (id INTEGER PRIMARY KEY CHECK (id = 1), day TEXT NOT NULL)")
+        self._create_balance_triggers()
+        self.rebuild_daily_balance()
+
+    def _create_balance_triggers(self):
+        for table_name, sign in self.BALANCE_TABLES.items():
+            add_new = f"""
+                INSERT INTO daily_balance (day, net, count, balance) VALUES (substr(new.date, 1, 10), {sign}new.amount, 1, 0)
+                ON CONFLICT (day) DO UPDATE SET net = net + excluded.net, count = count + 1;
+                INSERT INTO balance_dirty (id, day) VALUES (1, substr(new.date, 1, 10)) ON CONFLICT (id) DO UPDATE SET day = MIN(day, excluded.day);"""
+            remove_old = f"""
+                UPDATE daily_balance SET net = net - {sign}old.amount, count = count - 1 WHERE day = substr(old.date, 1, 10);
+                DELETE FROM daily_balance WHERE day = substr(old.date, 1, 10) AND count <= 0;
+                INSERT INTO balance_dirty (id, day) VALUES (1, substr(old.date, 1, 10)) ON CONFLICT (id) DO UPDATE SET day = MIN(day, excluded.day);"""
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_balance_insert AFTER INSERT ON {table_name} BEGIN {add_new} END")
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_balance_delete AFTER DELETE ON {table_name} BEGIN {remove_old} END")
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {table_name}_balance_update AFTER UPDATE OF amount, date ON {table_name} BEGIN {remove_old} {add_new} END")
+
+    def _drop_balance_triggers(self):
+        for table_name in self.BALANCE_TABLES:
+            for event in ("insert", "delete", "update"):
+                self.cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_balance_{event}")
+
+    def refresh_daily_balance(self):
+        """Re-accumulates daily_balance from the earliest day marked dirty; a no-op when nothing changed."""
+        self.cursor.execute("SELECT day FROM balance_dirty WHERE id = 1")
+        row = self.cursor.fetchone()
+        if row is None:
+            return
+        since = row[0]
+        self.cursor.execute("SELECT balance FROM daily_balance WHERE day < ? ORDER BY day DESC LIMIT 1", (since,))
+        previous = self.cursor.fetchone()
+        self.cursor.execute("""
+            UPDATE daily_balance SET balance = running.balance
+            FROM (SELECT day, ? + SUM(net) OVER (ORDER BY day) AS balance FROM daily_balance WHERE day >= ?) AS running
+            WHERE daily_balance.day = running.day""", (previous[0] if previous else 0.0, since))
+        self.cursor.execute("DELETE FROM balance_dirty")
+
+    def rebuild_daily_balance(self):
+        self.cursor.execute("DELETE FROM daily_balance")
+        self.cursor.execute("""
+            INSERT INTO daily_balance (day, net, count, balance)
+            SELECT day, SUM(net), COUNT(*), SUM(SUM(net)) OVER (ORDER BY day)
+            FROM (
+                SELECT substr(date, 1, 10) AS day, amount AS net FROM incomes
+                UNION ALL
+                SELECT substr(date, 1, 10) AS day, -amount AS net FROM expenses
+            )
+            GROUP BY day""")
+        self.cursor.execute("DELETE FROM balance_dirty")
+
+    # --- Donors ---
+    # donors holds one row per normalized payer name (see donor_key) with lifetime totals kept by triggers;
+    # incomes.donor_id links each donation to it and is set when the row is written.
+    def _create_donors(self):
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS donors (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                normalized_name TEXT NOT NULL UNIQUE,
+                total REAL NOT NULL DEFAULT 0,
+                gifts INTEGER NOT NULL DEFAULT 0,
+                first_gift TEXT,
+                last_gift TEXT
+            )""")
+        self.cursor.execute("ALTER TABLE incomes ADD COLUMN donor_id INTEGER REFERENCES donors(id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_incomes_donor_date ON incomes(donor_id, date, amount)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_incomes_date_donor ON incomes(date, donor_id, amount)")  # covers period top-N scans
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_donors_total ON donors(total)")
+        self.cursor.execute("SELECT DISTINCT payer FROM incomes WHERE payer IS NOT NULL AND payer != ''")
+        donor_ids = self._donor_ids(row[0] for row in self.cursor.fetchall())
+        self.cursor.execute("CREATE TEMP TABLE donor_map (payer TEXT PRIMARY KEY, donor_id INTEGER)")
+        self.cursor.executemany("INSERT INTO temp.donor_map VALUES (?, ?)", donor_ids.items())
+        self._drop_search_triggers()  # the text columns are unchanged, no need to re-index every row
+        self.cursor.execute("UPDATE incomes SET donor_id = (SELECT donor_id FROM temp.donor_map WHERE donor_map.payer = incomes.payer) WHERE payer IS NOT NULL AND payer != ''")
+        self._create_search_triggers()
+        self.cursor.execute("DROP TABLE temp.donor_map")
+        self.rebuild_donor_totals()
+        self._create_donor_triggers()
+
+    def _donor_ids(self, names):
+        """{payer: donor id} for the given payer names, creating donors for names not seen before."""
+        keys = {name: donor_key(name) for name in set(names)}
+        keys = {name: key for name, key in keys.items() if key}
+        self.cursor.executemany("INSERT OR IGNORE INTO donors (name, normalized_name) VALUES (?, ?)", ((name, key) for name, key in keys.items()))
+        ids, unique_keys = {}, list(set(keys.values()))
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start:start + 500]
+            self.cursor.execute(f"SELECT normalized_name, id FROM donors WHERE normalized_name IN ({', '.join('?' * len(chunk))})", chunk)
+            ids.update(self.cursor.fetchall())
+        return {name: ids[key] for name, key in keys.items()}
+
+    def _create_donor_triggers(self):
+        # first/last gift are re-read through idx_incomes_donor_date, so deletes stay exact and cheap
+        refresh = """UPDATE donors SET total = total {sign} {row}.amount, gifts = gifts {sign} 1,
+                         first_gift = (SELECT MIN(date) FROM incomes WHERE donor_id = {row}.donor_id),
+                         last_gift = (SELECT MAX(date) FROM incomes WHERE donor_id = {row}.donor_id)
+                     WHERE id = {row}.donor_id;"""
+        self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS incomes_donor_insert AFTER INSERT ON incomes WHEN new.donor_id IS NOT NULL BEGIN {refresh.format(sign='+', row='new')} END")
+        self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS incomes_donor_delete AFTER DELETE ON incomes WHEN old.donor_id IS NOT NULL BEGIN {refresh.format(sign='-', row='old')} END")
+        self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS incomes_donor_update AFTER UPDATE OF amount, date, donor_id ON incomes BEGIN {refresh.format(sign='-', row='old')} {refresh.format(sign='+', row='new')} END")
+
+    def _drop_donor_triggers(self):
+        for event in ("insert", "delete", "update"):
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS incomes_donor_{event}")
+
+    def rebuild_donor_totals(self):
+        self.cursor.execute("UPDATE donors SET total = 0, gifts = 0, first_gift = NULL, last_gift = NULL")
+        self.cursor.execute("""
+            UPDATE donors SET total = agg.total, gifts = agg.gifts, first_gift = agg.first_gift, last_gift = agg.last_gift
+            FROM (SELECT donor_id, SUM(amount) AS total, COUNT(*) AS gifts, MIN(date) AS first_gift, MAX(date) AS last_gift
+                  FROM incomes WHERE donor_id IS NOT NULL GROUP BY donor_id) AS agg
+            WHERE donors.id = agg.donor_id""")
+
+    def get_top_donors(self, limit=20, start_date=None, end_date=None, name=None):
+        """Rows of (id, name, total, gifts, first_gift, last_gift), largest total first; lifetime figures come from donors directly."""
+        params = []
+        if start_date and end_date:
+            query = """SELECT d.id, d.name, SUM(i.amount) AS total, COUNT(*) AS gifts, MIN(i.date) AS first_gift, MAX(i.date) AS last_gift
+                       FROM incomes i JOIN donors d ON d.id = i.donor_id WHERE i.date >= ? AND i.date <= ?"""
+            params.extend([start_date, end_date])
+            group = " GROUP BY i.donor_id"
+        else:
+            query, group = "SELECT id, name, total, gifts, first_gift, last_gift FROM donors d WHERE gifts > 0", ""
+        if name and donor_key(name):
+            query += " AND d.normalized_name LIKE ?"
+            params.append(f"%{donor_key(name)}%")
+        self.cursor.execute(f"{query}{group} ORDER BY total DESC LIMIT ?", (*params, limit))
+        return self.cursor.fetchall()
+
+    def get_donor_summary(self, donor_id, start_date=None, end_date=None):
+        """(total, gifts, first_gift, last_gift) of one donor, read from idx_incomes_donor_date alone."""
+        query, params = "SELECT COALESCE(SUM(amount), 0) AS total, COUNT(*) AS gifts, MIN(date) AS first_gift, MAX(date) AS last_gift FROM incomes WHERE donor_id = ?", [donor_id]
+        if start_date and end_date:
+            query += " AND date >= ? AND date <= ?"
+            params.extend([start_date, end_date])
+        self.cursor.execute(query, tuple(params))
+        return self.cursor.fetchone()
+
+    def _drop_derived_triggers(self):
+        self._drop_search_triggers()
+        self._drop_summary_triggers()
+        self._drop_balance_triggers()
+        self._drop_donor_triggers()
+
+    def _rebuild_derived_tables(self):
+        """Rebuilds the search index, monthly summary, running balance and donor totals, then re-creates their triggers."""
+        self.rebuild_search_index()
+        self._create_search_triggers()
+        self.rebuild_monthly_summary()
+        self._create_summary_triggers()
+        self.rebuild_daily_balance()
+        self._create_balance_triggers()
+        self.rebuild_donor_totals()
+        self._create_donor_triggers()
+
+    def _backfill_has_attachment(self):
+        # One-time check of the files on disk; afterwards the flag is maintained on add/update
+        for table_name in ("incomes", "expenses"):
+            self.cursor.execute(f"SELECT id, attachment_path FROM {table_name} WHERE attachment_path IS NOT NULL AND attachment_path != ''")
+            present = [(row['id'],) for row in self.cursor.fetchall() if os.path.exists(row['attachment_path'])]
+            self.cursor.executemany(f"UPDATE {table_name} SET has_attachment = 1 WHERE id = ?", present)
+
+    # Content hash, byte size and pixel dimensions of each row's attachment (see AttachmentStore)
+    ATTACHMENT_COLUMNS = ("attachment_hash", "attachment_size", "attachment_width", "attachment_height")
+
+    def _add_attachment_metadata(self):
+        for table_name in ("incomes", "expenses"):
+            for column, sql_type in zip(self.ATTACHMENT_COLUMNS, ("TEXT", "INTEGER", "INTEGER", "INTEGER")):
+                self.cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {sql_type}")
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_attachment_hash ON {table_name}(attachment_hash) WHERE attachment_hash IS NOT NULL")
+            # Files attached before the store keep their path; only their metadata is read (the image header, not its pixels)
+            self.cursor.execute(f"SELECT id, attachment_path FROM {table_name} WHERE has_attachment = 1")
+            rows = [(row['id'], row['attachment_path']) for row in self.cursor.fetchall()]
+            updates = [(*AttachmentStore.describe(path).values(), record_id) for record_id, path in rows if path and os.path.exists(path)]
+            self.cursor.executemany(f"UPDATE {table_name} SET {', '.join(f'{c} = ?' for c in self.ATTACHMENT_COLUMNS)} WHERE id = ?", updates)
+
+    def attachment_references(self, digest):
+        """Number of incomes and expenses whose attachment has this content hash."""
+        self.cursor.execute("SELECT (SELECT COUNT(*) FROM incomes WHERE attachment_hash = ?) + (SELECT COUNT(*) FROM expenses WHERE attachment_hash = ?)", (digest, digest))
+        return self.cursor.fetchone()[0]
+
+    def get_schema_version(self):
+        self.cursor.execute("PRAGMA user_version")
+        return self.cursor.fetchone()[0]
+
+    def run_migrations(self):
+        current_version = self.get_schema_version()
+        if self.conn.in_transaction: self.conn.commit()
+        for version in range(current_version, len(self.MIGRATIONS)):
+            try:
+                self.cursor.execute("BEGIN")
+                for step in self.MIGRATIONS[version]:
+                    if callable(step): step(self)
+                    else: self.cursor.execute(step)
+                self.cursor.execute(f"PRAGMA user_version = {version + 1}")
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    # Queries on the UI's hot paths; check_query_plans() reports any of them that scans a whole table.
+    HOT_QUERIES = {
+        "incomes_all": ("SELECT * FROM incomes ORDER BY date DESC, id DESC", ()),
+        "incomes_range": ("SELECT * FROM incomes WHERE date >= ? AND date <= ? ORDER BY date DESC, id DESC", ("2024-01-01", "2024-12-31")),
+        "expenses_all": ("SELECT * FROM expenses ORDER BY date DESC, id DESC", ()),
+        "expenses_range": ("SELECT * FROM expenses WHERE date >= ? AND date <= ? ORDER BY date DESC, id DESC", ("2024-01-01", "2024-12-31")),
+        "incomes_by_category": ("SELECT * FROM incomes WHERE category = ? ORDER BY date DESC", ("أخرى",)),
+        "audit_log": ("SELECT id, timestamp, username, action, details FROM audit_log ORDER BY timestamp DESC", ()),
+        "attendance": ("SELECT member_id FROM activity_attendance WHERE activity_id=?", (1,)),
+        "incomes_page": ("SELECT * FROM incomes WHERE (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT 200", ("2024-06-01", 500)),
+        "expenses_page": ("SELECT * FROM expenses WHERE (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT 200", ("2024-06-01", 500)),
+        "incomes_monthly_summary": ("SELECT year, month, SUM(total), SUM(count) FROM monthly_summary WHERE table_name = ? GROUP BY year, month ORDER BY year, month", ("incomes",)),
+        "balance_as_of": ("SELECT balance FROM daily_balance WHERE day <= ? ORDER BY day DESC LIMIT 1", ("2024-06-01",)),
+        "incomes_range_page": ("SELECT * FROM incomes WHERE date >= ? AND date <= ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT 200", ("2024-01-01", "2024-12-31", "2024-06-01", 500)),
+        "incomes_summary_range": ("SELECT year, month, SUM(total) FROM monthly_summary WHERE table_name = ? AND (year, month) BETWEEN (?, ?) AND (?, ?) GROUP BY year, month ORDER BY year, month", ("incomes", 2024, 1, 2024, 12)),
+        "incomes_inkind_page": ("SELECT * FROM incomes WHERE category IN (?) AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT 200", ("تبرعات عينية", "2024-06-01", 500)),
+        "top_donors": ("SELECT id, name, total, gifts, first_gift, last_gift FROM donors d WHERE gifts > 0 ORDER BY total DESC LIMIT 20", ()),
+        "donor_period_total": ("SELECT COALESCE(SUM(amount), 0), COUNT(*) FROM incomes WHERE donor_id = ? AND date >= ? AND date <= ?", (1, "2024-01-01", "2024-12-31")),
+        "incomes_search": ("SELECT * FROM incomes WHERE id IN (SELECT rowid FROM incomes_fts WHERE incomes_fts MATCH ?) ORDER BY date DESC, id DESC LIMIT 200", ('"محمد"*',)),
+    }
+
+    def explain_query_plan(self, query, params=()):
+        self.cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        return [row['detail'] for row in self.cursor.fetchall()]
+
+    # Full-text matches come back in rank order and are few, so sorting them is expected
+    SORTED_MATCH_QUERIES = {"incomes_search"}
+
+    def check_query_plans(self):
+        """Returns {query_name: plan} for every hot query that does a full scan or a temporary sort."""
+        offenders = {}
+        for name, (query, params) in self.HOT_QUERIES.items():
+            plan = self.explain_query_plan(query, params)
+            allow_sort = name in self.SORTED_MATCH_QUERIES
+            if any((detail.startswith("SCAN") and "INDEX" not in detail) or ("TEMP B-TREE" in detail and not allow_sort) for detail in plan):
+                offenders[name] = plan
+        return offenders
 
     def setup_settings_table(self):
         self.cursor.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
@@ -371,7 +1215,7 @@ class DatabaseManager:
         }
         for key, value in default_settings.items():
             self.cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, value))
-        self.conn.commit()
+        self._commit()
 
     def get_all_settings(self):
         self.cursor.execute("SELECT key, value FROM settings")
@@ -379,7 +1223,7 @@ class DatabaseManager:
 
     def update_setting(self, key, value):
         self.cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-        self.conn.commit()
+        self._commit('settings')
 
     def init_default_categories(self):
         default_incomes = ["تبرعات أفراد", "تبرعات مؤسسات", "تبرعات عينية", "منح", "اشتراكات", "بيع أصول", "أخرى"]
@@ -390,7 +1234,7 @@ class DatabaseManager:
         self.cursor.execute("SELECT COUNT(*) FROM expense_categories")
         if self.cursor.fetchone()[0] == 0:
             for cat in default_expenses: self.cursor.execute("INSERT OR IGNORE INTO expense_categories (name) VALUES (?)", (cat,))
-        self.conn.commit()
+        self._commit()
 
     def get_categories(self, table_name):
         self.cursor.execute(f"SELECT id, name FROM {table_name} ORDER BY name")
@@ -399,7 +1243,7 @@ class DatabaseManager:
     def add_category(self, table_name, name):
         try:
             self.cursor.execute(f"INSERT INTO {table_name} (name) VALUES (?)", (name,))
-            self.conn.commit()
+            self._commit(table_name)
             return True
         except sqlite3.IntegrityError:
             return False
@@ -407,20 +1251,20 @@ class DatabaseManager:
     def update_category(self, table_name, cat_id, new_name):
         try:
             self.cursor.execute(f"UPDATE {table_name} SET name = ? WHERE id = ?", (new_name, cat_id))
-            self.conn.commit()
+            self._commit(table_name)
             return True
         except sqlite3.IntegrityError:
             return False
 
     def delete_category(self, table_name, cat_id):
         self.cursor.execute(f"DELETE FROM {table_name} WHERE id=?", (cat_id,))
-        self.conn.commit()
+        self._commit(table_name)
 
     def add_user(self, username, password, role, must_change_password=0):
         hashed_password = self.hash_password(password)
         try:
             self.cursor.execute("INSERT INTO users (username, password, role, must_change_password) VALUES (?, ?, ?, ?)", (username, hashed_password, role, must_change_password))
-            self.conn.commit()
+            self._commit('users')
             return True
         except sqlite3.IntegrityError: return False
 
@@ -444,16 +1288,16 @@ class DatabaseManager:
         query += " WHERE id=?"
         params.append(user_id)
         self.cursor.execute(query, tuple(params))
-        self.conn.commit()
+        self._commit('users')
 
     def delete_user(self, user_id):
         self.cursor.execute("DELETE FROM users WHERE id=?", (user_id,))
-        self.conn.commit()
+        self._commit('users')
 
     def log_action(self, username, action, details=""):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.cursor.execute("INSERT INTO audit_log (timestamp, username, action, details) VALUES (?, ?, ?, ?)", (timestamp, username, action, details))
-        self.conn.commit()
+        self._commit('audit_log')
 
     def get_audit_logs(self):
         self.cursor.execute("SELECT id, timestamp, username, action, details FROM audit_log ORDER BY timestamp DESC")
@@ -461,14 +1305,14 @@ class DatabaseManager:
 
     def add_transaction(self, table_name, data):
         if table_name == "incomes":
-            query = "INSERT INTO incomes (amount, date, category, description, notes, payer, attachment_path) VALUES (?, ?, ?, ?, ?, ?, ?)"
-            params = (data['amount'], data['date'], data['category'], data['description'], data['notes'], data['payer'], data['attachment_path'])
+            query = "INSERT INTO incomes (amount, date, category, description, notes, payer, attachment_path, has_attachment, donor_id, attachment_hash, attachment_size, attachment_width, attachment_height) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            params = (data['amount'], data['date'], data['category'], data['description'], data['notes'], data['payer'], data['attachment_path'], int(bool(data['attachment_path'])), self._donor_ids([data['payer']]).get(data['payer']))
         else:
-            query = "INSERT INTO expenses (amount, date, category, description, notes, attachment_path) VALUES (?, ?, ?, ?, ?, ?)"
-            params = (data['amount'], data['date'], data['category'], data['description'], data['notes'], data['attachment_path'])
-        self.cursor.execute(query, params)
+            query = "INSERT INTO expenses (amount, date, category, description, notes, attachment_path, has_attachment, attachment_hash, attachment_size, attachment_width, attachment_height) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            params = (data['amount'], data['date'], data['category'], data['description'], data['notes'], data['attachment_path'], int(bool(data['attachment_path'])))
+        self.cursor.execute(query, params + tuple(data.get(column) for column in self.ATTACHMENT_COLUMNS))
         last_id = self.cursor.lastrowid
-        self.conn.commit()
+        self._commit(table_name)
         return last_id
 
     def get_transaction_by_id(self, table_name, record_id):
@@ -476,50 +1320,194 @@ class DatabaseManager:
         return self.cursor.fetchone()
 
     def get_transactions(self, table_name, start_date=None, end_date=None):
-        query = f"SELECT * FROM {table_name}"
+        return self.fetch(TransactionQuery(table_name).between(start_date, end_date))
+
+    def get_transactions_frame(self, table_name, start_date=None, end_date=None):
+        """Same rows as get_transactions(), read straight into a DataFrame for exports."""
+        return self.fetch_frame(TransactionQuery(table_name).between(start_date, end_date))
+
+    # --- TransactionQuery execution ---
+    def fetch(self, query):
+        sql, params = query.build()
+        self.cursor.execute(sql, tuple(params))
+        return self.cursor.fetchall()
+
+    def fetch_frame(self, query):
+        sql, params = query.build()
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def fetch_total(self, query):
+        sql, params = query.build_total()
+        self.cursor.execute(sql, tuple(params))
+        return self.cursor.fetchone()[0]
+
+    # --- Aggregations (computed by SQLite instead of loading every row) ---
+    PERIOD_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+
+    def get_total(self, table_name, start_date=None, end_date=None):
+        if not (start_date and end_date):
+            self.cursor.execute("SELECT COALESCE(SUM(total), 0) FROM monthly_summary WHERE table_name = ?", (table_name,))
+            return self.cursor.fetchone()[0]
+        span = month_span(start_date, end_date)
+        if span:
+            self.cursor.execute("SELECT COALESCE(SUM(total), 0) FROM monthly_summary WHERE table_name = ? AND (year, month) BETWEEN (?, ?) AND (?, ?)", (table_name, *span[0], *span[1]))
+            return self.cursor.fetchone()[0]
+        return self.fetch_total(TransactionQuery(table_name).between(start_date, end_date))
+
+    def get_period_totals(self, table_name, period="month", start_date=None, end_date=None):
+        """Returns rows of (period, total, count) grouped by day, month or year."""
+        if period != "day" and (not (start_date and end_date) or month_span(start_date, end_date)):
+            return self.get_summary_totals(table_name, period, start_date, end_date)
+        fmt = self.PERIOD_FORMATS[period]
+        query = f"SELECT strftime('{fmt}', date) AS period, SUM(amount) AS total, COUNT(*) AS count FROM {table_name}"
         params = []
         if start_date and end_date:
             query += " WHERE date >= ? AND date <= ?"
             params.extend([start_date, end_date])
-        query += " ORDER BY date DESC, id DESC"
+        query += " GROUP BY period ORDER BY period"
+        self.cursor.execute(query, tuple(params))
+        return self.cursor.fetchall()
+
+    def get_summary_totals(self, table_name, period="month", start_date=None, end_date=None):
+        """Same rows as get_period_totals(), read from monthly_summary; a range must cover whole months."""
+        label, group = ("printf('%04d-%02d', year, month)", "year, month") if period == "month" else ("printf('%04d', year)", "year")
+        query, params = "FROM monthly_summary WHERE table_name = ?", [table_name]
+        span = month_span(start_date, end_date) if start_date and end_date else None
+        if span:
+            query += " AND (year, month) BETWEEN (?, ?) AND (?, ?)"
+            params.extend([*span[0], *span[1]])
+        self.cursor.execute(f"SELECT {label} AS period, SUM(total) AS total, SUM(count) AS count {query} GROUP BY {group} ORDER BY {group}", tuple(params))
+        return self.cursor.fetchall()
+
+    def get_years(self):
+        """Years that have at least one transaction, newest first."""
+        self.cursor.execute("SELECT DISTINCT year FROM monthly_summary ORDER BY year DESC")
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def get_daily_balance(self, start_date=None, end_date=None):
+        """Returns rows of (day, net, balance) where balance is the running total of incomes minus expenses."""
+        query, params = "SELECT day, net, balance FROM daily_balance", []
+        if start_date and end_date:
+            query += " WHERE day >= ? AND day <= ?"
+            params.extend([start_date, end_date])
+        self.cursor.execute(query + " ORDER BY day", tuple(params))
+        return self.cursor.fetchall()
+
+    def balance_as_of(self, day):
+        """Balance at the end of day (a date or 'YYYY-MM-DD'), found with one index lookup."""
+        self.cursor.execute("SELECT balance FROM daily_balance WHERE day <= ? ORDER BY day DESC LIMIT 1", (str(day)[:10],))
+        row = self.cursor.fetchone()
+        return row[0] if row else 0.0
+
+    def balance_series(self, start=None, end=None, step="day"):
+        """Returns rows of (period, day, balance): the closing balance of each day, month or year in [start, end] that has transactions."""
+        fmt = self.PERIOD_FORMATS[step]
+        query = f"SELECT strftime('{fmt}', day) AS period, MAX(day) AS day, balance FROM daily_balance"
+        conditions, params = [], []
+        if start:
+            conditions.append("day >= ?"); params.append(str(start)[:10])
+        if end:
+            conditions.append("day <= ?"); params.append(str(end)[:10])
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # SQLite takes the bare balance column from the row that holds MAX(day)
+        query += " GROUP BY period ORDER BY period"
         self.cursor.execute(query, tuple(params))
         return self.cursor.fetchall()
 
+    @staticmethod
+    def build_fts_query(search):
+        """Turns free text into an FTS5 prefix query: every word must match the start of a token."""
+        words = normalize_arabic(search).split()
+        return " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+    @staticmethod
+    def search_condition(table_name, search):
+        # Dates and amounts are not in the text index; digit-only searches match them directly
+        if all(ch.isdigit() or ch in "-/.," for ch in search):
+            term = f"%{search.replace(',', '')}%"
+            return "(date LIKE ? OR amount LIKE ?)", [term, term]
+        return f"id IN (SELECT rowid FROM {table_name}_fts WHERE {table_name}_fts MATCH ?)", [DatabaseManager.build_fts_query(search)]
+
+    def get_transactions_page(self, table_name, after=None, limit=200, search=None, start_date=None, end_date=None):
+        """
+        Keyset pagination in list order (date DESC, id DESC).
+        `after` is the (date, id) of the last row already loaded, or None for the first page.
+        """
+        return self.fetch(TransactionQuery(table_name).between(start_date, end_date).matching(search).page(limit, after=after))
+
+    def get_receipt_rows(self, ids=None, start_date=None, end_date=None):
+        """Incomes to print receipts for: the given ids, or else every income of the period, oldest first."""
+        query = TransactionQuery("incomes").with_ids(*ids) if ids else TransactionQuery("incomes").between(start_date, end_date)
+        return [dict(row) for row in reversed(self.fetch(query))]
+
     def update_transaction(self, table_name, record_id, data):
         if table_name == "incomes":
-            query = "UPDATE incomes SET amount=?, date=?, category=?, description=?, notes=?, payer=?, attachment_path=? WHERE id=?"
-            params = (data['amount'], data['date'], data['category'], data['description'], data['notes'], data['payer'], data['attachment_path'], record_id)
+            query = "UPDATE incomes SET amount=?, date=?, category=?, description=?, notes=?, payer=?, attachment_path=?, has_attachment=?, donor_id=?, attachment_hash=?, attachment_size=?, attachment_width=?, attachment_height=?, row_version=row_version + 1 WHERE id=?"
+            params = (data['amount'], data['date'], data['category'], data['description'], data['notes'], data['payer'], data['attachment_path'], int(bool(data['attachment_path'])), self._donor_ids([data['payer']]).get(data['payer']))
         else:
-            query = "UPDATE expenses SET amount=?, date=?, category=?, description=?, notes=?, attachment_path=? WHERE id=?"
-            params = (data['amount'], data['date'], data['category'], data['description'], data['notes'], data['attachment_path'], record_id)
-        self.cursor.execute(query, params)
-        self.conn.commit()
+            query = "UPDATE expenses SET amount=?, date=?, category=?, description=?, notes=?, attachment_path=?, has_attachment=?, attachment_hash=?, attachment_size=?, attachment_width=?, attachment_height=?, row_version=row_version + 1 WHERE id=?"
+            params = (data['amount'], data['date'], data['category'], data['description'], data['notes'], data['attachment_path'], int(bool(data['attachment_path'])))
+        self.cursor.execute(query, params + tuple(data.get(column) for column in self.ATTACHMENT_COLUMNS) + (record_id,))
+        self._commit(table_name)
 
     def delete_transaction(self, table_name, record_id):
         self.cursor.execute(f"DELETE FROM {table_name} WHERE id=?", (record_id,))
-        self.conn.commit()
+        self._commit(table_name)
 
     def clear_all_transactions(self):
         self.cursor.execute("DELETE FROM incomes")
         self.cursor.execute("DELETE FROM expenses")
-        self.conn.commit()
+        self._commit('incomes', 'expenses')
+
+    # Column order expected by bulk_add_transactions() for each table
+    TRANSACTION_COLUMNS = {
+        "incomes": ("amount", "date", "category", "description", "notes", "payer", "attachment_path"),
+        "expenses": ("amount", "date", "category", "description", "notes", "attachment_path"),
+    }
+
+    def bulk_add_transactions(self, table_name, rows):
+        columns = self.TRANSACTION_COLUMNS[table_name]
+        if table_name == "incomes":
+            payer_index = columns.index("payer")
+            donor_ids = self._donor_ids(row[payer_index] for row in rows)
+            rows = [(*row, donor_ids.get(row[payer_index])) for row in rows]
+            columns += ("donor_id",)
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        self.cursor.executemany(query, rows)
+        self._commit(table_name)
+
+    def restore_transactions(self, income_rows, expense_rows, progress_callback=None, chunk_size=5000):
+        """Replaces all incomes and expenses in one transaction; nothing is changed if any row fails."""
+        total, done = len(income_rows) + len(expense_rows), 0
+        with self.transaction():
+            # Row-by-row triggers are much slower than one rebuild of every derived table at the end
+            self._drop_derived_triggers()
+            self.clear_all_transactions()
+            for table_name, rows in (("incomes", income_rows), ("expenses", expense_rows)):
+                for start in range(0, len(rows), chunk_size):
+                    chunk = rows[start:start + chunk_size]
+                    self.bulk_add_transactions(table_name, chunk)
+                    done += len(chunk)
+                    if progress_callback: progress_callback(done, total)
+            self._rebuild_derived_tables()
 
     def add_member(self, data):
         query = "INSERT INTO members (full_name, join_date, phone, address, status, notes) VALUES (?, ?, ?, ?, ?, ?)"
         params = (data['full_name'], data['join_date'], data['phone'], data['address'], data['status'], data['notes'])
         self.cursor.execute(query, params)
-        self.conn.commit()
+        self._commit('members')
         return self.cursor.lastrowid
 
     def update_member(self, member_id, data):
         query = "UPDATE members SET full_name=?, join_date=?, phone=?, address=?, status=?, notes=? WHERE id=?"
         params = (data['full_name'], data['join_date'], data['phone'], data['address'], data['status'], data['notes'], member_id)
         self.cursor.execute(query, params)
-        self.conn.commit()
+        self._commit('members')
 
     def delete_member(self, member_id):
         self.cursor.execute("DELETE FROM members WHERE id=?", (member_id,))
-        self.conn.commit()
+        self._commit('members', 'activity_attendance')
 
     def get_all_members(self):
         self.cursor.execute("SELECT * FROM members ORDER BY full_name")
@@ -533,18 +1521,18 @@ class DatabaseManager:
         query = "INSERT INTO activities (name, date, location, description) VALUES (?, ?, ?, ?)"
         params = (data['name'], data['date'], data['location'], data['description'])
         self.cursor.execute(query, params)
-        self.conn.commit()
+        self._commit('activities')
         return self.cursor.lastrowid
 
     def update_activity(self, activity_id, data):
         query = "UPDATE activities SET name=?, date=?, location=?, description=? WHERE id=?"
         params = (data['name'], data['date'], data['location'], data['description'], activity_id)
         self.cursor.execute(query, params)
-        self.conn.commit()
+        self._commit('activities')
 
     def delete_activity(self, activity_id):
         self.cursor.execute("DELETE FROM activities WHERE id=?", (activity_id,))
-        self.conn.commit()
+        self._commit('activities', 'activity_attendance')
 
     def get_all_activities(self):
         self.cursor.execute("SELECT * FROM activities ORDER BY date DESC")
@@ -562,21 +1550,98 @@ class DatabaseManager:
         self.cursor.execute("DELETE FROM activity_attendance WHERE activity_id=?", (activity_id,))
         for member_id in member_ids:
             self.cursor.execute("INSERT INTO activity_attendance (activity_id, member_id) VALUES (?, ?)", (activity_id, member_id))
-        self.conn.commit()
+        self._commit('activity_attendance')
+
+
+# =================================================================
+# منفذ المهام الخلفية (TaskExecutor)
+# =================================================================
+class TaskExecutor:
+    """
+    ينفذ الاستعلامات ومعالجة pandas في خيوط عاملة، لكل خيط اتصال SQLite خاص به للقراءة فقط،
+    ثم يعيد النتائج إلى خيط الواجهة عبر after() حتى لا تتجمد النافذة.
+    كل مهمة مرتبطة بمالك (صفحة) ومفتاح: المهمة الأحدث لنفس المفتاح تلغي السابقة، ونتائج المهام الملغاة تُهمل.
+    """
+    POLL_MS = 30
+
+    def __init__(self, root, db_name, max_workers=2):
+        self.root, self.db_name = root, db_name
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="masjid-worker", initializer=self._open_connection)
+        self._done = queue.SimpleQueue()
+        self._latest = {}  # (owner, key) -> future whose result is still wanted
+        self._polling = False
+
+    def _open_connection(self):
+        self._local.db = DatabaseManager(self.db_name, read_only=True)
+
+    def _run(self, work):
+        return work(self._local.db)
+
+    def submit(self, owner, key, work, on_done, on_error=None):
+        """Runs work(db) on a worker; on_done(result) or on_error(exc) is then called on the Tk thread."""
+        task_key = (owner, key)
+        previous = self._latest.get(task_key)
+        if previous is not None:
+            previous.cancel()
+        future = self._pool.submit(self._run, work)
+        self._latest[task_key] = future
+        future.add_done_callback(lambda f: self._done.put((task_key, f, on_done, on_error)))
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.POLL_MS, self._drain)
+        return future
+
+    def cancel(self, owner):
+        """Drops every pending task of owner, e.g. when the user navigates away from its page."""
+        for task_key in [k for k in self._latest if k[0] is owner]:
+            self._latest.pop(task_key).cancel()
+
+    def is_pending(self, owner, key):
+        return (owner, key) in self._latest
+
+    def _drain(self):
+        while True:
+            try:
+                task_key, future, on_done, on_error = self._done.get_nowait()
+            except queue.Empty:
+                break
+            if self._latest.get(task_key) is not future:
+                continue  # superseded or cancelled: the result is stale
+            del self._latest[task_key]
+            try:
+                error = future.exception()
+                if error is None:
+                    on_done(future.result())
+                elif on_error:
+                    on_error(error)
+                else:
+                    traceback.print_exception(type(error), error, error.__traceback__)
+            except Exception:
+                traceback.print_exc()
+        if self._latest:
+            self.root.after(self.POLL_MS, self._drain)
+        else:
+            self._polling = False
+
+    def shutdown(self):
+        self._latest.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
 
 # =================================================================
 # الفئة الرئيسية للتطبيق (App)
 # =================================================================
 class App(ctk.CTk):
-    def __init__(self):
+    def __init__(self, data_dir=None):
         super().__init__()
 
         FontManager.initialize_fonts()
 
         # --- Setup data directories in a user-writable location ---
-        self.data_dir = os.path.join(os.path.expanduser("~"), "MasjidProData")
+        self.data_dir = data_dir or os.path.join(os.path.expanduser("~"), "MasjidProData")
         self.attachments_dir = os.path.join(self.data_dir, "attachments")
+        self.attachments = AttachmentStore(self.attachments_dir)
         self.receipts_dir = os.path.join(self.data_dir, "receipts")
 
         try:
@@ -599,15 +1664,14 @@ class App(ctk.CTk):
             except Exception as e:
                 print(f"WARNING: Could not copy database from app directory: {e}")
 
-        self.db = DatabaseManager(data_dir_db_path)
+        self.db = DatabaseManager(data_dir_db_path, performance_profile=True)
+        self.tasks = TaskExecutor(self, data_dir_db_path)
         self.current_user = None
         self.current_role = None
 
-        try:
-            self.icons = IconManager.load_all_icons()
-        except Exception as e:
-            messagebox.showerror("خطأ في تحميل المكونات", f"قد لا تظهر الأيقونات بشكل صحيح.\nالخطأ: {e}", parent=self)
-            self.icons = {}
+        # Icons are cut from a cached atlas on first use (see IconSet); chart fonts are cached in the same folder
+        self.icons = IconSet(os.path.join(self.data_dir, "cache"))
+        set_font_cache_dir(os.path.join(self.data_dir, "cache"))
 
         self.update_global_style()
         self.title(f"برنامج إدارة الجمعية - إصدار {APP_VERSION}")
@@ -650,8 +1714,8 @@ class App(ctk.CTk):
 
         if hasattr(self, 'frames') and self.frames:
             for frame in self.frames.values():
-                if isinstance(frame, (DashboardFrame, ReportsFrame)) and frame.winfo_ismapped():
-                    frame.on_show()
+                if hasattr(frame, "refresh_theme"):
+                    frame.refresh_theme()
 
     def handle_login(self, username, role, must_change_password):
         self.current_user, self.current_role = username, role
@@ -665,6 +1729,7 @@ class App(ctk.CTk):
         if messagebox.askyesno("تأكيد الخروج", "هل أنت متأكد من رغبتك في الخروج من البرنامج؟", parent=self):
             if self.current_user:
                  self.db.log_action(self.current_user, "تسجيل خروج")
+            self.tasks.shutdown()
             self.quit()
 
     def setup_main_ui(self):
@@ -680,8 +1745,13 @@ class App(ctk.CTk):
         self.container.grid_rowconfigure(0, weight=1)
         self.container.grid_columnconfigure(0, weight=1)
 
+        # Pages are only registered here; each one is built on its first show_frame()
         self.frames = {}
-        frames_to_load = {
+        self.frame_build_times = {}
+        self.visible_frame = None
+        self.period_label, self.period = PeriodSelector.ALL_HISTORY, (None, None)
+        self.period_selectors = []
+        self.frame_classes = {
             "DashboardFrame": DashboardFrame, 
             "IncomeFrame": IncomeFrame, 
             "ExpenseFrame": ExpenseFrame, 
@@ -690,35 +1760,56 @@ class App(ctk.CTk):
             "ReportsFrame": ReportsFrame
         }
         if self.current_role == "مدير":
-            frames_to_load.update({
+            self.frame_classes.update({
                 "DataManagementFrame": DataManagementFrame, 
                 "UserManagementFrame": UserManagementFrame, 
                 "AuditLogFrame": AuditLogFrame
             })
 
-        for name, F in frames_to_load.items():
-            try:
-                frame = F(parent=self.container, controller=self)
-                self.frames[name] = frame
-                frame.grid(row=0, column=0, sticky="nsew")
-            except Exception as e:
-                messagebox.showerror("خطأ في تهيئة الواجهة", f"فشل تحميل الصفحة: {name}\n\n{traceback.format_exc()}", parent=self)
-
         self.show_frame("DashboardFrame")
 
+    def get_frame(self, page_name):
+        frame = self.frames.get(page_name)
+        if frame is None:
+            started = time.perf_counter()
+            frame = self.frame_classes[page_name](parent=self.container, controller=self)
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frames[page_name] = frame
+            self.frame_build_times[page_name] = time.perf_counter() - started
+        return frame
+
     def show_frame(self, page_name):
         try:
-            frame = self.frames[page_name]
+            frame = self.get_frame(page_name)
+            if self.visible_frame is not None and self.visible_frame is not frame:
+                self.tasks.cancel(self.visible_frame)  # its pending results would only be discarded
+            self.visible_frame = frame
             if hasattr(frame, "on_show"):
                 frame.on_show()
             frame.tkraise()
         except Exception as e:
             messagebox.showerror("خطأ فادح", f"حدث خطأ أثناء عرض صفحة: {page_name}\n\n{traceback.format_exc()}", parent=self)
 
+    def set_period(self, label, period):
+        """Applies the (start_date, end_date) chosen in any PeriodSelector to every page that reads transactions."""
+        self.period_label, self.period = label, period
+        for selector in self.period_selectors:
+            selector.show_period(label)
+        tracker = getattr(self.visible_frame, "data_versions", None)
+        if tracker is not None and not tracker.is_current():
+            tracker.reload()
+
     def refresh_all_data(self):
-        for frame in self.frames.values():
-            if hasattr(frame, "on_show"):
-                frame.on_show()
+        # Hidden pages reload in their own on_show() the next time they are displayed
+        if self.visible_frame is not None and hasattr(self.visible_frame, "on_show"):
+            self.visible_frame.on_show()
+
+    def export_period_report(self):
+        start_date, end_date = self.period
+        suffix = f"{start_date}_{end_date}" if start_date else datetime.now().strftime('%Y-%m-%d')
+        filepath = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Files", "*.xlsx")], title="حفظ تقرير الفترة", initialfile=f"تقرير_{suffix}.xlsx")
+        if filepath:
+            self.generate_excel_report(filepath, start_date, end_date)
 
     def export_full_backup(self):
         filepath = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Files", "*.xlsx")], title="حفظ النسخة الاحتياطية الكاملة", initialfile=f"نسخة_احتياطية_كاملة_{datetime.now().strftime('%Y-%m-%d')}.xlsx")
@@ -727,77 +1818,25 @@ class App(ctk.CTk):
 
     def generate_excel_report(self, filepath, start_date=None, end_date=None):
         try:
-            incomes_data = self.db.get_transactions('incomes', start_date, end_date)
-            expenses_data = self.db.get_transactions('expenses', start_date, end_date)
-            df_incomes = pd.DataFrame([dict(row) for row in incomes_data])
-            df_expenses = pd.DataFrame([dict(row) for row in expenses_data])
+            df_incomes = self.db.get_transactions_frame('incomes', start_date, end_date)
+            df_expenses = self.db.get_transactions_frame('expenses', start_date, end_date)
 
             total_income = df_incomes['amount'].sum() if not df_incomes.empty else 0
             total_expense = df_expenses['amount'].sum() if not df_expenses.empty else 0
-            balance = total_income - total_expense
-
-            df_incomes_export = df_incomes[['date', 'payer', 'description', 'category', 'amount']].copy() if not df_incomes.empty else pd.DataFrame(columns=["التاريخ", "الدافع/المصدر", "الوصف", "الفئة", "المبلغ"])
-            if not df_incomes.empty:
-                df_incomes_export.columns = ["التاريخ", "الدافع/المصدر", "الوصف", "الفئة", "المبلغ"]
-                df_incomes_export['المبلغ'] = df_incomes_export['المبلغ'].apply(lambda x: f"{x:,.2f} د.ج")
-
-            df_expenses_export = df_expenses[['date', 'description', 'category', 'amount']].copy() if not df_expenses.empty else pd.DataFrame(columns=["التاريخ", "الوصف", "الفئة", "المبلغ"])
-            if not df_expenses.empty:
-                df_expenses_export.columns = ["التاريخ", "الوصف", "الفئة", "المبلغ"]
-                df_expenses_export['المبلغ'] = df_expenses_export['المبلغ'].apply(lambda x: f"{x:,.2f} د.ج")
-
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-                title_font_excel = OpenpyxlFont(name='Calibri', size=18, bold=True, color='FFFFFF')
-                title_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-                center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                right_align = Alignment(horizontal='right', vertical='center')
-                header_font = OpenpyxlFont(name='Calibri', size=12, bold=True, color='FFFFFF')
-                header_fill = PatternFill(start_color="808080", end_color="808080", fill_type="solid")
-                cell_font = OpenpyxlFont(name='Calibri', size=11)
-
-                ws_summary = writer.book.create_sheet(title="ملخص مالي", index=0)
-                ws_summary.sheet_view.rightToLeft = True
-                report_period = f"من {start_date} إلى {end_date}" if start_date and end_date else "لكامل الفترة"
-                ws_summary.merge_cells('B2:E2'); title_cell = ws_summary['B2']
-                title_cell.value = f"التقرير المالي {report_period}"; title_cell.font = title_font_excel; title_cell.fill = title_fill; title_cell.alignment = center_align; ws_summary.row_dimensions[2].height = 25
-
-                summary_data = { "إجمالي المداخيل": total_income, "إجمالي المصروفات": total_expense, "الرصيد الصافي": balance }
-                label_font = OpenpyxlFont(name='Calibri', size=12, bold=True)
-                value_font_green = OpenpyxlFont(name='Calibri', size=12, bold=True, color='00B050')
-                value_font_red = OpenpyxlFont(name='Calibri', size=12, bold=True, color='C00000')
-                value_font_blue = OpenpyxlFont(name='Calibri', size=12, bold=True, color='0070C0')
-                row_num = 5
-                ws_summary.merge_cells(f'C{row_num}:D{row_num}'); ws_summary.merge_cells(f'C{row_num+1}:D{row_num+1}'); ws_summary.merge_cells(f'C{row_num+2}:D{row_num+2}')
-                for label, value in summary_data.items():
-                    label_cell, value_cell = ws_summary[f'E{row_num}'], ws_summary[f'C{row_num}']
-                    label_cell.value = label; value_cell.value = f"{value:,.2f} د.ج"
-                    label_cell.font = label_font; label_cell.alignment = right_align; label_cell.border = thin_border
-                    value_cell.alignment = center_align; value_cell.border = thin_border; ws_summary[f'D{row_num}'].border = thin_border
-                    if "المداخيل" in label: value_cell.font = value_font_green
-                    elif "المصاريف" in label: value_cell.font = value_font_red
-                    else: value_cell.font = value_font_blue
-                    row_num += 1
-                ws_summary.column_dimensions['C'].width = 15; ws_summary.column_dimensions['D'].width = 15; ws_summary.column_dimensions['E'].width = 25
-
-                df_incomes_export.to_excel(writer, sheet_name='المداخيل', index=False, startrow=2)
-                df_expenses_export.to_excel(writer, sheet_name='المصاريف', index=False, startrow=2)
-
-                for sheet_name, title_text, df in [('المداخيل', 'قائمة المداخيل', df_incomes_export), ('المصاريف', 'قائمة المصاريف', df_expenses_export)]:
-                    ws = writer.book[sheet_name]; ws.sheet_view.rightToLeft = True
-                    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=df.shape[1] if not df.empty else 1)
-                    main_title_cell = ws.cell(row=1, column=1); main_title_cell.value = f"{title_text} {report_period}"; main_title_cell.font = title_font_excel; main_title_cell.fill = title_fill; main_title_cell.alignment = center_align; ws.row_dimensions[1].height = 22
-                    for c_idx, col_name in enumerate(df.columns, 1):
-                        header_cell = ws.cell(row=3, column=c_idx); header_cell.value = col_name; header_cell.font = header_font; header_cell.fill = header_fill; header_cell.border = thin_border; header_cell.alignment = center_align
-                    for r_idx in range(4, ws.max_row + 1):
-                        for c_idx in range(1, ws.max_column + 1):
-                            cell = ws.cell(row=r_idx, column=c_idx); cell.font = cell_font; cell.border = thin_border; cell.alignment = right_align
-                    for col in ws.columns:
-                        max_length = 0; column_letter = get_column_letter(col[0].column)
-                        for cell in col:
-                            if cell.value and len(str(cell.value)) > max_length: max_length = len(str(cell.value))
-                        adjusted_width = (max_length + 2) * 1.2
-                        ws.column_dimensions[column_letter].width = adjusted_width if adjusted_width > 12 else 12
+
+            income_columns = {'date': "التاريخ", 'payer': "الدافع/المصدر", 'description': "الوصف", 'category': "الفئة", 'amount': "المبلغ"}
+            expense_columns = {'date': "التاريخ", 'description': "الوصف", 'category': "الفئة", 'amount': "المبلغ"}
+            df_incomes_export = df_incomes[list(income_columns)].rename(columns=income_columns) if not df_incomes.empty else pd.DataFrame(columns=list(income_columns.values()))
+            df_expenses_export = df_expenses[list(expense_columns)].rename(columns=expense_columns) if not df_expenses.empty else pd.DataFrame(columns=list(expense_columns.values()))
+            if start_date and not df_incomes.empty:
+                # Period reports are handed to donors and auditors: show each amount in words, as on the receipts
+                df_incomes_export['المبلغ كتابة'] = tafqeet_many(df_incomes['amount'])
+
+            report_period = f"من {start_date} إلى {end_date}" if start_date and end_date else "لكامل الفترة"
+            ExcelReportWriter(report_period).save(filepath, total_income, total_expense, [
+                ('المداخيل', 'قائمة المداخيل', df_incomes_export),
+                ('المصاريف', 'قائمة المصاريف', df_expenses_export),
+            ])
 
             self.db.log_action(self.current_user, "تصدير تقرير Excel", f"الملف: {os.path.basename(filepath)}")
             messagebox.showinfo("نجاح", "تم إنشاء تقرير Excel بنجاح!", parent=self)
@@ -815,25 +1854,24 @@ class App(ctk.CTk):
             df_incomes = pd.read_excel(filepath, sheet_name='المداخيل', skiprows=2)
             df_expenses = pd.read_excel(filepath, sheet_name='المصاريف', skiprows=2)
 
-            def clean_currency(value):
-                if isinstance(value, str): return float(value.replace('د.ج', '').replace(',', '').strip())
-                return float(value)
-
-            df_incomes['المبلغ'] = df_incomes['المبلغ'].apply(clean_currency)
-            df_expenses['المبلغ'] = df_expenses['المبلغ'].apply(clean_currency)
-
             required_income_cols, required_expense_cols = ["التاريخ", "الدافع/المصدر", "الوصف", "الفئة", "المبلغ"], ["التاريخ", "الوصف", "الفئة", "المبلغ"]
             if not all(col in df_incomes.columns for col in required_income_cols) or not all(col in df_expenses.columns for col in required_expense_cols):
                  messagebox.showerror("خطأ في الملف", "ملف النسخة الاحتياطية غير صالح أو تالف.", parent=self); return
 
-            self.db.clear_all_transactions()
-            if os.path.exists(self.controller.attachments_dir): shutil.rmtree(self.controller.attachments_dir)
-            os.makedirs(self.controller.attachments_dir)
+            try:
+                income_rows = backup_sheet_to_rows(df_incomes, 'incomes')
+                expense_rows = backup_sheet_to_rows(df_expenses, 'expenses')
+            except ValueError as e:
+                messagebox.showerror("خطأ في الملف", f"{e}\n\nلم يتم تغيير أي بيانات.", parent=self); return
+
+            progress = ProgressDialog(self, "استعادة البيانات", "جاري استعادة البيانات...")
+            try:
+                self.db.restore_transactions(income_rows, expense_rows, progress_callback=progress.set_progress)
+            finally:
+                progress.destroy()
 
-            for _, row in df_incomes.iterrows():
-                self.db.add_transaction('incomes', {'amount': row['المبلغ'], 'date': str(row['التاريخ']).split(" ")[0], 'category': row['الفئة'], 'description': row['الوصف'], 'payer': row['الدافع/المصدر'], 'notes': '', 'attachment_path': None})
-            for _, row in df_expenses.iterrows():
-                self.db.add_transaction('expenses', {'amount': row['المبلغ'], 'date': str(row['التاريخ']).split(" ")[0], 'category': row['الفئة'], 'description': row['الوصف'], 'notes': '', 'attachment_path': None})
+            if os.path.exists(self.attachments_dir): shutil.rmtree(self.attachments_dir)
+            os.makedirs(self.attachments_dir)
 
             self.db.log_action(self.current_user, "استعادة نسخة احتياطية", f"الملف: {os.path.basename(filepath)}")
             messagebox.showinfo("نجاح", "تم استعادة البيانات بنجاح.", parent=self)
@@ -947,6 +1985,86 @@ class LoginWindow(ctk.CTkToplevel):
             self.destroy(); self.controller.handle_login(username, user_data['role'], user_data['must_change_password'])
         else: messagebox.showerror("خطأ", "اسم المستخدم أو كلمة المرور غير صحيحة.", parent=self)
 
+class DataVersionTracker:
+    """
+    يتذكر إصدارات الجداول التي تعرض الصفحة بياناتها حتى يتخطى on_show إعادة التحميل إذا لم يتغير شيء،
+    ويعيد تحميل الصفحة فوراً إذا تغير أحد جداولها وهي ظاهرة. الصفحات المخفية تُحدَّث عند عرضها التالي.
+    """
+    def __init__(self, frame, tables, reload, uses_period=False):
+        self.frame, self.tables, self.reload, self.uses_period = frame, tuple(tables), reload, uses_period
+        self.db = frame.controller.db
+        self.shown = None
+        self.db.subscribe(self.tables, self.on_change)
+
+    def current(self):
+        # A page filtered by the shared period is also stale once another period is chosen
+        versions = self.db.versions(*self.tables)
+        return versions + (self.frame.controller.period,) if self.uses_period else versions
+
+    def is_current(self):
+        return self.shown == self.current()
+
+    def mark_shown(self, versions):
+        self.shown = versions
+
+    def on_change(self, changed):
+        if not self.frame.winfo_exists():
+            self.db.unsubscribe(self.on_change)
+        elif self.frame.controller.visible_frame is self.frame:
+            self.reload()
+
+class PeriodSelector(ctk.CTkFrame):
+    """
+    قائمة اختيار الفترة المشتركة بين لوحة التحكم والتقارير وقوائم المداخيل والمصاريف:
+    اختيار فترة في أي صفحة يطبقها على جميع الصفحات، فلا يُقرأ إلا ما يقع داخلها.
+    """
+    ALL_HISTORY = "كامل الفترة"
+    CURRENT_MONTH = "الشهر الحالي"
+    LAST_12_MONTHS = "آخر 12 شهرًا"
+
+    def __init__(self, parent, controller):
+        super().__init__(parent, fg_color="transparent")
+        self.controller = controller
+        self.choice = ctk.CTkComboBox(self, width=170, justify="right", state="readonly", font=FontManager.INPUT_FONT, dropdown_font=FontManager.INPUT_FONT, command=self.on_select)
+        self.choice.pack(side="right", padx=5)
+        ctk.CTkLabel(self, text=":الفترة", font=FontManager.APP_FONT).pack(side="right")
+        self.refresh_choices()
+        self.show_period(controller.period_label)
+        controller.period_selectors.append(self)
+        controller.db.subscribe(("incomes", "expenses"), self.on_data_changed)
+
+    @classmethod
+    def presets(cls, years, today=None):
+        """{label: (start_date, end_date)}: whole history, this month, the last 12 months and each year with data."""
+        today = today or datetime.now().date()
+        month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+        first_of_year_ago = today.replace(month=1, day=1) if today.month == 12 else today.replace(year=today.year - 1, month=today.month + 1, day=1)
+        periods = {
+            cls.ALL_HISTORY: (None, None),
+            cls.CURRENT_MONTH: (today.replace(day=1).isoformat(), month_end.isoformat()),
+            cls.LAST_12_MONTHS: (first_of_year_ago.isoformat(), month_end.isoformat()),
+        }
+        for year in sorted(set(years) | {today.year}, reverse=True):
+            periods[f"سنة {year}"] = (f"{year:04d}-01-01", f"{year:04d}-12-31")
+        return periods
+
+    def refresh_choices(self):
+        self.periods = self.presets(self.controller.db.get_years())
+        self.choice.configure(values=list(self.periods))
+
+    def show_period(self, label):
+        self.choice.set(label)
+
+    def on_select(self, label):
+        self.controller.set_period(label, self.periods[label])
+
+    def on_data_changed(self, changed):
+        if not self.winfo_exists():
+            self.controller.db.unsubscribe(self.on_data_changed)
+            if self in self.controller.period_selectors: self.controller.period_selectors.remove(self)
+        else:
+            self.refresh_choices()
+
 class BaseDataFrame(ctk.CTkFrame):
     def __init__(self, parent, controller):
         super().__init__(parent, fg_color="transparent")
@@ -960,14 +2078,138 @@ class BaseDataFrame(ctk.CTkFrame):
         for col, head in zip(columns, headings):
             self.tree.heading(col, text=head, anchor='center'); self.tree.column(col, anchor='e', width=120)
         self.tree.grid(row=0, column=0, sticky="nsew")
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set); scrollbar.grid(row=0, column=1, sticky="ns")
+        self.tree_scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.tree_scrollbar.set); self.tree_scrollbar.grid(row=0, column=1, sticky="ns")
         return self.tree
 
+class LoadingIndicator:
+    """لافتة "جاري التحميل" تظهر فوق الصفحة أثناء انتظار نتيجة مهمة خلفية."""
+    def __init__(self, parent, text="جاري التحميل..."):
+        self.label = ctk.CTkLabel(parent, text=text, font=FontManager.H2_FONT, corner_radius=8, fg_color=("gray85", "gray20"))
+
+    def show(self):
+        self.label.place(relx=0.5, rely=0.5, anchor="center", relwidth=0.3, relheight=0.08)
+        self.label.lift()
+
+    def hide(self):
+        self.label.place_forget()
+
+class PagedTreeLoader:
+    """
+    يملأ جدول Treeview صفحة بصفحة (ترقيم بالمفتاح على (date, id)) كلما اقترب التمرير من نهاية الصفوف المحملة،
+    بدلاً من إدراج كل السجلات دفعة واحدة.
+    fetch_page(after, limit) تعيد دالة work(db) تُنفذ في خيط عامل عبر run_async(work, on_done).
+    عناصر الجدول معرّفة برقم السجل، و refresh() يطبق الفروق فقط (سجلات جديدة أو محذوفة أو تغير row_version).
+    """
+    def __init__(self, tree, scrollbar, fetch_page, make_values, run_async, on_page=None, page_size=200, prefetch_at=0.85):
+        self.tree, self.scrollbar = tree, scrollbar
+        self.fetch_page, self.make_values = fetch_page, make_values
+        self.run_async, self.on_page = run_async, on_page
+        self.page_size, self.prefetch_at = page_size, prefetch_at
+        self.last_key, self.exhausted, self.pending = None, False, False
+        self.versions = {}  # tree item id -> row_version of the row it shows
+        self.tree.configure(yscrollcommand=self.on_scroll)
+
+    def reset(self):
+        # A page still in flight is superseded by the new request and its rows are dropped
+        self.tree.delete(*self.tree.get_children())
+        self.last_key, self.exhausted, self.pending = None, False, False
+        self.versions = {}
+        self.load_next_page()
+
+    def refresh(self):
+        """Re-reads as many rows as are loaded and applies only the differences to the tree."""
+        if not self.versions:
+            self.reset()
+            return
+        count = max(len(self.versions), self.page_size)
+        self.pending = True
+        self.run_async(self.fetch_page(None, count), lambda rows: self.apply_changes(rows, count))
+
+    def apply_changes(self, rows, requested):
+        self.pending = False
+        wanted = [str(row['id']) for row in rows]
+        removed = self.versions.keys() - set(wanted)
+        if removed:
+            self.tree.delete(*removed)
+            for iid in removed: del self.versions[iid]
+        for index, (iid, row) in enumerate(zip(wanted, rows)):
+            version = row.get('row_version')
+            if iid not in self.versions:
+                self.tree.insert("", index, iid=iid, values=self.make_values(row))
+            elif self.versions[iid] != version:
+                self.tree.item(iid, values=self.make_values(row))
+            self.versions[iid] = version
+        if self.tree.get_children() != tuple(wanted):  # an edited date moved a row
+            for index, iid in enumerate(wanted):
+                self.tree.move(iid, "", index)
+        self.last_key = (rows[-1]['date'], rows[-1]['id']) if rows else None
+        self.exhausted = len(rows) < requested
+        if self.on_page:
+            self.on_page(rows)
+
+    def load_next_page(self):
+        if self.exhausted:
+            self.pending = False
+            return
+        self.pending = True
+        self.run_async(self.fetch_page(self.last_key, self.page_size), self.add_page)
+
+    def add_page(self, rows):
+        self.pending = False
+        for row in rows:
+            iid = str(row['id'])
+            self.tree.insert("", "end", iid=iid, values=self.make_values(row))
+            self.versions[iid] = row.get('row_version')
+        if rows:
+            self.last_key = (rows[-1]['date'], rows[-1]['id'])
+        self.exhausted = len(rows) < self.page_size
+        if self.on_page:
+            self.on_page(rows)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if not self.exhausted and not self.pending and float(last) >= self.prefetch_at:
+            self.load_next_page()
+
+class RowCache:
+    """
+    نسخة من السجلات الكاملة مفهرسة بالمعرف، تُملأ من الصفحات المحملة في الجدول
+    حتى لا يتطلب تحديد صف أو تعديله استعلاماً جديداً من قاعدة البيانات.
+    """
+    def __init__(self, load_row):
+        self.load_row = load_row
+        self.rows = {}
+        self.hits = self.misses = 0
+
+    def put_many(self, rows):
+        for row in rows:
+            self.rows[row['id']] = dict(row)
+
+    def get(self, record_id):
+        row = self.rows.get(record_id)
+        if row is not None:
+            self.hits += 1
+            return row
+        self.misses += 1
+        loaded = self.load_row(record_id)
+        if loaded is None:
+            return None
+        self.rows[record_id] = dict(loaded)
+        return self.rows[record_id]
+
+    def invalidate(self, record_id=None):
+        if record_id is None: self.rows.clear()
+        else: self.rows.pop(record_id, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.rows)}
+
 class TransactionFrame(BaseDataFrame):
     def __init__(self, parent, controller):
         super().__init__(parent, controller)
-        self.all_data = []
+        self.search_job = None
+        self.row_cache = RowCache(lambda record_id: self.db.get_transaction_by_id(self.table_name, record_id))
         self.setup_ui()
 
     def setup_ui(self):
@@ -980,11 +2222,16 @@ class TransactionFrame(BaseDataFrame):
         if self.is_admin:
             ctk.CTkButton(self.button_panel, text="تعديل", image=self.controller.icons.get("edit"), compound="right", command=self.edit_selected_item, font=FontManager.BUTTON_FONT).pack(side="left", padx=5)
             ctk.CTkButton(self.button_panel, text="حذف", image=self.controller.icons.get("delete"), compound="right", command=self.delete_selected_item, fg_color="#D2042D", hover_color="#990000", font=FontManager.BUTTON_FONT).pack(side="left", padx=5)
+        PeriodSelector(top_frame, self.controller).pack(side="left", padx=5, pady=10)
         search_frame = ctk.CTkFrame(top_frame, fg_color="transparent"); search_frame.pack(side="left", padx=20, pady=10, expand=True, fill="x")
         self.search_entry = ctk.CTkEntry(search_frame, placeholder_text="ابحث هنا...", font=FontManager.INPUT_FONT, width=300); self.search_entry.pack(side="right", fill="x", expand=True)
         self.search_entry.bind("<KeyRelease>", self.filter_table)
         ctk.CTkLabel(search_frame, text="", image=self.controller.icons.get("search")).pack(side="right", padx=5)
         self.tree = self.setup_treeview(self.get_columns(), self.get_headings()); self.configure_tree_columns(); self.tree.bind("<<TreeviewSelect>>", self.on_item_select)
+        self.loading = LoadingIndicator(self)
+        self.loaded_search, self.loading_versions = None, None
+        self.data_versions = DataVersionTracker(self, (self.table_name,), self.reload, uses_period=True)
+        self.loader = PagedTreeLoader(self.tree, self.tree_scrollbar, self.fetch_data, self.get_row_values, run_async=self.run_page_task, on_page=self.on_page_loaded)
 
     def configure_tree_columns(self):
         self.tree.column("id", width=60, anchor='center'); self.tree.column("amount", width=150, anchor='center'); self.tree.column("description", width=350); self.tree.column("attachment", width=80, anchor='center')
@@ -999,31 +2246,67 @@ class TransactionFrame(BaseDataFrame):
             self.attachment_button.configure(state="disabled")
             return
         item_id = self.get_id_from_tree_values(item_values)
-        full_data = self.db.get_transaction_by_id(self.table_name, item_id)
-        attachment_path = full_data['attachment_path'] if full_data else None
-        self.attachment_button.configure(state="normal" if attachment_path and os.path.exists(attachment_path) else "disabled")
+        full_data = self.row_cache.get(item_id)
+        self.attachment_button.configure(state="normal" if full_data and full_data['has_attachment'] else "disabled")
 
     def view_attachment(self):
         selected_id = self.get_selected_id()
         if not selected_id: return
-        full_data = self.db.get_transaction_by_id(self.table_name, selected_id)
+        full_data = self.row_cache.get(selected_id)
         attachment_path = full_data['attachment_path'] if full_data else None
-        if attachment_path and os.path.exists(attachment_path): AttachmentViewer(self, attachment_path)
+        if attachment_path and os.path.exists(attachment_path):
+            # The viewer-size copy made at attach time; files that are not images fall back to the original
+            AttachmentViewer(self, self.controller.attachments.derivative(attachment_path, "view", full_data.get('attachment_hash')) or attachment_path)
         else: messagebox.showwarning("تنبيه", "لا يوجد مرفق لهذه المعاملة أو أن الملف مفقود.", parent=self)
 
+    def release_attachment(self, full_data):
+        """Deletes a removed transaction's attachment unless another transaction shares the same file."""
+        attachment_path = full_data.get('attachment_path') if full_data else None
+        if not attachment_path:
+            return
+        digest = full_data.get('attachment_hash')
+        if digest is None or not self.db.attachment_references(digest):
+            self.controller.attachments.remove(attachment_path, digest)
+
     def on_show(self):
-        self.fetch_data(); self.populate_table(self.all_data); self.search_entry.delete(0, 'end'); self.attachment_button.configure(state="disabled")
+        self.search_entry.delete(0, 'end')
+        if self.data_versions.is_current() and self.loaded_search is None:
+            return  # the unfiltered list on screen is still up to date
+        self.reload()
+
+    def reload(self):
+        self.loaded_search, self.loading_versions = self.search_entry.get().strip() or None, self.data_versions.current()
+        self.row_cache.invalidate(); self.attachment_button.configure(state="disabled")
+        self.loading.show(); self.loader.reset()
+
+    def fetch_data(self, after, limit):
+        # Read the widgets here, on the Tk thread; only the returned work runs on a worker
+        table_name, search_term, (start_date, end_date) = self.table_name, self.search_entry.get().strip() or None, self.controller.period
+        return lambda db: [dict(row) for row in db.get_transactions_page(table_name, after=after, limit=limit, search=search_term, start_date=start_date, end_date=end_date)]
+
+    def run_page_task(self, work, on_done):
+        self.controller.tasks.submit(self, "page", work, on_done, on_error=self.on_load_error)
 
-    def fetch_data(self):
-        self.all_data = self.db.get_transactions(self.table_name)
+    def on_page_loaded(self, rows):
+        self.row_cache.put_many(rows)
+        self.data_versions.mark_shown(self.loading_versions)
+        self.loading.hide()
+
+    def on_load_error(self, error):
+        self.loading.hide()
+        messagebox.showerror("خطأ", f"فشل تحميل البيانات:\n{error}", parent=self)
+
+    SEARCH_DEBOUNCE_MS = 300
 
     def filter_table(self, event=None):
-        search_term = self.search_entry.get().lower()
-        if not search_term:
-            self.populate_table(self.all_data)
-            return
-        filtered_data = [dict(row) for row in self.all_data if any(search_term in str(field).lower() for field in dict(row).values())]
-        self.populate_table(filtered_data)
+        # Wait for a pause in typing instead of querying on every key press
+        if self.search_job:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(self.SEARCH_DEBOUNCE_MS, self.run_search)
+
+    def run_search(self):
+        self.search_job = None
+        self.reload()
 
     def get_id_from_tree_values(self, values):
         return values[-1]
@@ -1042,8 +2325,12 @@ class IncomeFrame(TransactionFrame):
     def __init__(self, parent, controller):
         self.table_name = 'incomes'
         super().__init__(parent, controller)
-        self.print_button = ctk.CTkButton(self.button_panel, text="إنشاء وصل (Word)", image=self.controller.icons.get("print"), compound="right", command=self.print_receipt, font=FontManager.BUTTON_FONT, state="disabled")
+        self.print_button = ctk.CTkButton(self.button_panel, text="إنشاء وصل (PDF/Word)", image=self.controller.icons.get("print"), compound="right", command=self.print_receipt, font=FontManager.BUTTON_FONT, state="disabled")
         self.print_button.pack(side="left", padx=5)
+        self.batch_button = ctk.CTkButton(self.button_panel, text="وصولات دفعة", image=self.controller.icons.get("print"), compound="right", command=self.print_batch_receipts, font=FontManager.BUTTON_FONT)
+        self.batch_button.pack(side="left", padx=5)
+        self.tree.configure(selectmode="extended")  # several selected incomes can be printed as one batch
+        self.pdf_renderer = None  # (settings, PdfReceiptRenderer): building the page costs more than drawing a receipt
 
     def on_item_select(self, event=None):
         super().on_item_select(event)
@@ -1054,75 +2341,72 @@ class IncomeFrame(TransactionFrame):
     def get_headings(self): return ("مرفق", "الوصف", "الدافع", "الفئة", "التاريخ", "المبلغ", "المعرف")
     def configure_tree_columns(self): super().configure_tree_columns(); self.tree.column("payer", width=200)
 
-    def populate_table(self, data):
-        self.tree.delete(*self.tree.get_children())
-        for row in data:
-            inc = dict(row)
-            has_attachment = "نعم" if inc.get('attachment_path') and os.path.exists(inc['attachment_path']) else "لا"
-            amount_str = f"{inc.get('amount', 0):,.2f}\u200e د.ج"
-            values = (has_attachment, inc.get('description', ''), inc.get('payer', ''), inc.get('category', ''), inc.get('date', ''), amount_str, inc.get('id', ''))
-            self.tree.insert("", "end", values=values)
+    def get_row_values(self, inc):
+        has_attachment = "نعم" if inc['has_attachment'] else "لا"
+        amount_str = f"{inc['amount']:,.2f}\u200e د.ج"
+        return (has_attachment, inc['description'], inc['payer'], inc['category'], inc['date'], amount_str, inc['id'])
 
     def add_new_item(self):
         dialog = DataEntryDialog(self, title="إضافة مدخول جديد", fields=self.get_income_fields(), db=self.db, table_type="income")
         data = dialog.get_data()
         if data:
-            new_id = self.db.add_transaction("incomes", data)
-            self.db.log_action(self.controller.current_user, "إضافة مدخول", f"المبلغ: {data['amount']}")
-            self.on_show()
+            with self.db.transaction():
+                new_id = self.db.add_transaction("incomes", data)
+                self.db.log_action(self.controller.current_user, "إضافة مدخول", f"المبلغ: {data['amount']}")
             if messagebox.askyesno("إنشاء وصل", "تم حفظ المدخول بنجاح. هل تريد إنشاء وصل الآن؟", parent=self):
-                income_data = self.db.get_transaction_by_id('incomes', new_id)
+                income_data = self.row_cache.get(new_id)
                 if income_data:
                     self.print_receipt_for_data(income_data)
 
     def edit_selected_item(self):
         income_id = self.get_selected_id()
         if not income_id: return
-        full_data = self.db.get_transaction_by_id(self.table_name, income_id)
+        full_data = self.row_cache.get(income_id)
         if not full_data: return
         dialog = DataEntryDialog(self, title="تعديل مدخول", fields=self.get_income_fields(), initial_data=dict(full_data), db=self.db, table_type="income")
         updated_data = dialog.get_data()
         if updated_data:
-            self.db.update_transaction("incomes", income_id, updated_data)
-            self.db.log_action(self.controller.current_user, "تعديل مدخول", f"معرف: {income_id}")
-            self.on_show()
+            with self.db.transaction():
+                self.db.update_transaction("incomes", income_id, updated_data)
+                self.db.log_action(self.controller.current_user, "تعديل مدخول", f"معرف: {income_id}")
+            self.row_cache.invalidate(income_id)
 
     def delete_selected_item(self):
         income_id = self.get_selected_id()
         if not income_id: return
         if messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذا المدخول؟", icon='warning', parent=self):
-            full_data = self.db.get_transaction_by_id(self.table_name, income_id)
-            if full_data and full_data.get('attachment_path') and os.path.exists(full_data['attachment_path']):
-                try:
-                    os.remove(full_data['attachment_path'])
-                except OSError as e:
-                    print(f"Error deleting attachment: {e}")
-            self.db.delete_transaction("incomes", income_id)
-            self.db.log_action(self.controller.current_user, "حذف مدخول", f"معرف: {income_id}")
-            self.on_show()
+            full_data = self.row_cache.get(income_id)
+            with self.db.transaction():
+                self.db.delete_transaction("incomes", income_id)
+                self.db.log_action(self.controller.current_user, "حذف مدخول", f"معرف: {income_id}")
+            self.release_attachment(full_data)
+            self.row_cache.invalidate(income_id)
 
     def print_receipt(self):
         income_id = self.get_selected_id()
         if not income_id: return
-        income_data = self.db.get_transaction_by_id('incomes', income_id)
+        income_data = self.row_cache.get(income_id)
         if income_data:
             self.print_receipt_for_data(income_data)
 
     def print_receipt_for_data(self, data):
         receipt_id = data['id'] if data else 'N/A'
         filepath = filedialog.asksaveasfilename(
-            defaultextension=".docx",
-            filetypes=[("Word Document", "*.docx")],
-            title="حفظ وصل Word",
-            initialfile=f"وصل_رقم_{receipt_id}.docx"
+            defaultextension=".pdf",
+            filetypes=[("PDF", "*.pdf"), ("Word Document", "*.docx")],
+            title="حفظ الوصل",
+            initialfile=f"وصل_رقم_{receipt_id}.pdf"
         )
         if not filepath:
             return
 
         try:
             settings = self.controller.db.get_all_settings()
-            generator = WordReceiptGenerator(dict(data), settings)
-            generator.save(filepath)
+            if filepath.lower().endswith(".pdf"):
+                self.get_pdf_renderer(settings).save(WordReceiptGenerator.receipt_fields(dict(data)), filepath)
+            else:
+                generator = WordReceiptGenerator(dict(data), settings)
+                generator.save(filepath)
 
             messagebox.showinfo("نجاح", f"تم حفظ الوصل في:\n{filepath}\nسيتم الآن فتح الملف.", parent=self)
 
@@ -1137,6 +2421,56 @@ class IncomeFrame(TransactionFrame):
             messagebox.showerror("خطأ", f"فشل إنشاء أو فتح ملف الوصل:\n{e}", parent=self)
 
 
+    def get_pdf_renderer(self, settings):
+        if self.pdf_renderer is None or self.pdf_renderer[0] != settings:
+            self.pdf_renderer = (settings, PdfReceiptRenderer(settings))
+        return self.pdf_renderer[1]
+
+    def print_batch_receipts(self):
+        # Selected rows (one or more) print those incomes; with nothing selected, every income of the selected period
+        ids = [self.get_id_from_tree_values(self.tree.item(item)["values"]) for item in self.tree.selection()]
+        ids = ids if ids else None
+        start_date, end_date = self.controller.period
+        if ids:
+            scope = "المدخول المحدد" if len(ids) == 1 else f"{len(ids)} مداخيل محددة"
+        else:
+            scope = f"جميع مداخيل الفترة: {self.controller.period_label}"
+        merged = messagebox.askyesnocancel("وصولات دفعة", f"إنشاء وصولات لـ {scope}.\n\nنعم: ملف واحد مدمج\nلا: ملف منفصل لكل وصل في مجلد", parent=self)
+        if merged is None:
+            return
+        # Both outputs ask for the format the same way, before choosing where to save
+        file_format = "pdf" if messagebox.askyesno("صيغة الوصولات", "حفظ الوصولات بصيغة PDF؟\n(لا: بصيغة Word)", parent=self) else "docx"
+        if merged:
+            file_type = ("PDF", "*.pdf") if file_format == "pdf" else ("Word Document", "*.docx")
+            target = filedialog.asksaveasfilename(defaultextension=f".{file_format}", filetypes=[file_type], title="حفظ الوصولات المدمجة", initialfile=f"وصولات_{datetime.now().strftime('%Y-%m-%d')}.{file_format}", parent=self)
+        else:
+            target = filedialog.askdirectory(title="اختيار مجلد الوصولات", initialdir=self.controller.receipts_dir, parent=self)
+        if not target:
+            return
+
+        settings = self.db.get_all_settings()
+        def work(db):
+            rows = db.get_receipt_rows(ids, start_date, end_date)
+            if rows:
+                writer = BatchReceiptWriter(settings, file_format=file_format)
+                writer.write_merged(rows, target) if merged else writer.write_folder(rows, target)
+            return len(rows)
+        self.loading.show()
+        self.batch_button.configure(state="disabled")
+        self.controller.tasks.submit(self.controller, "batch-receipts", work, lambda count: self.on_batch_done(count, target), on_error=self.on_batch_error)
+
+    def on_batch_done(self, count, target):
+        self.loading.hide(); self.batch_button.configure(state="normal")
+        if not count:
+            messagebox.showinfo("وصولات دفعة", "لا توجد مداخيل لإنشاء وصولات لها.", parent=self)
+            return
+        self.db.log_action(self.controller.current_user, "إنشاء وصولات دفعة", f"العدد: {count} - {os.path.basename(target)}")
+        messagebox.showinfo("نجاح", f"تم إنشاء {count} وصل في:\n{target}", parent=self)
+
+    def on_batch_error(self, error):
+        self.loading.hide(); self.batch_button.configure(state="normal")
+        messagebox.showerror("خطأ", f"فشل إنشاء الوصولات:\n{error}", parent=self)
+
     def get_income_fields(self): return {"amount": {"label": "المبلغ (د.ج)", "type": "number", "required": True}, "date": {"label": "التاريخ", "type": "date", "required": True}, "category": {"label": "الفئة", "type": "combo", "required": True}, "payer": {"label": "اسم الدافع/المتبرع", "type": "text", "required": True}, "description": {"label": "الوصف", "type": "text"}, "notes": {"label": "ملاحظات", "type": "textarea"}}
 
 class ExpenseFrame(TransactionFrame):
@@ -1148,47 +2482,41 @@ class ExpenseFrame(TransactionFrame):
     def get_columns(self): return ("attachment", "description", "category", "date", "amount", "id")
     def get_headings(self): return ("مرفق", "الوصف", "الفئة", "التاريخ", "المبلغ", "المعرف")
 
-    def populate_table(self, data):
-        self.tree.delete(*self.tree.get_children())
-        for row in data:
-            exp = dict(row)
-            has_attachment = "نعم" if exp.get('attachment_path') and os.path.exists(exp['attachment_path']) else "لا"
-            amount_str = f"{exp.get('amount', 0):,.2f}\u200e د.ج"
-            values = (has_attachment, exp.get('description',''), exp.get('category',''), exp.get('date',''), amount_str, exp.get('id',''))
-            self.tree.insert("", "end", values=values)
+    def get_row_values(self, exp):
+        has_attachment = "نعم" if exp['has_attachment'] else "لا"
+        amount_str = f"{exp['amount']:,.2f}\u200e د.ج"
+        return (has_attachment, exp['description'], exp['category'], exp['date'], amount_str, exp['id'])
 
     def add_new_item(self):
         dialog = DataEntryDialog(self, title="إضافة مصروف جديد", fields=self.get_expense_fields(), db=self.db, table_type="expense"); data = dialog.get_data()
         if data:
-            self.db.add_transaction("expenses", data)
-            self.db.log_action(self.controller.current_user, "إضافة مصروف", f"المبلغ: {data['amount']}")
-            self.on_show()
+            with self.db.transaction():
+                self.db.add_transaction("expenses", data)
+                self.db.log_action(self.controller.current_user, "إضافة مصروف", f"المبلغ: {data['amount']}")
 
     def edit_selected_item(self):
         expense_id = self.get_selected_id()
         if not expense_id: return
-        full_data = self.db.get_transaction_by_id(self.table_name, expense_id)
+        full_data = self.row_cache.get(expense_id)
         if not full_data: return
         dialog = DataEntryDialog(self, title="تعديل مصروف", fields=self.get_expense_fields(), initial_data=dict(full_data), db=self.db, table_type="expense")
         updated_data = dialog.get_data()
         if updated_data:
-            self.db.update_transaction("expenses", expense_id, updated_data)
-            self.db.log_action(self.controller.current_user, "تعديل مصروف", f"معرف: {expense_id}")
-            self.on_show()
+            with self.db.transaction():
+                self.db.update_transaction("expenses", expense_id, updated_data)
+                self.db.log_action(self.controller.current_user, "تعديل مصروف", f"معرف: {expense_id}")
+            self.row_cache.invalidate(expense_id)
 
     def delete_selected_item(self):
         expense_id = self.get_selected_id()
         if not expense_id: return
         if messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذا المصروف؟", icon='warning', parent=self):
-            full_data = self.db.get_transaction_by_id(self.table_name, expense_id)
-            if full_data and full_data.get('attachment_path') and os.path.exists(full_data['attachment_path']):
-                try:
-                    os.remove(full_data['attachment_path'])
-                except OSError as e:
-                    print(f"Error deleting attachment: {e}")
-            self.db.delete_transaction("expenses", expense_id)
-            self.db.log_action(self.controller.current_user, "حذف مصروف", f"معرف: {expense_id}")
-            self.on_show()
+            full_data = self.row_cache.get(expense_id)
+            with self.db.transaction():
+                self.db.delete_transaction("expenses", expense_id)
+                self.db.log_action(self.controller.current_user, "حذف مصروف", f"معرف: {expense_id}")
+            self.release_attachment(full_data)
+            self.row_cache.invalidate(expense_id)
 
     def get_expense_fields(self): return {"amount": {"label": "المبلغ (د.ج)", "type": "number", "required": True}, "date": {"label": "التاريخ", "type": "date", "required": True}, "category": {"label": "الفئة", "type": "combo", "required": True}, "description": {"label": "الوصف", "type": "text"}, "notes": {"label": "ملاحظات", "type": "textarea"}}
 
@@ -1206,6 +2534,7 @@ class DataEntryDialog(ctk.CTkToplevel):
 
         self.fields, self.db, self.table_type, self.entries, self.data = fields, db, table_type, {}, None
         self.attachment_path = initial_data.get('attachment_path') if initial_data else None
+        self.attachment_meta = {column: initial_data.get(column) for column in DatabaseManager.ATTACHMENT_COLUMNS} if initial_data else {}
         self.thumbnail_image = None
 
         main_frame = ctk.CTkScrollableFrame(self)
@@ -1262,19 +2591,21 @@ class DataEntryDialog(ctk.CTkToplevel):
         if filepath:
             try:
                 filename = os.path.basename(filepath)
-                dest_path = os.path.join(self.master.controller.attachments_dir, f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}")
-                shutil.copy(filepath, dest_path)
-                self.attachment_path = dest_path
+                self.attachment_meta = self.master.controller.attachments.add(filepath)
+                self.attachment_path = self.attachment_meta.pop('attachment_path')
                 self.attachment_label.configure(text=filename)
                 self.show_thumbnail()
             except Exception as e:
                 messagebox.showerror("خطأ", f"فشل نسخ الملف: {e}", parent=self)
-                self.attachment_path = None
+                self.attachment_path, self.attachment_meta = None, {}
 
     def show_thumbnail(self):
         if self.attachment_path and os.path.exists(self.attachment_path):
             try:
-                img = Image.open(self.attachment_path); img.thumbnail((150, 150))
+                thumbnail_path = self.master.controller.attachments.derivative(self.attachment_path, "thumb", self.attachment_meta.get('attachment_hash'))
+                if thumbnail_path is None:
+                    raise ValueError("not an image")
+                img = Image.open(thumbnail_path); img.load()
                 self.thumbnail_image = ctk.CTkImage(light_image=img, dark_image=img, size=(img.width, img.height))
                 self.thumbnail_label.configure(image=self.thumbnail_image, text="")
             except Exception:
@@ -1318,6 +2649,7 @@ class DataEntryDialog(ctk.CTkToplevel):
                     return
             self.data[key] = value
         self.data['attachment_path'] = self.attachment_path
+        self.data.update(self.attachment_meta)
         if 'payer' not in self.data: self.data['payer'] = ''
         if 'notes' not in self.data: self.data['notes'] = ''
         self.destroy()
@@ -1329,6 +2661,24 @@ class DataEntryDialog(ctk.CTkToplevel):
     def get_data(self):
         return self.data
 
+class ProgressDialog(ctk.CTkToplevel):
+    def __init__(self, parent, title, message):
+        super().__init__(parent)
+        self.title(title); self.geometry("400x130"); self.resizable(False, False); self.transient(parent)
+        self.protocol("WM_DELETE_WINDOW", lambda: None)
+        self.message_label = ctk.CTkLabel(self, text=message, font=FontManager.APP_FONT)
+        self.message_label.pack(pady=(20, 10), padx=20)
+        self.progress_bar = ctk.CTkProgressBar(self, width=340)
+        self.progress_bar.pack(pady=10, padx=20)
+        self.progress_bar.set(0)
+        self.grab_set()
+        self.update_idletasks()
+
+    def set_progress(self, done, total):
+        self.progress_bar.set(done / total if total else 1)
+        self.message_label.configure(text=f"{done:,} / {total:,}")
+        self.update_idletasks()
+
 class AttachmentViewer(ctk.CTkToplevel):
     def __init__(self, parent, image_path):
         super().__init__(parent); self.title("عرض المرفق")
@@ -1343,6 +2693,406 @@ class AttachmentViewer(ctk.CTkToplevel):
             self.geometry("300x100"); ctk.CTkLabel(self, text=f"لا يمكن فتح الصورة.\n{e}", font=FontManager.APP_FONT).pack(pady=20, padx=20)
         self.grab_set(); self.focus()
 
+# =================================================================
+# مخزن المرفقات (AttachmentStore)
+# =================================================================
+class AttachmentStore:
+    """
+    يحفظ المرفقات باسم بصمة محتواها SHA-256، فلا يُخزَّن الملف نفسه مرتين مهما أُرفق.
+    عند الإرفاق تُنشأ مرة واحدة صورة مصغرة وصورة بحجم العارض، فلا يُفك ترميز الصورة الأصلية عند العرض.
+    """
+    THUMBNAIL_SIZE = (150, 150)
+    VIEWER_SIZE = (800, 600)
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.derived_dir = os.path.join(root_dir, "derived")
+        self._legacy_hashes = {}  # path -> content hash of files attached before the store
+
+    @classmethod
+    def file_hash(cls, path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(cls.CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def describe(cls, path):
+        """The DatabaseManager.ATTACHMENT_COLUMNS values of a file; the dimensions come from the image header (None if not an image)."""
+        width = height = None
+        try:
+            with Image.open(path) as image:
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            pass
+        return {"attachment_hash": cls.file_hash(path), "attachment_size": os.path.getsize(path), "attachment_width": width, "attachment_height": height}
+
+    def original_path(self, digest, extension):
+        return os.path.join(self.root_dir, digest[:2], f"{digest}{extension.lower()}")
+
+    def derivative_path(self, digest, kind):
+        return os.path.join(self.derived_dir, digest[:2], f"{digest}_{kind}.{'png' if kind == 'thumb' else 'jpg'}")
+
+    def add(self, source_path):
+        """Stores source_path (once per content) and its derivatives; returns attachment_path plus the metadata columns."""
+        meta = self.describe(source_path)
+        path = self.original_path(meta["attachment_hash"], os.path.splitext(source_path)[1])
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, path)  # never a half-copied file under the final name
+        self.make_derivatives(path, meta["attachment_hash"])
+        return {"attachment_path": path, **meta}
+
+    def make_derivatives(self, path, digest):
+        """Decodes the original once to write the viewer and thumbnail images; False if it is not an image."""
+        try:
+            with Image.open(path) as image:
+                image.draft("RGB", self.VIEWER_SIZE)  # JPEG: decode straight at a reduced scale
+                if image.mode in ("RGBA", "LA", "P"):
+                    image = image.convert("RGBA")
+                    view = Image.new("RGB", image.size, "white")
+                    view.paste(image, mask=image.getchannel("A"))
+                else:
+                    view = image.convert("RGB")
+        except (OSError, Image.DecompressionBombError):
+            return False
+        view.thumbnail(self.VIEWER_SIZE, Image.Resampling.LANCZOS)
+        thumbnail = view.copy()
+        thumbnail.thumbnail(self.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        view_path, thumbnail_path = self.derivative_path(digest, "view"), self.derivative_path(digest, "thumb")
+        os.makedirs(os.path.dirname(view_path), exist_ok=True)
+        view.save(view_path, "JPEG", quality=90)
+        thumbnail.save(thumbnail_path, "PNG")
+        return True
+
+    def derivative(self, attachment_path, kind, digest=None):
+        """Path of the "thumb" or "view" image of an attachment, or None if it is missing or not an image."""
+        if not attachment_path or not os.path.exists(attachment_path):
+            return None
+        if digest is None:
+            if attachment_path not in self._legacy_hashes:
+                self._legacy_hashes[attachment_path] = self.file_hash(attachment_path)
+            digest = self._legacy_hashes[attachment_path]
+        path = self.derivative_path(digest, kind)
+        if os.path.exists(path) or self.make_derivatives(attachment_path, digest):  # older files: made on first view, once
+            return path
+        return None
+
+    def remove(self, attachment_path, digest=None):
+        """Deletes an attachment and its derivatives; the caller checks that no transaction still refers to it."""
+        paths = [attachment_path] + ([self.derivative_path(digest, kind) for kind in ("view", "thumb")] if digest else [])
+        for path in paths:
+            try:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"Error deleting attachment: {e}")
+
+# =================================================================
+# إدارة الرسوم البيانية (ChartManager)
+# =================================================================
+def data_fingerprint(*parts):
+    """Content hash of query rows or DataFrames, used as a chart's data version."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if part is None:
+            digest.update(b"-")
+        elif hasattr(part, "to_numpy"):  # DataFrame or Series
+            digest.update(pd.util.hash_pandas_object(part).to_numpy().tobytes())
+        else:
+            digest.update(repr([tuple(row) for row in part]).encode())
+    return digest.hexdigest()
+
+class ChartPanel:
+    """
+    رسم بياني دائم: الشكل (Figure) ولوحة Tk يُنشآن مرة واحدة، ثم تُحدث عناصر الرسم في مكانها
+    (set_data للخطوط وارتفاعات الأعمدة) بدلاً من هدم اللوحة وإنشاء شكل جديد في كل عرض.
+    """
+    def __init__(self, master, figsize=(6, 4)):
+        self.figure = mpl_figure.Figure(figsize=figsize)  # not pyplot: no global registry to leak figures into
+        self.ax = self.figure.add_subplot()
+        self.canvas = backend_tkagg.FigureCanvasTkAgg(self.figure, master=master)
+        self.widget = self.canvas.get_tk_widget()
+        self.version, self.theme = None, None
+        self.artists = {}
+        self.render_stats = None
+
+    def update(self, version, theme, draw):
+        """Runs draw(panel) and repaints, unless neither the data version nor the colours changed."""
+        if version == self.version and theme == self.theme:
+            return False
+        shaping, started = format_arabic_stats(), time.perf_counter()
+        if theme != self.theme:
+            self.apply_theme(*theme)
+        draw(self)
+        self.version, self.theme = version, theme
+        self.figure.tight_layout()
+        self.canvas.draw_idle()
+        # Profiling counters of the last render, including the Arabic shaping the cache avoided
+        self.render_stats = {"build_ms": (time.perf_counter() - started) * 1000, **format_arabic_stats(since=shaping)}
+        return True
+
+    def apply_theme(self, bg_color, text_color):
+        self.figure.patch.set_facecolor(bg_color)
+        self.ax.set_facecolor(bg_color)
+        self.ax.tick_params(colors=text_color, which='both')
+        self.ax.xaxis.label.set_color(text_color)
+        self.ax.yaxis.label.set_color(text_color)
+        self.ax.title.set_color(text_color)
+        for spine in self.ax.spines.values():
+            spine.set_edgecolor(text_color)
+
+    def set_bars(self, labels, series, colors):
+        """Grouped bars, one group per label; while the labels are unchanged only the heights are updated."""
+        key = (tuple(labels), tuple(series))
+        if self.artists.get("bars_key") == key:
+            for container, values in zip(self.artists["bars"], series.values()):
+                for rect, height in zip(container, values):
+                    rect.set_height(height)
+        else:
+            for container in self.artists.pop("bars", []):
+                container.remove()
+            x = np.arange(len(labels))
+            width = 0.8 / len(series)
+            self.artists["bars"] = [
+                self.ax.bar(x + (i - (len(series) - 1) / 2) * width, values, width, color=color, label=name)
+                for i, ((_, values), color, name) in enumerate(zip(series.items(), colors, format_arabic_many(series)))
+            ]
+            self.ax.set_xticks(x, format_arabic_many(labels))
+            self.artists["bars_key"] = key
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+    def set_line(self, name, x, y, fill_alpha=None, **style):
+        line = self.artists.get(name)
+        if line is None:
+            line, = self.ax.plot(x, y, **style)
+            self.artists[name] = line
+        else:
+            line.set_data(x, y)
+            line.set_visible(True)
+        if fill_alpha is not None:
+            old_fill = self.artists.pop(f"{name}_fill", None)
+            if old_fill is not None:
+                old_fill.remove()
+            self.artists[f"{name}_fill"] = self.ax.fill_between(x, y, color=style.get('color'), alpha=fill_alpha)
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+    def set_band(self, name, x, lower, upper, **style):
+        """A shaded range such as a prediction interval; fill_between cannot be updated in place, so it is replaced."""
+        old_band = self.artists.pop(name, None)
+        if old_band is not None:
+            old_band.remove()
+        self.artists[name] = self.ax.fill_between(x, lower, upper, **style)
+
+    def hide_line(self, name):
+        if name in self.artists:
+            self.artists[name].set_visible(False)
+
+    def set_message(self, text):
+        """A centred note such as "not enough data"; None hides it."""
+        message = self.artists.get("message")
+        if message is None:
+            message = self.ax.text(0.5, 0.5, "", horizontalalignment='center', verticalalignment='center', transform=self.ax.transAxes, fontproperties=FontManager.get_matplotlib_font_prop('Regular', 12))
+            self.artists["message"] = message
+        message.set_text(format_arabic(text) if text else "")
+
+    def set_labels(self, title, xlabel, ylabel, rotation=30, legend=False):
+        title_prop = FontManager.get_matplotlib_font_prop('Bold', 14)
+        label_prop = FontManager.get_matplotlib_font_prop('Regular', 12)
+        tick_prop = FontManager.get_matplotlib_font_prop('Regular', 10)
+        self.ax.set_title(format_arabic(title), fontproperties=title_prop)
+        self.ax.set_xlabel(format_arabic(xlabel), fontproperties=label_prop)
+        self.ax.set_ylabel(format_arabic(ylabel), fontproperties=label_prop)
+        if legend:
+            self.ax.legend(prop=FontManager.get_matplotlib_font_prop('Regular', 10))
+        for label in self.ax.get_xticklabels():
+            label.set_fontproperties(tick_prop)
+            label.set_rotation(rotation)
+            label.set_horizontalalignment('right')
+        for label in self.ax.get_yticklabels():
+            label.set_fontproperties(tick_prop)
+
+class ChartManager:
+    """يحتفظ بلوحة ChartPanel واحدة لكل رسم بياني في الصفحة ويزودها بألوان المظهر الحالي."""
+    def __init__(self, owner):
+        self.owner = owner  # widget used to resolve theme colour names
+        self.panels = {}
+
+    def panel(self, name, master, figsize=(6, 4)):
+        if name not in self.panels:
+            self.panels[name] = ChartPanel(master, figsize)
+        return self.panels[name]
+
+    def theme_colors(self):
+        is_dark = ctk.get_appearance_mode() == "Dark"
+
+        def convert_color(color_name):
+            try:
+                rgb = self.owner.winfo_rgb(color_name)
+                return f'#{rgb[0]//256:02x}{rgb[1]//256:02x}{rgb[2]//256:02x}'
+            except Exception:
+                return "#2b2b2b" if is_dark else "#f0f0f0"
+
+        bg_color_name = ctk.ThemeManager.theme["CTkFrame"]["fg_color"][1 if is_dark else 0]
+        text_color_name = ctk.ThemeManager.theme["CTkLabel"]["text_color"][1 if is_dark else 0]
+        return convert_color(bg_color_name), convert_color(text_color_name)
+
+    def update(self, name, version, draw):
+        return self.panels[name].update(version, self.theme_colors(), draw)
+
+# =================================================================
+# محرك التنبؤ المالي (ForecastEngine)
+# =================================================================
+def daily_series(daily_balance):
+    """(days, balances) for every calendar day from the first to the last row of get_daily_balance(); days without transactions keep the previous balance."""
+    days = np.array([row['day'] for row in daily_balance], dtype='datetime64[D]')
+    balances = np.array([row['balance'] for row in daily_balance], dtype=float)
+    offsets = (days - days[0]).astype(np.int64)
+    steps = np.arange(offsets[-1] + 1)
+    return days[0] + steps, balances[np.searchsorted(offsets, steps, side='right') - 1]
+
+def gregorian_months(days):
+    return days.astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+def hijri_months(days):
+    """Hijri month (1-12) of datetime64[D] days in the arithmetic (tabular) Islamic calendar; may differ by a day from sighting."""
+    l = days.astype(np.int64) + 2440588 - 1948440 + 10632  # Julian day number, shifted to the Hijri epoch
+    n = (l - 1) // 10631
+    l = l - 10631 * n + 354
+    j = ((10985 - l) // 5316) * ((50 * l) // 17719) + (l // 5670) * ((43 * l) // 15238)
+    l = l - ((30 - j) // 15) * ((17719 * j) // 50) - (j // 16) * ((15238 * j) // 43) + 29
+    return (24 * l) // 709
+
+@functools.lru_cache(maxsize=None)
+def holt_step_response(alpha, beta, length):
+    """Level error and trend of Holt's filter j days after a unit jump in the balance; weights of a past daily net in the forecast."""
+    level = trend = 0.0
+    level_errors, trends = np.empty(length), np.empty(length)
+    for j in range(length):
+        predicted = level + trend
+        new_level = alpha + (1 - alpha) * predicted
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+        level_errors[j], trends[j] = level - 1, trend
+    return level_errors, trends
+
+@dataclasses.dataclass(frozen=True)
+class Forecast:
+    model: str
+    days: object  # datetime64[D] array of the forecast horizon
+    mean: object
+    lower: object
+    upper: object
+
+class ForecastEngine:
+    """
+    يتنبأ بالرصيد اليومي بعدة نماذج (اتجاه خطي، موسمي حسب الشهر الميلادي أو الهجري، تمهيد أسي)
+    مع مجال تنبؤ، ويحفظ النتائج لكل إصدار من البيانات حتى لا يعاد الحساب عند كل عرض.
+    """
+    MODELS = {
+        "linear": "اتجاه خطي (آخر 90 يومًا)",
+        "seasonal_gregorian": "موسمي حسب الشهر الميلادي",
+        "seasonal_hijri": "موسمي حسب الشهر الهجري",
+        "holt": "تمهيد أسي (Holt)",
+    }
+    HORIZONS = (30, 60, 90, 180)
+    INTERVAL_Z = 1.2816  # two-sided 80% prediction interval
+    MIN_DAYS = 3
+    LINEAR_WINDOW = 90
+    SEASONS = {"seasonal_gregorian": (gregorian_months, 365), "seasonal_hijri": (hijri_months, 354)}
+    HOLT_ALPHA, HOLT_BETA = 0.3, 0.1
+
+    def __init__(self):
+        self.cache, self.cache_version = {}, None
+
+    def forecast(self, daily_balance, model="linear", horizon=60, version=None):
+        """Forecast for the rows of get_daily_balance(), or None with too little history; cached per data version."""
+        if version is None or version != self.cache_version:
+            self.cache, self.cache_version = {}, version
+        key = (model, horizon)
+        if key not in self.cache:
+            days, balances = daily_series(daily_balance) if daily_balance else (None, ())
+            self.cache[key] = self.fit(days, balances, model, horizon) if len(balances) >= self.MIN_DAYS else None
+        return self.cache[key]
+
+    def fit(self, days, balances, model, horizon):
+        if model == "linear":
+            mean, sigma = self._linear(balances, horizon)
+        elif model == "holt":
+            mean, sigma = self._holt(balances, horizon)
+        else:
+            months_of, season_days = self.SEASONS[model]
+            mean, sigma = self._seasonal(days, balances, horizon, months_of, season_days)
+        spread = self.INTERVAL_Z * sigma
+        return Forecast(model, days[-1] + np.arange(1, horizon + 1), mean, mean - spread, mean + spread)
+
+    def _linear(self, balances, horizon):
+        # Least-squares trend of the recent window, continued from the last actual balance.
+        # The balance is a running sum, so the error after h days is that of h daily nets plus h times the slope's error.
+        y = balances[-self.LINEAR_WINDOW:]
+        x = np.arange(len(y), dtype=float)
+        slope, intercept = np.polyfit(x, y, 1)
+        net = np.diff(y)
+        steps = np.arange(1, horizon + 1)
+        return balances[-1] + slope * steps, np.std(net, ddof=1) * np.sqrt(steps + steps ** 2 / len(net))
+
+    def _seasonal(self, days, balances, horizon, months_of, season_days):
+        # Seasonal naive: each future day repeats the mean daily net of its month over the last season
+        net = np.diff(balances)[-season_days:]
+        months = months_of(days[1:][-season_days:])
+        counts = np.bincount(months, minlength=13)
+        monthly_mean = np.where(counts > 0, np.bincount(months, weights=net, minlength=13) / np.maximum(counts, 1), net.mean())
+        future_months = months_of(days[-1] + np.arange(1, horizon + 1))
+        predicted_net = monthly_mean[future_months]
+        residual_sd = np.std(net - monthly_mean[months])
+        # Each month's mean is estimated from counts[month] days; its error is repeated on every future day of that month
+        days_so_far = np.cumsum(np.eye(13)[future_months], axis=0)
+        mean_variance = (days_so_far ** 2 / np.where(counts > 0, counts, len(net))).sum(axis=1)
+        return balances[-1] + np.cumsum(predicted_net), residual_sd * np.sqrt(np.arange(1, horizon + 1) + mean_variance)
+
+    def _holt(self, balances, horizon):
+        # Holt's linear exponential smoothing; the recursion is sequential, the horizon is vectorized
+        alpha, beta = self.HOLT_ALPHA, self.HOLT_BETA
+        level, trend = balances[0], balances[1] - balances[0]
+        for value in balances[1:].tolist():
+            predicted = level + trend
+            new_level = alpha * value + (1 - alpha) * predicted
+            trend = beta * (new_level - level) + (1 - beta) * trend
+            level = new_level
+        steps = np.arange(1, horizon + 1)
+        # The balance behaves like a random walk rather than Holt's own model: the error after h days is h future
+        # daily nets plus every past net weighted by how much of it the filter's level and h-day trend still miss
+        level_errors, trends = holt_step_response(alpha, beta, len(balances) - 1)
+        past_variance = ((level_errors + steps[:, None] * trends) ** 2).sum(axis=1)
+        return level + steps * trend, np.std(np.diff(balances), ddof=1) * np.sqrt(steps + past_variance)
+
+    def backtest(self, daily_balance, models=None, horizons=(30, 60, 90), history_lengths=(90, 365, 730), step=30):
+        """Rolling-origin evaluation: fits on history_length days before each origin and scores the next horizon days."""
+        days, balances = daily_series(daily_balance)
+        results = []
+        for model in models or self.MODELS:
+            for history in history_lengths:
+                for horizon in horizons:
+                    origins = range(history, len(balances) - horizon + 1, step)
+                    if not origins:
+                        continue
+                    absolute_errors, covered = [], []
+                    started = time.perf_counter()
+                    for origin in origins:
+                        result = self.fit(days[origin - history:origin], balances[origin - history:origin], model, horizon)
+                        actual = balances[origin:origin + horizon]
+                        absolute_errors.append(np.abs(result.mean - actual).mean())
+                        covered.append(((actual >= result.lower) & (actual <= result.upper)).mean())
+                    elapsed = time.perf_counter() - started
+                    results.append({'model': model, 'history': history, 'horizon': horizon, 'origins': len(origins), 'mae': float(np.mean(absolute_errors)), 'coverage': float(np.mean(covered)), 'ms_per_fit': elapsed * 1000 / len(origins)})
+        return results
+
 class DashboardFrame(ctk.CTkFrame):
     def __init__(self, parent, controller):
         super().__init__(parent, fg_color="transparent")
@@ -1351,6 +3101,7 @@ class DashboardFrame(ctk.CTkFrame):
         title_frame = ctk.CTkFrame(self, fg_color="transparent"); title_frame.grid(row=0, column=0, columnspan=3, sticky="ew", padx=20, pady=(20, 10))
         title_frame.grid_columnconfigure(0, weight=1)
         ctk.CTkLabel(title_frame, text="لوحة التحكم الرئيسية", font=FontManager.TITLE_FONT).grid(row=0, column=0, pady=10)
+        PeriodSelector(title_frame, controller).grid(row=0, column=0, sticky="w")
         cards_frame = ctk.CTkFrame(self, fg_color="transparent"); cards_frame.grid(row=1, column=0, sticky="ew", padx=20, pady=10)
         cards_frame.grid_columnconfigure((0, 1, 2), weight=1)
         self.balance_card = self.create_summary_card(cards_frame, "الرصيد الصافي",  0, "#1E88E5")
@@ -1358,7 +3109,10 @@ class DashboardFrame(ctk.CTkFrame):
         self.income_card = self.create_summary_card(cards_frame, "إجمالي المداخيل", 2, "#009688")
         self.charts_frame = ctk.CTkFrame(self); self.charts_frame.grid(row=2, column=0, sticky="nsew", padx=20, pady=(0, 20))
         self.charts_frame.grid_columnconfigure((0, 1), weight=1); self.charts_frame.grid_rowconfigure(0, weight=1)
-        self.monthly_chart_canvas, self.balance_chart_canvas = None, None
+        self.charts = ChartManager(self)
+        self.loading = LoadingIndicator(self)
+        self.last_data = None
+        self.data_versions = DataVersionTracker(self, ('incomes', 'expenses'), self.on_show, uses_period=True)
 
     def create_summary_card(self, parent, title, col, color):
         card = ctk.CTkFrame(parent, border_width=2, border_color=color, corner_radius=10)
@@ -1370,166 +3124,239 @@ class DashboardFrame(ctk.CTkFrame):
         return value_label
 
     def on_show(self):
-        incomes = self.controller.db.get_transactions('incomes')
-        expenses = self.controller.db.get_transactions('expenses')
+        if self.data_versions.is_current():
+            self.refresh_theme()
+            return
+        versions, (start_date, end_date) = self.data_versions.current(), self.controller.period
+        self.loading.show()
+        self.controller.tasks.submit(self, "summary", lambda db: self.load_data(db, start_date, end_date), lambda data: self.show_data(data, versions), on_error=self.on_load_error)
+
+    def refresh_theme(self):
+        # Charts are only recoloured; their data version is unchanged
+        if self.last_data:
+            self.update_charts(self.last_data['income_months'], self.last_data['expense_months'], self.last_data['daily_balance'])
 
-        total_income = sum(row['amount'] for row in incomes)
-        total_expense = sum(row['amount'] for row in expenses)
+    @staticmethod
+    def load_data(db, start_date=None, end_date=None):
+        # Runs on a worker thread
+        return {
+            'total_income': db.get_total('incomes', start_date, end_date),
+            'total_expense': db.get_total('expenses', start_date, end_date),
+            'income_months': db.get_period_totals('incomes', 'month', start_date, end_date),
+            'expense_months': db.get_period_totals('expenses', 'month', start_date, end_date),
+            'daily_balance': db.get_daily_balance(start_date, end_date),
+        }
+
+    def show_data(self, data, versions):
+        self.loading.hide()
+        self.last_data = data
+        self.data_versions.mark_shown(versions)
+        total_income, total_expense = data['total_income'], data['total_expense']
         balance = total_income - total_expense
 
         self.income_card.configure(text=f"{total_income:,.2f}\u200e د.ج")
         self.expense_card.configure(text=f"{total_expense:,.2f}\u200e د.ج")
         self.balance_card.configure(text=f"{balance:,.2f}\u200e د.ج")
 
-        self.update_charts(incomes, expenses)
-
-    def update_charts(self, incomes, expenses):
-        if self.monthly_chart_canvas: self.monthly_chart_canvas.get_tk_widget().destroy()
-        if self.balance_chart_canvas: self.balance_chart_canvas.get_tk_widget().destroy()
-
-        df_incomes = pd.DataFrame([dict(row) for row in incomes])
-        df_expenses = pd.DataFrame([dict(row) for row in expenses])
-
-        if not df_incomes.empty or not df_expenses.empty:
-            if not df_incomes.empty:
-                df_incomes['date'] = pd.to_datetime(df_incomes['date'])
-                income_monthly = df_incomes.set_index('date').resample('ME')['amount'].sum().rename('المداخيل')
-            else:
-                income_monthly = pd.Series(dtype='float64').rename('المداخيل')
-
-            if not df_expenses.empty:
-                df_expenses['date'] = pd.to_datetime(df_expenses['date'])
-                expense_monthly = df_expenses.set_index('date').resample('ME')['amount'].sum().rename('المصاريف')
-            else:
-                expense_monthly = pd.Series(dtype='float64').rename('المصاريف')
-
-            monthly_summary = pd.concat([income_monthly, expense_monthly], axis=1).fillna(0)
-
-            if not monthly_summary.empty:
-                monthly_summary.index = monthly_summary.index.strftime('%Y-%m')
-                fig1, ax1 = self.create_styled_figure()
-                monthly_summary.plot(kind='bar', ax=ax1, color=['#009688', '#E53935'])
-
-                ax1.set_title(format_arabic('المقارنة الشهرية بين المداخيل والمصاريف'), fontproperties=FontManager.get_matplotlib_font_prop('Bold', 14))
-                ax1.set_xlabel(format_arabic('الشهر'), fontproperties=FontManager.get_matplotlib_font_prop('Regular', 12))
-                ax1.set_ylabel(format_arabic('المبلغ (د.ج)'), fontproperties=FontManager.get_matplotlib_font_prop('Regular', 12))
-
-                legend_prop = FontManager.get_matplotlib_font_prop('Regular', 10)
-                ax1.legend([format_arabic('المداخيل'), format_arabic('المصاريف')], prop=legend_prop)
-
-                tick_font_prop = FontManager.get_matplotlib_font_prop('Regular', 10)
-                plt.setp(ax1.get_xticklabels(), fontproperties=tick_font_prop, rotation=45, ha='right')
-                plt.setp(ax1.get_yticklabels(), fontproperties=tick_font_prop)
-
-                self.monthly_chart_canvas = FigureCanvasTkAgg(fig1, master=self.charts_frame)
-                self.monthly_chart_canvas.draw()
-                self.monthly_chart_canvas.get_tk_widget().grid(row=0, column=1, sticky="nsew", padx=(10, 20), pady=10)
-
-            all_trans_list = []
-            if not df_incomes.empty:
-                df_incomes['amount_signed'] = df_incomes['amount']
-                all_trans_list.append(df_incomes[['date', 'amount_signed']])
-            if not df_expenses.empty:
-                df_expenses['amount_signed'] = -df_expenses['amount']
-                all_trans_list.append(df_expenses[['date', 'amount_signed']])
-
-            if all_trans_list:
-                all_trans = pd.concat(all_trans_list).sort_values('date')
-                all_trans['balance'] = all_trans['amount_signed'].cumsum()
-                fig2, ax2 = self.create_styled_figure()
-                all_trans.plot(x='date', y='balance', ax=ax2, legend=None, color='#1E88E5')
-
-                ax2.set_title(format_arabic('تطور الرصيد المالي'), fontproperties=FontManager.get_matplotlib_font_prop('Bold', 14))
-                ax2.set_xlabel(format_arabic('التاريخ'), fontproperties=FontManager.get_matplotlib_font_prop('Regular', 12))
-                ax2.set_ylabel(format_arabic('الرصيد (د.ج)'), fontproperties=FontManager.get_matplotlib_font_prop('Regular', 12))
-                ax2.fill_between(all_trans['date'], all_trans['balance'], color='#1E88E5', alpha=0.2)
-
-                tick_font_prop = FontManager.get_matplotlib_font_prop('Regular', 10)
-                plt.setp(ax2.get_xticklabels(), fontproperties=tick_font_prop, rotation=45, ha='right')
-                plt.setp(ax2.get_yticklabels(), fontproperties=tick_font_prop)
-
-                self.balance_chart_canvas = FigureCanvasTkAgg(fig2, master=self.charts_frame)
-                self.balance_chart_canvas.draw()
-                self.balance_chart_canvas.get_tk_widget().grid(row=0, column=0, sticky="nsew", padx=(20, 10), pady=10)
-
-    def create_styled_figure(self):
-        plt.style.use('seaborn-v0_8-darkgrid')
-        fig, ax = plt.subplots(figsize=(6, 4))
-        fig.tight_layout(pad=3.0)
-
-        is_dark = ctk.get_appearance_mode() == "Dark"
-        bg_color_name = ctk.ThemeManager.theme["CTkFrame"]["fg_color"][1 if is_dark else 0]
-        text_color_name = ctk.ThemeManager.theme["CTkLabel"]["text_color"][1 if is_dark else 0]
-
-        def convert_color(color_name):
-            try: return f'#{self.winfo_rgb(color_name)[0]//256:02x}{self.winfo_rgb(color_name)[1]//256:02x}{self.winfo_rgb(color_name)[2]//256:02x}'
-            except: return "#2b2b2b" if is_dark else "#f0f0f0"
-
-        bg_color_hex = convert_color(bg_color_name)
-        text_color_hex = convert_color(text_color_name)
-
-        fig.patch.set_facecolor(bg_color_hex)
-        ax.set_facecolor(bg_color_hex)
-        ax.tick_params(colors=text_color_hex)
-        for spine in ax.spines.values(): spine.set_color(text_color_hex)
-
-        return fig, ax
+        self.update_charts(data['income_months'], data['expense_months'], data['daily_balance'])
+
+    def on_load_error(self, error):
+        self.loading.hide()
+        messagebox.showerror("خطأ", f"فشل تحميل لوحة التحكم:\n{error}", parent=self)
+
+    def update_charts(self, income_months, expense_months, daily_balance):
+        if income_months or expense_months:
+            panel = self.charts.panel("monthly", self.charts_frame)
+            panel.widget.grid(row=0, column=1, sticky="nsew", padx=(10, 20), pady=10)
+            self.charts.update("monthly", data_fingerprint(income_months, expense_months), lambda p: self.draw_monthly_chart(p, income_months, expense_months))
+        elif "monthly" in self.charts.panels:
+            self.charts.panels["monthly"].widget.grid_remove()
+
+        if daily_balance:
+            panel = self.charts.panel("balance", self.charts_frame)
+            panel.widget.grid(row=0, column=0, sticky="nsew", padx=(20, 10), pady=10)
+            self.charts.update("balance", data_fingerprint(daily_balance), lambda p: self.draw_balance_chart(p, daily_balance))
+        elif "balance" in self.charts.panels:
+            self.charts.panels["balance"].widget.grid_remove()
+
+    def draw_monthly_chart(self, panel, income_months, expense_months):
+        income_monthly = pd.Series({row['period']: row['total'] for row in income_months}, dtype='float64').rename('المداخيل')
+        expense_monthly = pd.Series({row['period']: row['total'] for row in expense_months}, dtype='float64').rename('المصاريف')
+        monthly_summary = pd.concat([income_monthly, expense_monthly], axis=1).fillna(0)
+        # Keep months without transactions on the axis, as resample() used to
+        all_months = pd.period_range(min(monthly_summary.index), max(monthly_summary.index), freq='M').strftime('%Y-%m')
+        monthly_summary = monthly_summary.reindex(all_months, fill_value=0)
+
+        panel.set_bars(list(monthly_summary.index), {name: monthly_summary[name].to_numpy() for name in ('المداخيل', 'المصاريف')}, ['#009688', '#E53935'])
+        panel.set_labels('المقارنة الشهرية بين المداخيل والمصاريف', 'الشهر', 'المبلغ (د.ج)', rotation=45, legend=True)
+
+    def draw_balance_chart(self, panel, daily_balance):
+        dates = pd.to_datetime([row['day'] for row in daily_balance]).to_numpy()
+        balances = np.array([row['balance'] for row in daily_balance], dtype=float)
+        panel.set_line("balance", dates, balances, fill_alpha=0.2, color='#1E88E5')
+        panel.set_labels('تطور الرصيد المالي', 'التاريخ', 'الرصيد (د.ج)', rotation=45)
 
 class ReportsFrame(BaseDataFrame):
+    INKIND_CATEGORY = 'تبرعات عينية'
+
     def __init__(self, parent, controller):
         super().__init__(parent, controller)
         self.grid_rowconfigure(1, weight=1)
         self.grid_columnconfigure(0, weight=1)
 
         ctk.CTkLabel(self, text="التقارير والتحليلات", font=FontManager.TITLE_FONT).grid(row=0, column=0, padx=20, pady=20, sticky="e")
+        period_frame = ctk.CTkFrame(self, fg_color="transparent"); period_frame.grid(row=0, column=0, padx=20, pady=20, sticky="w")
+        ctk.CTkButton(period_frame, text="تصدير تقرير الفترة", image=self.controller.icons.get("export"), compound="right", command=self.controller.export_period_report, font=FontManager.BUTTON_FONT).pack(side="left", padx=5)
+        PeriodSelector(period_frame, self.controller).pack(side="left", padx=5)
 
-        self.main_tabview = ctk.CTkTabview(self, anchor="e")
+        self.main_tabview = ctk.CTkTabview(self, anchor="e", command=self.refresh_visible_tab)
         self.main_tabview.grid(row=1, column=0, padx=20, pady=10, sticky="nsew")
         self.main_tabview._segmented_button.configure(font=FontManager.BUTTON_FONT)
 
         self.main_tabview.add("تقارير التبرعات")
         self.main_tabview.add("تقارير الأداء")
+        self.main_tabview.add("تحليل المتبرعين")
         
         # Setup UI for each main tab
         self.setup_donations_tab()
         self.setup_performance_tab()
+        self.setup_donors_tab()
+        self.loading = LoadingIndicator(self)
+        self.last_performance, self.loading_versions = None, None
+        self.data_versions = DataVersionTracker(self, ('incomes', 'expenses'), self.on_show, uses_period=True)
 
     def on_show(self):
-        # When the main reports frame is shown, update the currently visible sub-tab
-        self.update_donations_tab()
-        self.update_performance_tab()
+        if self.data_versions.is_current():
+            self.refresh_theme()
+            return
+        # Both tabs are loaded on a worker; the indicator stays until the last one arrives
+        self.loading_versions, (start_date, end_date) = self.data_versions.current(), self.controller.period
+        self.loading.show()
+        self.controller.tasks.submit(self, "performance", lambda db: self.load_performance(db, start_date, end_date), self.update_performance_tab, on_error=self.on_load_error)
+        self.refresh_visible_tab()
+
+    def refresh_visible_tab(self):
+        # Donations and donors are only queried while their tab is on screen
+        self.refresh_donations()
+        self.refresh_donors()
+
+    def on_task_finished(self, succeeded=True):
+        tasks = self.controller.tasks
+        if not any(tasks.is_pending(self, key) for key in ("performance", "donors", *(view['task_key'] for view in self.donation_views.values()))):
+            self.loading.hide()
+            if succeeded and self.loading_versions is not None:
+                self.data_versions.mark_shown(self.loading_versions)
+        if not succeeded:
+            self.loading_versions = None  # load again on the next visit
+            for view in self.donation_views.values():
+                view['loading'] = None
+            self.donors_loading = None
+
+    def refresh_theme(self):
+        if self.last_performance:
+            self.update_performance_tab(self.last_performance)
+
+    def on_load_error(self, error):
+        self.on_task_finished(succeeded=False)
+        messagebox.showerror("خطأ", f"فشل تحميل التقارير:\n{error}", parent=self)
 
     def setup_donations_tab(self):
         donations_tab = self.main_tabview.tab("تقارير التبرعات")
         donations_tab.grid_rowconfigure(0, weight=1)
         donations_tab.grid_columnconfigure(0, weight=1)
 
-        # Sub-tabs for donations
-        sub_tabview = ctk.CTkTabview(donations_tab, anchor="e")
-        sub_tabview.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
-        sub_tabview._segmented_button.configure(font=FontManager.APP_FONT)
-        
-        sub_tabview.add("ملخص التبرعات")
-        sub_tabview.add("التبرعات المالية")
-        sub_tabview.add("التبرعات العينية")
-
-        # --- Summary Tab ---
-        summary_frame = sub_tabview.tab("ملخص التبرعات")
-        summary_frame.grid_rowconfigure(0, weight=1)
-        summary_frame.grid_columnconfigure(0, weight=1)
-        self.summary_tree = self.create_treeview(summary_frame, ("amount", "category", "payer", "date"), ("المبلغ/القيمة", "الفئة", "المتبرع", "التاريخ"))
-
-        # --- Financial Tab ---
-        financial_frame = sub_tabview.tab("التبرعات المالية")
-        financial_frame.grid_rowconfigure(0, weight=1)
-        financial_frame.grid_columnconfigure(0, weight=1)
-        self.financial_tree = self.create_treeview(financial_frame, ("amount", "category", "payer", "date"), ("المبلغ", "الفئة", "المتبرع", "التاريخ"))
-
-        # --- In-Kind Tab ---
-        inkind_frame = sub_tabview.tab("التبرعات العينية")
-        inkind_frame.grid_rowconfigure(0, weight=1)
-        inkind_frame.grid_columnconfigure(0, weight=1)
-        self.inkind_tree = self.create_treeview(inkind_frame, ("amount", "description", "payer", "date"), ("القيمة التقديرية", "الوصف", "المتبرع", "التاريخ"))
+        # Sub-tabs for donations; each one is loaded the first time it is opened and then only patched
+        self.donations_tabview = ctk.CTkTabview(donations_tab, anchor="e", command=self.refresh_donations)
+        self.donations_tabview.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
+        self.donations_tabview._segmented_button.configure(font=FontManager.APP_FONT)
+
+        self.donation_views = {}
+        for tab_name, query, columns, headings in (
+            ("ملخص التبرعات", TransactionQuery('incomes'), ("amount", "category", "payer", "date"), ("المبلغ/القيمة", "الفئة", "المتبرع", "التاريخ")),
+            ("التبرعات المالية", TransactionQuery('incomes').not_in_categories(self.INKIND_CATEGORY), ("amount", "category", "payer", "date"), ("المبلغ", "الفئة", "المتبرع", "التاريخ")),
+            ("التبرعات العينية", TransactionQuery('incomes').in_categories(self.INKIND_CATEGORY), ("amount", "description", "payer", "date"), ("القيمة التقديرية", "الوصف", "المتبرع", "التاريخ")),
+        ):
+            tab = self.donations_tabview.add(tab_name)
+            tab.grid_rowconfigure(0, weight=1)
+            tab.grid_columnconfigure(0, weight=1)
+            tree, scrollbar = self.create_treeview(tab, columns, headings)
+            task_key = f"donations:{tab_name}"
+            loader = PagedTreeLoader(
+                tree, scrollbar,
+                lambda after, limit, query=query: self.fetch_donations(query, after, limit),
+                lambda row, columns=columns: self.tree_values(columns, row),
+                run_async=lambda work, on_done, task_key=task_key: self.controller.tasks.submit(self, task_key, work, on_done, on_error=self.on_load_error),
+                on_page=lambda rows, tab_name=tab_name: self.on_donations_page(tab_name))
+            self.donation_views[tab_name] = {'loader': loader, 'task_key': task_key, 'shown': None, 'loading': None}
+
+    def fetch_donations(self, query, after, limit):
+        # The period is read on the Tk thread; only the returned work runs on a worker
+        query = query.between(*self.controller.period).page(limit, after=after)
+        return lambda db: [dict(row) for row in db.fetch(query)]
+
+    def refresh_donations(self):
+        """Loads the visible donations sub-tab if its rows are older than the data or the period; others wait until opened."""
+        if self.main_tabview.get() != "تقارير التبرعات":
+            return
+        view = self.donation_views[self.donations_tabview.get()]
+        key = (self.controller.db.versions('incomes'), self.controller.period)
+        if view['shown'] == key or (view['loading'] == key and self.controller.tasks.is_pending(self, view['task_key'])):
+            return
+        view['loading'] = key
+        self.loading.show()
+        if view['shown'] is not None and view['shown'][1] == key[1]:
+            view['loader'].refresh()  # same period: patch changed rows only
+        else:
+            view['loader'].reset()
+
+    def on_donations_page(self, tab_name):
+        view = self.donation_views[tab_name]
+        if view['loading'] is not None:
+            view['shown'], view['loading'] = view['loading'], None
+        self.on_task_finished()
+
+    DONOR_LIMITS = (10, 25, 50, 100)
+
+    def setup_donors_tab(self):
+        donors_tab = self.main_tabview.tab("تحليل المتبرعين")
+        donors_tab.grid_rowconfigure(1, weight=1)
+        donors_tab.grid_columnconfigure(0, weight=1)
+        controls = ctk.CTkFrame(donors_tab, fg_color="transparent")
+        controls.grid(row=0, column=0, sticky="e", padx=5, pady=(5, 0))
+        self.donor_limit = ctk.CTkComboBox(controls, values=[f"أعلى {n}" for n in self.DONOR_LIMITS], width=120, justify="right", state="readonly", font=FontManager.INPUT_FONT, dropdown_font=FontManager.INPUT_FONT, command=lambda _: self.refresh_donors())
+        self.donor_limit.set(f"أعلى {self.DONOR_LIMITS[1]}")
+        self.donor_limit.pack(side="right", padx=5)
+        self.donor_search = ctk.CTkEntry(controls, placeholder_text="اسم المتبرع...", font=FontManager.INPUT_FONT, width=220, justify="right")
+        self.donor_search.pack(side="right", padx=5)
+        self.donor_search.bind("<Return>", lambda event: self.refresh_donors())
+        ctk.CTkLabel(controls, text="", image=self.controller.icons.get("search")).pack(side="right", padx=5)
+        tree_holder = ctk.CTkFrame(donors_tab, fg_color="transparent")
+        tree_holder.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
+        self.donors_tree, _ = self.create_treeview(tree_holder, ("last_gift", "interval", "gifts", "total", "name", "rank"), ("آخر تبرع", "متوسط الفاصل (يوم)", "عدد التبرعات", "المجموع", "المتبرع", "#"))
+        self.donors_tree.column("rank", width=50, anchor='center')
+        self.donors_shown, self.donors_loading = None, None
+
+    def refresh_donors(self):
+        """Top donors for the shared period, recomputed by SQL only when the data, period or filters changed."""
+        if self.main_tabview.get() != "تحليل المتبرعين":
+            return
+        limit, name, (start_date, end_date) = int(self.donor_limit.get().split()[-1]), self.donor_search.get().strip(), self.controller.period
+        key = (self.controller.db.versions('incomes'), self.controller.period, limit, name)
+        if self.donors_shown == key or (self.donors_loading == key and self.controller.tasks.is_pending(self, "donors")):
+            return
+        self.donors_loading = key
+        self.loading.show()
+        self.controller.tasks.submit(self, "donors", lambda db: [dict(row) for row in db.get_top_donors(limit, start_date, end_date, name)], self.show_donors, on_error=self.on_load_error)
+
+    def show_donors(self, donors):
+        self.donors_shown, self.donors_loading = self.donors_loading, None
+        self.on_task_finished()
+        self.donors_tree.delete(*self.donors_tree.get_children())
+        for rank, donor in enumerate(donors, start=1):
+            # Recurrence: average days between gifts over the donor's active span
+            span = (datetime.fromisoformat(donor['last_gift'][:10]) - datetime.fromisoformat(donor['first_gift'][:10])).days
+            interval = f"{span / (donor['gifts'] - 1):,.0f}" if donor['gifts'] > 1 else "—"
+            self.donors_tree.insert("", "end", values=(donor['last_gift'], interval, donor['gifts'], f"{donor['total']:,.2f}\u200e د.ج", donor['name'], rank))
 
     def setup_performance_tab(self):
         performance_tab = self.main_tabview.tab("تقارير الأداء")
@@ -1552,131 +3379,112 @@ class ReportsFrame(BaseDataFrame):
         self.monthly_chart_frame.grid(row=0, column=1, sticky="nsew", padx=(5,0), pady=5)
         self.annual_chart_frame = ctk.CTkFrame(trends_frame)
         self.annual_chart_frame.grid(row=0, column=0, sticky="nsew", padx=(0,5), pady=5)
-        self.monthly_canvas, self.annual_canvas = None, None
+        self.charts = ChartManager(self)
 
         # --- Forecast Tab ---
         forecast_frame = sub_tabview.tab("التنبؤ المالي")
-        forecast_frame.grid_rowconfigure(0, weight=1)
         forecast_frame.grid_columnconfigure(0, weight=1)
+        forecast_frame.grid_rowconfigure(0, weight=0)
+        forecast_frame.grid_rowconfigure(1, weight=1)
+        controls = ctk.CTkFrame(forecast_frame, fg_color="transparent")
+        controls.grid(row=0, column=0, sticky="e", padx=5, pady=(5, 0))
+        self.forecast_engine = ForecastEngine()
+        self.forecast_model_names = {label: model for model, label in ForecastEngine.MODELS.items()}
+        self.forecast_horizon = ctk.CTkSegmentedButton(controls, values=[f"{days} يومًا" for days in ForecastEngine.HORIZONS], font=FontManager.APP_FONT, command=lambda _: self.on_forecast_options_changed())
+        self.forecast_horizon.set("60 يومًا")
+        self.forecast_horizon.pack(side="right", padx=5)
+        ctk.CTkLabel(controls, text=":الأفق", font=FontManager.APP_FONT).pack(side="right", padx=(15, 0))
+        self.forecast_model = ctk.CTkComboBox(controls, values=list(self.forecast_model_names), width=230, justify="right", state="readonly", font=FontManager.INPUT_FONT, dropdown_font=FontManager.INPUT_FONT, command=lambda _: self.on_forecast_options_changed())
+        self.forecast_model.set(ForecastEngine.MODELS["linear"])
+        self.forecast_model.pack(side="right", padx=5)
+        ctk.CTkLabel(controls, text=":النموذج", font=FontManager.APP_FONT).pack(side="right")
         self.forecast_chart_frame = ctk.CTkFrame(forecast_frame)
-        self.forecast_chart_frame.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
-        self.forecast_canvas = None
+        self.forecast_chart_frame.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
 
-    def update_donations_tab(self):
-        incomes = self.db.get_transactions('incomes')
-        
-        # Summary Tree
-        self.populate_tree(self.summary_tree, incomes)
-        
-        # Financial Tree
-        financial_donations = [row for row in incomes if row['category'] != 'تبرعات عينية']
-        self.populate_tree(self.financial_tree, financial_donations)
-        
-        # In-kind Tree
-        inkind_donations = [row for row in incomes if row['category'] == 'تبرعات عينية']
-        self.populate_tree(self.inkind_tree, inkind_donations)
+    @staticmethod
+    def load_performance(db, start_date=None, end_date=None):
+        # Runs on a worker thread: the queries and the DataFrame work, leaving only drawing to the Tk thread.
+        # The forecast always starts from the latest balance, so it reads the whole series.
+        performance = {'daily_balance': db.get_daily_balance(), **ReportsFrame.build_trend_summaries(db, start_date, end_date)}
+        # Content versions let the charts skip redrawing when nothing changed since the last visit
+        performance['trend_version'] = data_fingerprint(performance['monthly'], performance['annual'])
+        performance['balance_version'] = data_fingerprint(performance['daily_balance'])
+        return performance
+
+    def update_performance_tab(self, performance):
+        self.last_performance = performance
+        self.on_task_finished()
 
-    def update_performance_tab(self):
-        incomes = self.db.get_transactions('incomes')
-        expenses = self.db.get_transactions('expenses')
-        
-        df_incomes = pd.DataFrame([dict(row) for row in incomes])
-        df_expenses = pd.DataFrame([dict(row) for row in expenses])
-        
         # Update Monthly and Annual charts
-        self.update_trend_charts(df_incomes, df_expenses)
-        
+        self.update_trend_charts(performance['monthly'], performance['annual'], performance['trend_version'])
+
         # Update Forecast chart
-        self.update_forecast_chart(df_incomes, df_expenses)
-
-    def update_trend_charts(self, df_incomes, df_expenses):
-        if self.monthly_canvas: self.monthly_canvas.get_tk_widget().destroy()
-        if self.annual_canvas: self.annual_canvas.get_tk_widget().destroy()
-
-        # Monthly Chart
-        if not df_incomes.empty or not df_expenses.empty:
-            fig_monthly, ax_monthly = self.create_styled_figure()
-            if not df_incomes.empty:
-                df_incomes['date'] = pd.to_datetime(df_incomes['date'])
-                income_monthly = df_incomes.set_index('date').resample('ME')['amount'].sum()
-            else: income_monthly = pd.Series()
-            if not df_expenses.empty:
-                df_expenses['date'] = pd.to_datetime(df_expenses['date'])
-                expense_monthly = df_expenses.set_index('date').resample('ME')['amount'].sum()
-            else: expense_monthly = pd.Series()
-            
-            monthly_summary = pd.DataFrame({'المداخيل': income_monthly, 'المصاريف': expense_monthly}).fillna(0)
-            monthly_summary.index = monthly_summary.index.strftime('%Y-%m')
-            monthly_summary.plot(kind='bar', ax=ax_monthly, color=['#009688', '#E53935'])
-            self.finalize_chart(fig_monthly, ax_monthly, 'الأداء المالي الشهري', 'الشهر', 'المبلغ (د.ج)')
-            self.monthly_canvas = FigureCanvasTkAgg(fig_monthly, master=self.monthly_chart_frame)
-            self.monthly_canvas.draw()
-            self.monthly_canvas.get_tk_widget().pack(fill="both", expand=True)
-
-        # Annual Chart
-        if not df_incomes.empty or not df_expenses.empty:
-            fig_annual, ax_annual = self.create_styled_figure()
-            if not df_incomes.empty:
-                income_annual = df_incomes.set_index('date').resample('YE')['amount'].sum()
-            else: income_annual = pd.Series()
-            if not df_expenses.empty:
-                expense_annual = df_expenses.set_index('date').resample('YE')['amount'].sum()
-            else: expense_annual = pd.Series()
-
-            annual_summary = pd.DataFrame({'المداخيل': income_annual, 'المصاريف': expense_annual}).fillna(0)
-            annual_summary.index = annual_summary.index.strftime('%Y')
-            annual_summary.plot(kind='bar', ax=ax_annual, color=['#007ACC', '#C70039'])
-            self.finalize_chart(fig_annual, ax_annual, 'الأداء المالي السنوي', 'السنة', 'المبلغ (د.ج)')
-            self.annual_canvas = FigureCanvasTkAgg(fig_annual, master=self.annual_chart_frame)
-            self.annual_canvas.draw()
-            self.annual_canvas.get_tk_widget().pack(fill="both", expand=True)
-
-    def update_forecast_chart(self, df_incomes, df_expenses):
-        if self.forecast_canvas: self.forecast_canvas.get_tk_widget().destroy()
-
-        fig, ax = self.create_styled_figure()
-
-        if df_incomes.empty and df_expenses.empty:
-            ax.text(0.5, 0.5, format_arabic('لا توجد بيانات كافية للتنبؤ'), horizontalalignment='center', verticalalignment='center', transform=ax.transAxes)
+        self.update_forecast_chart(performance['daily_balance'], performance['balance_version'])
+
+    @staticmethod
+    def build_trend_summaries(db, start_date=None, end_date=None):
+        # Reads monthly_summary: a few rows per month whatever the size of the history
+        summaries = {}
+        for name, period, freq, fmt in (('monthly', 'month', 'M', '%Y-%m'), ('annual', 'year', 'Y', '%Y')):
+            rows = {'المداخيل': db.get_period_totals('incomes', period, start_date, end_date), 'المصاريف': db.get_period_totals('expenses', period, start_date, end_date)}
+            if not any(rows.values()):
+                return {'monthly': None, 'annual': None}
+            summary = pd.DataFrame({column: pd.Series({row['period']: row['total'] for row in period_rows}, dtype='float64') for column, period_rows in rows.items()}).fillna(0)
+            # Keep periods without transactions on the axis, as resample() used to
+            all_periods = pd.period_range(min(summary.index), max(summary.index), freq=freq).strftime(fmt)
+            summaries[name] = summary.reindex(all_periods, fill_value=0)
+        return summaries
+
+    def update_trend_charts(self, monthly_summary, annual_summary, version):
+        for name, summary, master, title, xlabel, colors in (
+            ("monthly", monthly_summary, self.monthly_chart_frame, 'الأداء المالي الشهري', 'الشهر', ['#009688', '#E53935']),
+            ("annual", annual_summary, self.annual_chart_frame, 'الأداء المالي السنوي', 'السنة', ['#007ACC', '#C70039']),
+        ):
+            if summary is None:
+                if name in self.charts.panels: self.charts.panels[name].widget.pack_forget()
+                continue
+            panel = self.charts.panel(name, master)
+            panel.widget.pack(fill="both", expand=True)
+            self.charts.update(name, version, lambda p, summary=summary, title=title, xlabel=xlabel, colors=colors: self.draw_summary_chart(p, summary, title, xlabel, colors))
+
+    @staticmethod
+    def draw_summary_chart(panel, summary, title, xlabel, colors):
+        panel.set_bars(list(summary.index), {name: summary[name].to_numpy() for name in summary.columns}, colors)
+        panel.set_labels(title, xlabel, 'المبلغ (د.ج)', legend=True)
+
+    def forecast_options(self):
+        return self.forecast_model_names[self.forecast_model.get()], int(self.forecast_horizon.get().split()[0])
+
+    def on_forecast_options_changed(self):
+        if self.last_performance:
+            self.update_forecast_chart(self.last_performance['daily_balance'], self.last_performance['balance_version'])
+
+    def update_forecast_chart(self, daily_balance, version):
+        model, horizon = self.forecast_options()
+        panel = self.charts.panel("forecast", self.forecast_chart_frame)
+        panel.widget.pack(fill="both", expand=True)
+        self.charts.update("forecast", (version, model, horizon), lambda p: self.draw_forecast_chart(p, daily_balance, self.forecast_engine.forecast(daily_balance, model, horizon, version), horizon))
+
+    @staticmethod
+    def draw_forecast_chart(panel, daily_balance, forecast, horizon):
+        if not daily_balance:
+            for name in ("actual", "forecast", "interval"): panel.hide_line(name)
+            panel.set_message('لا توجد بيانات كافية للتنبؤ')
+            return
+        panel.set_message(None)
+
+        # Closing balance of every day with transactions, kept up to date by the database
+        days = np.array([row['day'] for row in daily_balance], dtype='datetime64[D]')
+        panel.set_line("actual", days, np.array([row['balance'] for row in daily_balance], dtype=float), label=format_arabic('الرصيد الفعلي'))
+
+        if forecast is None:
+            panel.hide_line("forecast"); panel.hide_line("interval")
         else:
-            df_incomes['amount_signed'] = df_incomes['amount']
-            df_expenses['amount_signed'] = -df_expenses['amount']
-            all_trans = pd.concat([df_incomes, df_expenses]).sort_values('date')
-            all_trans['date'] = pd.to_datetime(all_trans['date'])
-            all_trans['balance'] = all_trans['amount_signed'].cumsum()
-
-            # Plot historical data
-            all_trans.plot(x='date', y='balance', ax=ax, label=format_arabic('الرصيد الفعلي'))
-
-            # Forecasting
-            if len(all_trans) > 2:
-                last_90_days = all_trans[all_trans['date'] >= (all_trans['date'].max() - timedelta(days=90))]
-                if len(last_90_days) > 2:
-                    last_90_days['days_since_start'] = (last_90_days['date'] - last_90_days['date'].min()).dt.days
-                    x = last_90_days['days_since_start']
-                    y = last_90_days['balance']
-                    
-                    # Simple linear regression
-                    coeffs = np.polyfit(x, y, 1)
-                    slope = coeffs[0]
-                    intercept = y.iloc[-1] - slope * x.iloc[-1] # Adjust intercept to start from the last point
-                    
-                    last_date = last_90_days['date'].max()
-                    last_balance = last_90_days['balance'].iloc[-1]
-                    
-                    forecast_dates = pd.to_datetime([last_date + timedelta(days=i) for i in range(1, 61)])
-                    forecast_days_since = (forecast_dates - last_date).days
-                    
-                    forecast_balance = slope * forecast_days_since + last_balance
-                    
-                    forecast_df = pd.DataFrame({'date': forecast_dates, 'forecast': forecast_balance})
-                    forecast_df.plot(x='date', y='forecast', ax=ax, color='red', linestyle='--', label=format_arabic('الرصيد المتوقع'))
-
-            self.finalize_chart(fig, ax, 'التنبؤ بالرصيد المالي (60 يومًا)', 'التاريخ', 'الرصيد (د.ج)')
-
-        self.forecast_canvas = FigureCanvasTkAgg(fig, master=self.forecast_chart_frame)
-        self.forecast_canvas.draw()
-        self.forecast_canvas.get_tk_widget().pack(fill="both", expand=True)
+            panel.set_line("forecast", forecast.days, forecast.mean, color='red', linestyle='--', label=format_arabic('الرصيد المتوقع'))
+            # Added after the lines so that their relim() does not drop the band from the data limits
+            panel.set_band("interval", forecast.days, forecast.lower, forecast.upper, color='red', alpha=0.15, label=format_arabic('مجال التنبؤ 80%'))
+
+        panel.set_labels(f'التنبؤ بالرصيد المالي ({horizon} يومًا)', 'التاريخ', 'الرصيد (د.ج)', legend=True)
 
     def create_treeview(self, parent, columns, headings):
         parent.grid_rowconfigure(0, weight=1)
@@ -1695,67 +3503,11 @@ class ReportsFrame(BaseDataFrame):
         scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
         tree.configure(yscrollcommand=scrollbar.set)
         scrollbar.grid(row=0, column=1, sticky="ns")
-        return tree
-
-    def populate_tree(self, tree, data):
-        tree.delete(*tree.get_children())
-        for row_data in data:
-            row = dict(row_data)
-            values = []
-            for col in tree['columns']:
-                if col == 'amount':
-                    values.append(f"{row.get(col, 0):,.2f}\u200e د.ج")
-                else:
-                    values.append(row.get(col, ''))
-            tree.insert("", "end", values=values)
+        return tree, scrollbar
 
-    def create_styled_figure(self):
-        plt.style.use('seaborn-v0_8-darkgrid')
-        fig, ax = plt.subplots(figsize=(6, 4))
-        fig.tight_layout(pad=4.0)
-        is_dark = ctk.get_appearance_mode() == "Dark"
-        
-        def convert_color(color_name):
-            try:
-                rgb = self.winfo_rgb(color_name)
-                return f'#{rgb[0]//256:02x}{rgb[1]//256:02x}{rgb[2]//256:02x}'
-            except:
-                return "#2b2b2b" if is_dark else "#f0f0f0"
-
-        bg_color_name = ctk.ThemeManager.theme["CTkFrame"]["fg_color"][1 if is_dark else 0]
-        text_color_name = ctk.ThemeManager.theme["CTkLabel"]["text_color"][1 if is_dark else 0]
-        
-        bg_color_hex = convert_color(bg_color_name)
-        text_color_hex = convert_color(text_color_name)
-
-        fig.patch.set_facecolor(bg_color_hex)
-        ax.set_facecolor(bg_color_hex)
-        ax.tick_params(colors=text_color_hex, which='both')
-        ax.xaxis.label.set_color(text_color_hex)
-        ax.yaxis.label.set_color(text_color_hex)
-        ax.title.set_color(text_color_hex)
-        for spine in ax.spines.values():
-            spine.set_edgecolor(text_color_hex)
-        return fig, ax
-
-    def finalize_chart(self, fig, ax, title, xlabel, ylabel):
-        title_prop = FontManager.get_matplotlib_font_prop('Bold', 14)
-        label_prop = FontManager.get_matplotlib_font_prop('Regular', 12)
-        tick_prop = FontManager.get_matplotlib_font_prop('Regular', 10)
-        
-        ax.set_title(format_arabic(title), fontproperties=title_prop)
-        ax.set_xlabel(format_arabic(xlabel), fontproperties=label_prop)
-        ax.set_ylabel(format_arabic(ylabel), fontproperties=label_prop)
-        
-        if ax.get_legend():
-            legend_prop = FontManager.get_matplotlib_font_prop('Regular', 10)
-            for text in ax.get_legend().get_texts():
-                text.set_fontproperties(legend_prop)
-                text.set_text(format_arabic(text.get_text()))
-
-        plt.setp(ax.get_xticklabels(), fontproperties=tick_prop, rotation=30, ha='right')
-        plt.setp(ax.get_yticklabels(), fontproperties=tick_prop)
-        fig.tight_layout()
+    @staticmethod
+    def tree_values(columns, row):
+        return [f"{row.get(col) or 0:,.2f}\u200e د.ج" if col == 'amount' else row.get(col) or '' for col in columns]
 
 class DataManagementFrame(ctk.CTkFrame):
     def __init__(self, parent, controller):
@@ -1820,10 +3572,11 @@ class DataManagementFrame(ctk.CTkFrame):
 
     def save_settings(self):
         try:
-            for key, entry in self.setting_entries.items():
-                self.controller.db.update_setting(key, entry.get())
+            with self.controller.db.transaction():
+                for key, entry in self.setting_entries.items():
+                    self.controller.db.update_setting(key, entry.get())
+                self.controller.db.log_action(self.controller.current_user, "تحديث الإعدادات العامة")
             messagebox.showinfo("نجاح", "تم حفظ الإعدادات بنجاح.", parent=self)
-            self.controller.db.log_action(self.controller.current_user, "تحديث الإعدادات العامة")
         except Exception as e:
             messagebox.showerror("خطأ", f"فشل حفظ الإعدادات:\n{e}", parent=self)
 
@@ -1957,7 +3710,10 @@ class UserManagementFrame(BaseDataFrame):
         if not selected: messagebox.showwarning("تنبيه", "يرجى تحديد مستخدم.", parent=self); return
         vals = self.tree.item(selected)['values']; user_id, username, role = vals[0], vals[1], vals[2]
         data = UserDialog(self, title="تعديل مستخدم", initial_data={'username': username, 'role': role}).get_data()
-        if data: self.db.update_user(user_id, data['username'], data['password'], data['role']); self.db.log_action(self.controller.current_user, "تعديل مستخدم", f"معرف: {user_id}"); self.populate_table()
+        if data:
+            with self.db.transaction():
+                self.db.update_user(user_id, data['username'], data['password'], data['role']); self.db.log_action(self.controller.current_user, "تعديل مستخدم", f"معرف: {user_id}")
+            self.populate_table()
     def delete_user(self):
         selected = self.tree.focus()
         if not selected: messagebox.showwarning("تنبيه", "يرجى تحديد مستخدم.", parent=self); return
@@ -1965,7 +3721,9 @@ class UserManagementFrame(BaseDataFrame):
         if user_id == 1: messagebox.showerror("خطأ", "لا يمكن حذف المدير الافتراضي.", parent=self); return
         if username == self.controller.current_user: messagebox.showerror("خطأ", "لا يمكن للمستخدم حذف نفسه.", parent=self); return
         if messagebox.askyesno("تأكيد الحذف", f"هل أنت متأكد من حذف المستخدم '{username}'؟", icon='warning', parent=self):
-            self.db.delete_user(user_id); self.db.log_action(self.controller.current_user, "حذف مستخدم", f"معرف: {user_id}"); self.populate_table()
+            with self.db.transaction():
+                self.db.delete_user(user_id); self.db.log_action(self.controller.current_user, "حذف مستخدم", f"معرف: {user_id}")
+            self.populate_table()
 
 class AuditLogFrame(BaseDataFrame):
     def __init__(self, parent, controller):
@@ -1973,9 +3731,18 @@ class AuditLogFrame(BaseDataFrame):
         ctk.CTkLabel(self, text="سجل التدقيق", font=FontManager.TITLE_FONT).grid(row=0, column=0, padx=20, pady=20, sticky="e")
         columns = ("timestamp", "username", "action", "details"); headings = ("الوقت والتاريخ", "المستخدم", "الإجراء", "التفاصيل")
         self.setup_treeview(columns, headings); self.tree.column("timestamp", width=160, anchor="center"); self.tree.column("details", width=400); self.tree.column("action", width=150); self.tree.column("username", width=120)
+        self.loading = LoadingIndicator(self)
+        self.data_versions = DataVersionTracker(self, ('audit_log',), self.on_show)
     def on_show(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        for log in self.db.get_audit_logs(): self.tree.insert("", "end", values=(log['timestamp'], log['username'], log['action'], log['details']))
+        if self.data_versions.is_current(): return
+        versions = self.data_versions.current()
+        self.loading.show()
+        self.controller.tasks.submit(self, "logs", lambda db: [(log['timestamp'], log['username'], log['action'], log['details']) for log in db.get_audit_logs()], lambda logs: self.show_logs(logs, versions), on_error=lambda e: self.loading.hide())
+    def show_logs(self, logs, versions):
+        self.loading.hide()
+        self.data_versions.mark_shown(versions)
+        self.tree.delete(*self.tree.get_children())
+        for log in logs: self.tree.insert("", "end", values=log)
 
 class UserDialog(ctk.CTkToplevel):
     def __init__(self, parent, title, initial_data=None):
@@ -2030,8 +3797,18 @@ class ChangePasswordDialog(ctk.CTkToplevel):
              self.destroy()
 
 class WordReceiptGenerator:
+    """
+    ينشئ وصل تبرع بصيغة Word (نسختان في صفحة واحدة: للجمعية وللمتبرع).
+    template_bytes() يبني الوصل مرة واحدة بعلامات ⟦حقل⟧ بدل البيانات، لتملأه ReceiptTemplate في الدفعات.
+    """
+    FIELDS = ("id", "date", "payer", "amount", "amount_text", "description")
+
     def __init__(self, receipt_data, settings):
+        import docx
+        from docx.shared import Cm
+        from docx.oxml.ns import qn
         self.receipt_data = receipt_data
+        self.fields = self.receipt_fields(receipt_data)
         self.settings = settings
         self.document = docx.Document()
 
@@ -2046,7 +3823,32 @@ class WordReceiptGenerator:
         self.document.styles['Normal']._element.rPr.rFonts.set(qn('w:eastAsia'), 'Amiri')
 
 
+    @staticmethod
+    def receipt_fields(receipt_data):
+        """The text of every variable part of a receipt, keyed by FIELDS."""
+        amount = receipt_data.get('amount', 0)
+        return {
+            "id": str(receipt_data.get('id', 'N/A')),
+            "date": str(receipt_data.get('date', datetime.now().strftime('%d/%m/%Y'))),
+            "payer": str(receipt_data.get('payer', 'N/A')),
+            "amount": f"{amount:,.2f}",
+            "amount_text": tafqeet_amount(amount),
+            "description": str(receipt_data.get('description', 'تبرع نقدي')),
+        }
+
+    @classmethod
+    def template_bytes(cls, settings):
+        """The .docx of a receipt whose variable parts are ⟦field⟧ placeholders."""
+        generator = cls({}, settings)
+        generator.fields = {name: ReceiptTemplate.PLACEHOLDER.format(name) for name in cls.FIELDS}
+        generator.create_document()
+        buffer = io.BytesIO()
+        generator.document.save(buffer)
+        return buffer.getvalue()
+
     def _set_font(self, run, font_name='Amiri', size=None, bold=None, italic=None):
+        from docx.shared import Pt
+        from docx.oxml.ns import qn
         font = run.font
         font.name = font_name
         r = run._r
@@ -2057,6 +3859,7 @@ class WordReceiptGenerator:
         if italic is not None: font.italic = italic
 
     def _get_or_create_tblPr(self, tbl_element):
+        from docx.oxml import OxmlElement
         tblPr = tbl_element.tblPr
         if tblPr is None:
             tblPr = OxmlElement('w:tblPr')
@@ -2064,6 +3867,8 @@ class WordReceiptGenerator:
         return tblPr
 
     def _remove_table_borders(self, table):
+        from docx.oxml import OxmlElement
+        from docx.oxml.ns import qn
         tblPr = self._get_or_create_tblPr(table._element)
         tblBorders = OxmlElement('w:tblBorders')
         for b in ['top', 'left', 'bottom', 'right', 'insideH', 'insideV']:
@@ -2072,106 +3877,70 @@ class WordReceiptGenerator:
             tblBorders.append(ele)
         tblPr.append(tblBorders)
 
+    SEPARATOR = "------------------------------------------------------------------------------------------------------------------"
+
+    @staticmethod
+    def receipt_layout(fields, settings):
+        """
+        The receipt as data, shared by the Word and PDF renderers: ("text", align, text, size, bold, italic)
+        paragraphs, ("columns", [(align, text, size, bold), ...]) borderless rows laid out right to left
+        (the first cell is the rightmost column in both renderers; Word tables are marked bidiVisual),
+        ("space",) blank lines and ("separator",) the cut line between the two copies.
+        """
+        address = settings.get("address", "(العنوان)")
+        phone = settings.get("phone", "(الهاتف)")
+        layout = []
+        for is_top_part in (True, False):
+            if not is_top_part:
+                layout.append(("separator",))
+            note = "نسخة للجمعية" if is_top_part else "نسخة للمتبرع"
+            layout += [
+                ("text", "center", "بسم الله الرحمن الرحيم", 16, True, None),
+                ("text", "center", "وصل استلام تبرع", 22, True, None),
+                ("text", "center", settings.get("association_name", "اسم الجمعية"), 12, True, None),
+                ("text", "center", f"العنوان: {address} - الهاتف: {phone}", 10, None, None),
+                ("text", "center", "__________________________________________", 10, None, None),
+                ("columns", [("right", f"رقم الوصل: {fields['id']}", 12, True), ("left", f"تاريخ التحرير: {fields['date']}", 12, True)]),
+                ("space",),
+                ("text", "right", f"استلمنا من السيد/ة: {fields['payer']}", 12, None, None),
+                ("text", "right", f"مبلغا وقدره: {fields['amount']} د.ج", 12, None, None),
+                ("text", "right", f"وهو: ({fields['amount_text']})", 12, None, None),
+                ("text", "right", f"وذلك عن: {fields['description']}", 12, None, None),
+                ("space",),
+                ("columns", [("center", "ختم الجمعية", 14, True), ("center", "توقيع أمين المال", 14, True)]),
+                ("space",),
+                ("text", "center", f"({note}) لا يعتبر هذا الوصل صالحاً إلا إذا كان مختوماً وموقعاً.", 9, None, True),
+            ]
+        return layout
+
     def create_document(self):
-        # This creates a single receipt. To create two, we wrap this logic.
-        self.create_receipt_content(is_top_part=True)
-
-        # --- Separator Line ---
-        self.document.add_paragraph("------------------------------------------------------------------------------------------------------------------")
-
-        self.create_receipt_content(is_top_part=False)
-
-
-    def create_receipt_content(self, is_top_part=True):
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = p.add_run("بسم الله الرحمن الرحيم")
-        self._set_font(run, size=16, bold=True)
-
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = p.add_run("وصل استلام تبرع")
-        self._set_font(run, size=22, bold=True)
-
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = p.add_run(self.settings.get("association_name", "اسم الجمعية"))
-        self._set_font(run, size=12, bold=True)
-
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        address = self.settings.get("address", "(العنوان)")
-        phone = self.settings.get("phone", "(الهاتف)")
-        run = p.add_run(f"العنوان: {address} - الهاتف: {phone}")
-        self._set_font(run, size=10)
-
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = p.add_run("__________________________________________")
-        self._set_font(run, size=10)
-
-        table = self.document.add_table(rows=1, cols=2)
-        table.columns[0].width = table.columns[1].width = Cm(8)
-        self._remove_table_borders(table)
-
-        p = table.cell(0, 0).paragraphs[0]
-        p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        run = p.add_run(f"رقم الوصل: {self.receipt_data.get('id', 'N/A')}")
-        self._set_font(run, size=12, bold=True)
-
-        p = table.cell(0, 1).paragraphs[0]
-        p.alignment = WD_ALIGN_PARAGRAPH.LEFT
-        run = p.add_run(f"تاريخ التحرير: {self.receipt_data.get('date', datetime.now().strftime('%d/%m/%Y'))}")
-        self._set_font(run, size=12, bold=True)
-
-        self.document.add_paragraph()
-
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        run = p.add_run(f"استلمنا من السيد/ة: {self.receipt_data.get('payer', 'N/A')}")
-        self._set_font(run, size=12)
-
-        amount = self.receipt_data.get('amount', 0)
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        run = p.add_run(f"مبلغا وقدره: {amount:,.2f} د.ج")
-        self._set_font(run, size=12)
-
-        amount_text = tafqeet(amount)
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        run = p.add_run(f"وهو: ({amount_text} دينار جزائري)")
-        self._set_font(run, size=12)
-
-        description = self.receipt_data.get('description', 'تبرع نقدي')
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        run = p.add_run(f"وذلك عن: {description}")
-        self._set_font(run, size=12)
-
-        self.document.add_paragraph() # Spacer
-
-        table = self.document.add_table(rows=1, cols=2)
-        table.columns[0].width = table.columns[1].width = Cm(8)
-        self._remove_table_borders(table)
-
-        p = table.cell(0, 0).paragraphs[0]
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = p.add_run("ختم الجمعية")
-        self._set_font(run, size=14, bold=True)
-
-        p = table.cell(0, 1).paragraphs[0]
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = p.add_run("توقيع أمين المال")
-        self._set_font(run, size=14, bold=True)
-
-        self.document.add_paragraph()
-
-        p = self.document.add_paragraph()
-        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        note = "نسخة للجمعية" if is_top_part else "نسخة للمتبرع"
-        run = p.add_run(f"({note}) لا يعتبر هذا الوصل صالحاً إلا إذا كان مختوماً وموقعاً.")
-        self._set_font(run, size=9, italic=True)
+        from docx.shared import Cm
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+        alignments = {"center": WD_ALIGN_PARAGRAPH.CENTER, "right": WD_ALIGN_PARAGRAPH.RIGHT, "left": WD_ALIGN_PARAGRAPH.LEFT}
+        for block in self.receipt_layout(self.fields, self.settings):
+            kind = block[0]
+            if kind == "text":
+                _, align, text, size, bold, italic = block
+                p = self.document.add_paragraph()
+                p.alignment = alignments[align]
+                run = p.add_run(text)
+                self._set_font(run, size=size, bold=bold, italic=italic)
+            elif kind == "columns":
+                cells = block[1]
+                table = self.document.add_table(rows=1, cols=len(cells))
+                for column in table.columns:
+                    column.width = Cm(8)
+                self._remove_table_borders(table)
+                self._get_or_create_tblPr(table._element).get_or_add_bidiVisual()  # cell 0 is the right column, as in the PDF
+                for i, (align, text, size, bold) in enumerate(cells):
+                    p = table.cell(0, i).paragraphs[0]
+                    p.alignment = alignments[align]
+                    run = p.add_run(text)
+                    self._set_font(run, size=size, bold=bold)
+            elif kind == "space":
+                self.document.add_paragraph()
+            elif kind == "separator":
+                self.document.add_paragraph(self.SEPARATOR)
 
 
     def save(self, filepath):
@@ -2193,6 +3962,302 @@ class WordReceiptGenerator:
 
 
 
+class ReceiptTemplate:
+    """
+    قالب وصل محمّل مرة واحدة: كل وصل نسخة عميقة من عناصر القالب مع استبدال علامات ⟦حقل⟧،
+    بدل إعادة بناء المستند وخطوطه وجداوله لكل وصل.
+    """
+    PLACEHOLDER = "\u27e6{}\u27e7"
+    PATTERN = re.compile("\u27e6(\\w+)\u27e7")
+
+    def __init__(self, template_bytes):
+        import docx
+        self.document = docx.Document(io.BytesIO(template_bytes))
+        body = self.document.element.body
+        self.sect_pr = body.sectPr
+        self.elements = [child for child in body if child is not self.sect_pr]
+        for child in self.elements:
+            body.remove(child)
+
+    def fill(self, fields):
+        """Copies of the template's body elements with every placeholder replaced."""
+        from docx.oxml.ns import qn
+        elements = [copy.deepcopy(element) for element in self.elements]
+        for element in elements:
+            for text in element.iter(qn('w:t')):
+                if text.text and "\u27e6" in text.text:
+                    text.text = self.PATTERN.sub(lambda m: fields[m.group(1)], text.text)
+        return elements
+
+    def page_break(self):
+        from docx.oxml import parse_xml
+        from docx.oxml.ns import nsdecls
+        return parse_xml(f'<w:p {nsdecls("w")}><w:r><w:br w:type="page"/></w:r></w:p>')
+
+    def save(self, fields, filepath):
+        body = self.document.element.body
+        for child in [child for child in body if child is not self.sect_pr]:
+            body.remove(child)
+        for element in self.fill(fields):
+            self.sect_pr.addprevious(element)
+        self.document.save(filepath)
+
+
+_worker_receipt_template = None  # the ReceiptTemplate or PdfReceiptRenderer of a receipt worker process
+
+
+def _init_receipt_worker(file_format, template):
+    global _worker_receipt_template
+    _worker_receipt_template = PdfReceiptRenderer(template) if file_format == "pdf" else ReceiptTemplate(template)
+
+
+def _render_receipt_chunk(jobs, merged, template=None):
+    """
+    Runs in a worker process (or inline for small batches).
+    merged: jobs are field dicts and the result is the XML of their page-separated Word receipts;
+    otherwise jobs are (fields, filepath) pairs and each receipt is saved to its own file.
+    """
+    template = template or _worker_receipt_template
+    if merged:
+        from lxml import etree
+        xml = []
+        for fields in jobs:
+            xml.extend(etree.tostring(element) for element in template.fill(fields) + [template.page_break()])
+        return xml
+    for fields, filepath in jobs:
+        template.save(fields, filepath)
+    return len(jobs)
+
+
+class PdfReceiptRenderer:
+    """
+    يرسم الوصل مباشرة بصيغة PDF من نفس تخطيط WordReceiptGenerator دون المرور بمعالج نصوص:
+    النصوص العربية تُشكَّل عبر format_arabic وخط Amiri يُضمَّن في الملف.
+    تُبنى الصفحة مرة واحدة بعلامات ⟦حقل⟧، ثم تتغير نصوص الحقول فقط لكل وصل.
+    """
+    PAGE_SIZE = (21.0 / 2.54, 29.7 / 2.54)  # A4, inches
+    MARGIN = 1.5 * 72 / 2.54  # points, as in the Word receipt
+    LINE_SPACING = 1.5
+    SPACE = 14  # points
+
+    def __init__(self, settings):
+        from matplotlib.lines import Line2D
+        figure = mpl_figure.Figure(figsize=self.PAGE_SIZE, facecolor="white")
+        self.figure, self.field_texts = figure, []  # (Text artist, text with placeholders)
+        width, height = self.PAGE_SIZE[0] * 72, self.PAGE_SIZE[1] * 72
+        left, right = self.MARGIN, width - self.MARGIN
+        placeholders = {name: ReceiptTemplate.PLACEHOLDER.format(name) for name in WordReceiptGenerator.FIELDS}
+
+        def add_text(x, y, align, text, size, bold):
+            artist = figure.text(x / width, y / height, format_arabic(text), ha=align, va="baseline", color="black",
+                                 fontproperties=FontManager.get_matplotlib_font_prop("Bold" if bold else "Regular", size))
+            if "\u27e6" in text:
+                self.field_texts.append((artist, text))
+
+        y = height - self.MARGIN
+        for block in WordReceiptGenerator.receipt_layout(placeholders, settings):
+            kind = block[0]
+            if kind == "text":
+                _, align, text, size, bold, _ = block
+                y -= size * self.LINE_SPACING
+                add_text({"right": right, "left": left, "center": (left + right) / 2}[align], y, align, text, size, bold)
+            elif kind == "columns":
+                cells = block[1]
+                y -= max(cell[2] for cell in cells) * self.LINE_SPACING
+                cell_width = (right - left) / len(cells)
+                for i, (align, text, size, bold) in enumerate(cells):  # first cell on the right
+                    cell_right = right - i * cell_width
+                    x = {"right": cell_right, "left": cell_right - cell_width, "center": cell_right - cell_width / 2}[align]
+                    add_text(x, y, align, text, size, bold)
+            elif kind == "space":
+                y -= self.SPACE
+            elif kind == "separator":
+                y -= self.SPACE
+                figure.add_artist(Line2D([left / width, right / width], [y / height] * 2, color="gray", linestyle="--", linewidth=0.8))
+
+    def render(self, fields):
+        for artist, text in self.field_texts:
+            artist.set_text(format_arabic(ReceiptTemplate.PATTERN.sub(lambda m: fields[m.group(1)], text)))
+
+    @staticmethod
+    def _pdf_options():
+        import matplotlib
+        # Type 3 embeds the used glyph outlines directly; Type 42 subsets the whole TTF through fontTools on every save (~1 s)
+        return matplotlib.rc_context({"pdf.fonttype": 3})
+
+    def save(self, fields, filepath):
+        self.render(fields)
+        with self._pdf_options():
+            self.figure.savefig(filepath, format="pdf", facecolor="white")
+        return filepath
+
+    def save_many(self, fields_list, filepath):
+        """One page per receipt in a single PDF."""
+        from matplotlib.backends.backend_pdf import PdfPages
+        with self._pdf_options(), PdfPages(filepath) as pages:
+            for fields in fields_list:
+                self.render(fields)
+                pages.savefig(self.figure, facecolor="white")
+        return filepath
+
+
+class BatchReceiptWriter:
+    """
+    ينشئ وصولات لعدة مداخيل دفعة واحدة (بعد الحملات مثلاً) بصيغة Word أو PDF: ملف لكل وصل في مجلد أو ملف واحد مدمج.
+    يُبنى القالب مرة واحدة، وتُوزع الوصولات على عمليات منفصلة عندما يكون عددها كبيراً.
+    """
+    CHUNK_SIZE = 25
+    MIN_PARALLEL = 60  # below this, starting the worker processes costs more than it saves
+
+    def __init__(self, settings, workers=None, file_format="docx"):
+        self.settings, self.file_format = settings, file_format
+        # What each worker builds its template from: the Word template itself, or the settings for the PDF page
+        self.template = settings if file_format == "pdf" else WordReceiptGenerator.template_bytes(settings)
+        self.workers = workers or min(4, os.cpu_count() or 1)
+
+    def filename(self, receipt_data):
+        return f"وصل_رقم_{receipt_data.get('id', 'N/A')}.{self.file_format}"
+
+    def _load_template(self):
+        return PdfReceiptRenderer(self.template) if self.file_format == "pdf" else ReceiptTemplate(self.template)
+
+    def write_folder(self, rows, folder):
+        """One .docx per row in folder; returns the file paths."""
+        os.makedirs(folder, exist_ok=True)
+        jobs = [(WordReceiptGenerator.receipt_fields(row), os.path.join(folder, self.filename(row))) for row in rows]
+        self._map(jobs, merged=False)
+        return [filepath for _, filepath in jobs]
+
+    def write_merged(self, rows, filepath):
+        """Every row's receipt in one file, one page each; returns filepath."""
+        folder = os.path.dirname(filepath)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if self.file_format == "pdf":
+            # PDF pages cannot be joined without another library, so a merged PDF is drawn in this process
+            return self._load_template().save_many([WordReceiptGenerator.receipt_fields(row) for row in rows], filepath)
+        from docx.oxml import parse_xml
+        template = ReceiptTemplate(self.template)
+        xml = [element for chunk in self._map([WordReceiptGenerator.receipt_fields(row) for row in rows], merged=True) for element in chunk]
+        for element in xml[:-1]:  # no page break after the last receipt
+            template.sect_pr.addprevious(parse_xml(element))
+        template.document.save(filepath)
+        return filepath
+
+    def _map(self, jobs, merged):
+        chunks = [jobs[i:i + self.CHUNK_SIZE] for i in range(0, len(jobs), self.CHUNK_SIZE)]
+        if self.workers == 1 or len(jobs) < self.MIN_PARALLEL:
+            template = self._load_template()
+            return [_render_receipt_chunk(chunk, merged, template) for chunk in chunks]
+        # spawn on every platform: forking the Tk process is unsafe, and spawn matches Windows builds
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(chunks)), mp_context=context,
+                                 initializer=_init_receipt_worker, initargs=(self.file_format, self.template)) as pool:
+            return list(pool.map(_render_receipt_chunk, chunks, [merged] * len(chunks)))
+
+
+class ExcelReportWriter:
+    """
+    يكتب التقرير المالي إلى ملف Excel بطريقة التدفق (write-only) مع أنماط مسماة.
+    تبقى المبالغ أرقاماً بتنسيق عرض، ويحسب عرض الأعمدة مرة واحدة من الـ DataFrame.
+    """
+    AMOUNT_COLUMN = "المبلغ"
+    AMOUNT_FORMAT = '#,##0.00 "د.ج"'
+
+    def __init__(self, report_period):
+        from openpyxl import Workbook
+        self.report_period = report_period
+        self.workbook = Workbook(write_only=True)
+        self._register_styles()
+
+    def _register_styles(self):
+        from openpyxl.styles import PatternFill, Font as OpenpyxlFont, Border, Side, Alignment, NamedStyle
+        thin = Side(style='thin')
+        thin_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
+        right_align = Alignment(horizontal='right', vertical='center')
+        styles = [
+            NamedStyle(name="report_title", font=OpenpyxlFont(name='Calibri', size=18, bold=True, color='FFFFFF'), fill=PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid"), alignment=center_align),
+            NamedStyle(name="report_header", font=OpenpyxlFont(name='Calibri', size=12, bold=True, color='FFFFFF'), fill=PatternFill(start_color="808080", end_color="808080", fill_type="solid"), border=thin_border, alignment=center_align),
+            NamedStyle(name="report_cell", font=OpenpyxlFont(name='Calibri', size=11), border=thin_border, alignment=right_align),
+            NamedStyle(name="report_amount", font=OpenpyxlFont(name='Calibri', size=11), border=thin_border, alignment=right_align, number_format=self.AMOUNT_FORMAT),
+            NamedStyle(name="report_label", font=OpenpyxlFont(name='Calibri', size=12, bold=True), border=thin_border, alignment=right_align),
+            NamedStyle(name="report_border", border=thin_border),
+        ]
+        for name, color in (("report_value_green", '00B050'), ("report_value_red", 'C00000'), ("report_value_blue", '0070C0')):
+            styles.append(NamedStyle(name=name, font=OpenpyxlFont(name='Calibri', size=12, bold=True, color=color), border=thin_border, alignment=center_align, number_format=self.AMOUNT_FORMAT))
+        for style in styles:
+            self.workbook.add_named_style(style)
+
+    def _cell(self, ws, value, style):
+        from openpyxl.cell import WriteOnlyCell
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    def _row_factory(self, ws, styles):
+        # Resolving a named style per cell dominates the write time, so resolve each
+        # column's style once and share the resulting style array across its cells.
+        from openpyxl.cell import WriteOnlyCell
+        style_arrays = [self._cell(ws, None, style)._style for style in styles]
+        def make_row(values):
+            row = []
+            for value, style_array in zip(values, style_arrays):
+                cell = WriteOnlyCell(ws, value=value)
+                cell._style = style_array
+                row.append(cell)
+            return row
+        return make_row
+
+    def _write_summary(self, total_income, total_expense):
+        ws = self.workbook.create_sheet(title="ملخص مالي")
+        ws.sheet_view.rightToLeft = True
+        ws.column_dimensions['C'].width = 15; ws.column_dimensions['D'].width = 15; ws.column_dimensions['E'].width = 25
+        ws.merged_cells.add('B2:E2')
+        ws.row_dimensions[2].height = 25
+        ws.append([])
+        ws.append([None, self._cell(ws, f"التقرير المالي {self.report_period}", "report_title")])
+        ws.append([]); ws.append([])
+        summary_rows = [("إجمالي المداخيل", total_income, "report_value_green"), ("إجمالي المصروفات", total_expense, "report_value_red"), ("الرصيد الصافي", total_income - total_expense, "report_value_blue")]
+        for row_num, (label, value, value_style) in enumerate(summary_rows, start=5):
+            ws.merged_cells.add(f'C{row_num}:D{row_num}')
+            ws.append([None, None, self._cell(ws, value, value_style), self._cell(ws, None, "report_border"), self._cell(ws, label, "report_label")])
+
+    @classmethod
+    def column_widths(cls, df):
+        widths = []
+        for col in df.columns:
+            if df.empty:
+                max_length = len(str(col))
+            elif col == cls.AMOUNT_COLUMN:
+                max_length = max(len(str(col)), len(f"{df[col].abs().max():,.2f} د.ج") + 1)
+            else:
+                max_length = max(len(str(col)), int(df[col].astype(str).str.len().max()))
+            widths.append(max((max_length + 2) * 1.2, 12))
+        return widths
+
+    def _write_table(self, sheet_name, title_text, df):
+        from openpyxl.utils import get_column_letter
+        ws = self.workbook.create_sheet(title=sheet_name)
+        ws.sheet_view.rightToLeft = True
+        for c_idx, width in enumerate(self.column_widths(df), 1):
+            ws.column_dimensions[get_column_letter(c_idx)].width = width
+        ws.merged_cells.add(f"A1:{get_column_letter(max(df.shape[1], 1))}1")
+        ws.row_dimensions[1].height = 22
+        ws.append([self._cell(ws, f"{title_text} {self.report_period}", "report_title")])
+        ws.append([])
+        ws.append([self._cell(ws, col_name, "report_header") for col_name in df.columns])
+        make_row = self._row_factory(ws, ["report_amount" if col == self.AMOUNT_COLUMN else "report_cell" for col in df.columns])
+        for values in df.itertuples(index=False, name=None):
+            ws.append(make_row(values))
+
+    def save(self, filepath, total_income, total_expense, sheets):
+        self._write_summary(total_income, total_expense)
+        for sheet_name, title_text, df in sheets:
+            self._write_table(sheet_name, title_text, df)
+        self.workbook.save(filepath)
+
+
 class MemberDialog(ctk.CTkToplevel):
     def __init__(self, parent, title, initial_data=None):
         super().__init__(parent)
@@ -2309,8 +4374,9 @@ class MemberManagementFrame(BaseDataFrame):
     def add_member(self):
         data = MemberDialog(self, title="إضافة عضو جديد").get_data()
         if data:
-            self.db.add_member(data)
-            self.db.log_action(self.controller.current_user, "إضافة عضو", f"اسم العضو: {data['full_name']}")
+            with self.db.transaction():
+                self.db.add_member(data)
+                self.db.log_action(self.controller.current_user, "إضافة عضو", f"اسم العضو: {data['full_name']}")
             self.populate_table()
 
     def edit_member(self):
@@ -2324,8 +4390,9 @@ class MemberManagementFrame(BaseDataFrame):
 
         data = MemberDialog(self, title="تعديل بيانات عضو", initial_data=dict(member_data)).get_data()
         if data:
-            self.db.update_member(member_id, data)
-            self.db.log_action(self.controller.current_user, "تعديل عضو", f"معرّف العضو: {member_id}")
+            with self.db.transaction():
+                self.db.update_member(member_id, data)
+                self.db.log_action(self.controller.current_user, "تعديل عضو", f"معرّف العضو: {member_id}")
             self.populate_table()
 
     def delete_member(self):
@@ -2339,8 +4406,9 @@ class MemberManagementFrame(BaseDataFrame):
         member_name = values[-2]
 
         if messagebox.askyesno("تأكيد الحذف", f"هل أنت متأكد من حذف العضو '{member_name}'؟", icon='warning', parent=self):
-            self.db.delete_member(member_id)
-            self.db.log_action(self.controller.current_user, "حذف عضو", f"معرّف العضو: {member_id}")
+            with self.db.transaction():
+                self.db.delete_member(member_id)
+                self.db.log_action(self.controller.current_user, "حذف عضو", f"معرّف العضو: {member_id}")
             self.populate_table()
 
 class ActivityDialog(ctk.CTkToplevel):
@@ -2453,8 +4521,9 @@ class AttendanceDialog(ctk.CTkToplevel):
 
     def save_attendance(self):
         present_ids = [member_id for member_id, var in self.member_vars.items() if var.get() == "on"]
-        self.controller.db.update_attendance(self.activity_id, present_ids)
-        self.controller.db.log_action(self.controller.current_user, "تحديث الحضور", f"معرف النشاط: {self.activity_id}")
+        with self.controller.db.transaction():
+            self.controller.db.update_attendance(self.activity_id, present_ids)
+            self.controller.db.log_action(self.controller.current_user, "تحديث الحضور", f"معرف النشاط: {self.activity_id}")
         messagebox.showinfo("نجاح", "تم تحديث قائمة الحضور بنجاح.", parent=self)
         self.destroy()
 
@@ -2494,8 +4563,9 @@ class ActivityManagementFrame(BaseDataFrame):
     def add_activity(self):
         data = ActivityDialog(self, title="إضافة نشاط جديد").get_data()
         if data:
-            self.db.add_activity(data)
-            self.db.log_action(self.controller.current_user, "إضافة نشاط", f"اسم النشاط: {data['name']}")
+            with self.db.transaction():
+                self.db.add_activity(data)
+                self.db.log_action(self.controller.current_user, "إضافة نشاط", f"اسم النشاط: {data['name']}")
             self.populate_table()
 
     def edit_activity(self):
@@ -2509,8 +4579,9 @@ class ActivityManagementFrame(BaseDataFrame):
 
         data = ActivityDialog(self, title="تعديل بيانات نشاط", initial_data=dict(activity_data)).get_data()
         if data:
-            self.db.update_activity(activity_id, data)
-            self.db.log_action(self.controller.current_user, "تعديل نشاط", f"معرّف النشاط: {activity_id}")
+            with self.db.transaction():
+                self.db.update_activity(activity_id, data)
+                self.db.log_action(self.controller.current_user, "تعديل نشاط", f"معرّف النشاط: {activity_id}")
             self.populate_table()
 
     def delete_activity(self):
@@ -2524,8 +4595,9 @@ class ActivityManagementFrame(BaseDataFrame):
         activity_name = values[-2]
 
         if messagebox.askyesno("تأكيد الحذف", f"هل أنت متأكد من حذف النشاط '{activity_name}'؟\nسيتم حذف سجلات الحضور المرتبطة به.", icon='warning', parent=self):
-            self.db.delete_activity(activity_id)
-            self.db.log_action(self.controller.current_user, "حذف نشاط", f"معرّف النشاط: {activity_id}")
+            with self.db.transaction():
+                self.db.delete_activity(activity_id)
+                self.db.log_action(self.controller.current_user, "حذف نشاط", f"معرّف النشاط: {activity_id}")
             self.populate_table()
 
     def manage_attendance(self):
@@ -2543,12 +4615,8 @@ class ActivityManagementFrame(BaseDataFrame):
 # نقطة انطلاق البرنامج
 # =================================================================
 if __name__ == "__main__":
-    try:
-        matplotlib.use("TkAgg")
-    except ImportError:
-        print("Matplotlib is not installed. Charts will not be available.")
-
-    font_error = FontManager.check_and_register_fonts()
+    multiprocessing.freeze_support()  # batch receipts use worker processes, also in frozen builds
+    font_error = FontManager.check_fonts()
     if font_error:
         root = ctk.CTk()
         root.withdraw()